@@ -0,0 +1,116 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from . import metrics
+from .llm import LLMClient
+from .ratelimit import estimate_tokens
+
+
+@dataclass
+class _Pending:
+    code: str
+    tokens: int
+    deadline: Optional[float]
+    alone: bool = False  # Nothing else arrived within max_delay: send it as a plain call.
+    future: "asyncio.Future[Optional[str]]" = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+class MicroBatcher:
+    """
+    Coalesces small generation requests into shared LLM calls.
+
+    Snippets of at most snippet_tokens (estimated) wait up to max_delay
+    seconds for company; a group is sent as soon as it reaches max_size
+    snippets or max_tokens, one LLMClient.generate_batch call per group.
+    Interactive and batch-lane requests are grouped separately so batch work
+    keeps its lower priority. A snippet the reply did not cover (missing or
+    mangled section) falls back to its own generate_from_code call, as does
+    every snippet of a failed group call.
+    """
+
+    def __init__(
+        self,
+        client: LLMClient,
+        max_size: int = 8,
+        max_tokens: int = 3000,
+        max_delay: float = 0.05,
+        snippet_tokens: int = 400,
+    ):
+        self.client = client
+        self.max_size = max_size
+        self.max_tokens = max_tokens
+        self.max_delay = max_delay
+        self.snippet_tokens = snippet_tokens
+        self._pending: Dict[bool, List[_Pending]] = {False: [], True: []}
+        self._timers: Dict[bool, asyncio.TimerHandle] = {}
+        self._calls: Set[asyncio.Task] = set()
+
+    def accepts(self, code: str) -> bool:
+        return self.max_size > 1 and estimate_tokens(code) <= self.snippet_tokens
+
+    async def generate(
+        self,
+        code: str,
+        deadline: Optional[float] = None,
+        batch: bool = False,
+        on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
+        abort_malformed: bool = False,
+    ) -> str:
+        """
+        Mermaid for one snippet, generated together with whatever else is pending.
+        on_partial/abort_malformed only apply to a fallback single call (batched
+        replies are not streamed per snippet).
+        """
+        item = _Pending(code, estimate_tokens(code), deadline)
+        group = self._pending[batch]
+        if group and sum(other.tokens for other in group) + item.tokens > self.max_tokens:
+            self._flush(batch)
+            group = self._pending[batch]
+        group.append(item)
+        if len(group) >= self.max_size:
+            self._flush(batch)
+        elif batch not in self._timers:
+            self._timers[batch] = asyncio.get_running_loop().call_later(self.max_delay, self._flush, batch)
+        mermaid = await item.future  # Cancelling the job drops the snippet if not yet sent.
+        if mermaid is None:
+            metrics.llm_batched.inc(outcome="single" if item.alone else "fallback")
+            return await self.client.generate_from_code(
+                code, deadline=deadline, batch=batch, on_partial=on_partial, abort_malformed=abort_malformed
+            )
+        metrics.llm_batched.inc(outcome="batched")
+        return mermaid
+
+    def _flush(self, batch: bool):
+        timer = self._timers.pop(batch, None)
+        if timer:
+            timer.cancel()
+        items = [item for item in self._pending[batch] if not item.future.done()]
+        self._pending[batch] = []
+        if not items:
+            return
+        if len(items) == 1:
+            items[0].alone = True
+            items[0].future.set_result(None)
+            return
+        task = asyncio.create_task(self._call(items, batch))
+        self._calls.add(task)
+        task.add_done_callback(self._calls.discard)
+
+    async def _call(self, items: List[_Pending], batch: bool):
+        deadlines = [item.deadline for item in items if item.deadline is not None]
+        try:
+            results = await self.client.generate_batch(
+                [item.code for item in items], deadline=min(deadlines) if deadlines else None, batch=batch
+            )
+        except asyncio.CancelledError:
+            for item in items:
+                item.future.cancel()
+            raise
+        except Exception as exc:
+            print(f"[LLM] Batched call for {len(items)} snippets failed ({exc}); retrying singly")
+            results = [None] * len(items)
+        metrics.llm_batch_size.observe(len(items))
+        for item, mermaid in zip(items, results):
+            if not item.future.done():
+                item.future.set_result(mermaid)
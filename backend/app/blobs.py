@@ -0,0 +1,66 @@
+import json
+import os
+import zlib
+from dataclasses import replace
+from typing import Optional
+
+from .models import JobState
+
+
+class BlobStore:
+    """
+    Compressed on-disk home for the large strings of finished jobs.
+    write() copies `code` and every function's `mermaid` into
+    <directory>/<job id>.json.z (blocking; run via asyncio.to_thread), then
+    strip() blanks them on the live JobState and marks it offloaded (on the
+    event loop). load() returns a hydrated copy for detail views, leaving the
+    resident object small.
+    """
+
+    def __init__(self, directory: str, min_bytes: int = 4096, level: int = 6):
+        self.directory = directory
+        self.min_bytes = min_bytes
+        self.level = level
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json.z")
+
+    def should_offload(self, job: JobState) -> bool:
+        size = len(job.code) + sum(len(func.mermaid) for func in job.functions)
+        return not job.offloaded and size >= self.min_bytes
+
+    def write(self, job: JobState):
+        payload = {"code": job.code, "mermaid": [func.mermaid for func in job.functions]}
+        data = zlib.compress(json.dumps(payload).encode(), self.level)
+        tmp = self._path(job.id) + ".tmp"
+        with open(tmp, "wb") as handle:
+            handle.write(data)
+        os.replace(tmp, self._path(job.id))
+
+    @staticmethod
+    def strip(job: JobState):
+        job.code = ""
+        for func in job.functions:
+            func.mermaid = ""
+        job.offloaded = True
+
+    def load(self, job: JobState) -> Optional[JobState]:
+        """Hydrated copy of an offloaded job, or None if its blob is missing."""
+        try:
+            with open(self._path(job.id), "rb") as handle:
+                payload = json.loads(zlib.decompress(handle.read()))
+        except FileNotFoundError:
+            return None
+        mermaid = payload.get("mermaid", [])
+        functions = [
+            replace(func, mermaid=mermaid[i] if i < len(mermaid) else func.mermaid)
+            for i, func in enumerate(job.functions)
+        ]
+        return replace(job, code=payload.get("code", ""), functions=functions, offloaded=False)
+
+    def delete(self, job_id: str):
+        try:
+            os.remove(self._path(job_id))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .llm import PROMPT_VERSION
+
+_COMMENT_OR_LITERAL = re.compile(
+    r'//[^\n]*|/\*[\s\S]*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\''
+)
+_TOKEN = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|\w+|\S')
+_OPERATOR_CHARS = set("-+*/%<>=&|!^.#:")
+
+
+def _needs_space(prev: str, token: str) -> bool:
+    """Whitespace matters only where dropping it would fuse two tokens (int x, a - -b)."""
+    left, right = prev[-1], token[0]
+    if (left.isalnum() or left == "_") and (right.isalnum() or right == "_"):
+        return True
+    return left in _OPERATOR_CHARS and right in _OPERATOR_CHARS
+
+
+def normalize_c_source(code: str) -> str:
+    """
+    Canonical form of C source for cache keys.
+    Drops comments and insignificant whitespace; string/char literals are kept verbatim.
+    Preprocessor directives stay on their own line since newlines end them.
+    """
+    def _strip(match: "re.Match[str]") -> str:
+        token = match.group(0)
+        return " " if token.startswith("/") else token
+
+    stripped = _COMMENT_OR_LITERAL.sub(_strip, code)
+    parts: List[str] = []
+    prev = ""
+    for line in stripped.splitlines():
+        tokens = _TOKEN.findall(line)
+        if not tokens:
+            continue
+        directive = tokens[0] == "#"
+        if directive and parts and parts[-1] != "\n":
+            parts.append("\n")
+            prev = ""
+        for token in tokens:
+            if prev and _needs_space(prev, token):
+                parts.append(" ")
+            parts.append(token)
+            prev = token
+        if directive:
+            parts.append("\n")
+            prev = ""
+    return "".join(parts).strip()
+
+
+def cache_key(code: str) -> str:
+    """Content address for a submission: normalized source plus prompt version."""
+    digest = hashlib.sha256()
+    digest.update(PROMPT_VERSION.encode())
+    digest.update(b"\0")
+    digest.update(normalize_c_source(code).encode())
+    return digest.hexdigest()
+
+
+@dataclass
+class CachedFlowchart:
+    """Outcome of generation + validation for one piece of code."""
+    mermaid: str
+    validated: bool
+    error: Optional[str] = None
+
+
+class FlowchartCache:
+    """
+    Two-tier flowchart cache with in-flight request coalescing.
+    - Memory tier: LRU bounded by max_entries, entries expire after ttl_seconds.
+    - Disk tier: optional SQLite file shared across restarts (db_path).
+    Only validated results are stored so a bad generation can be retried.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 86400, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, CachedFlowchart]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS flowchart_cache ("
+                " key TEXT PRIMARY KEY, mermaid TEXT NOT NULL, validated INTEGER NOT NULL,"
+                " error TEXT, stored_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - stored_at > self.ttl_seconds
+
+    def _remember(self, key: str, stored_at: float, value: CachedFlowchart):
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _db_get(self, key: str) -> Optional[Tuple[float, CachedFlowchart]]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT mermaid, validated, error, stored_at FROM flowchart_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row and self._expired(row[3]):
+                self._db.execute("DELETE FROM flowchart_cache WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+        if not row:
+            return None
+        return row[3], CachedFlowchart(mermaid=row[0], validated=bool(row[1]), error=row[2])
+
+    def _db_put(self, key: str, stored_at: float, value: CachedFlowchart):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO flowchart_cache (key, mermaid, validated, error, stored_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, value.mermaid, int(value.validated), value.error, stored_at),
+            )
+            self._db.commit()
+
+    async def get(self, key: str) -> Optional[CachedFlowchart]:
+        """Look up memory tier first, then disk tier (promoting hits into memory)."""
+        entry = self._entries.get(key)
+        if entry:
+            if not self._expired(entry[0]):
+                self._entries.move_to_end(key)
+                return entry[1]
+            self._entries.pop(key, None)
+        if self._db is None:
+            return None
+        entry = await asyncio.to_thread(self._db_get, key)
+        if not entry:
+            return None
+        self._remember(key, *entry)
+        return entry[1]
+
+    async def put(self, key: str, value: CachedFlowchart):
+        """Store a result; invalid diagrams are skipped so they get regenerated."""
+        if not value.validated:
+            return
+        stored_at = time.time()
+        self._remember(key, stored_at, value)
+        if self._db is not None:
+            await asyncio.to_thread(self._db_put, key, stored_at, value)
+
+    async def get_or_compute(
+        self, key: str, compute: Callable[[], Awaitable[CachedFlowchart]]
+    ) -> Tuple[CachedFlowchart, bool]:
+        """
+        Return (result, from_cache).
+        Concurrent callers for the same key share a single compute() call.
+        If the caller that owns the computation is cancelled, a waiter takes over.
+        """
+        while True:
+            cached = await self.get(key)
+            if cached:
+                self.hits += 1
+                return cached, True
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            try:
+                value = await asyncio.shield(pending)
+                self.hits += 1
+                return value, True
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            future.exception()  # Mark retrieved when nobody was waiting.
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        future.set_result(value)
+        await self.put(key, value)
+        return value, False
+
+
+flowchart_cache = FlowchartCache(
+    max_entries=int(os.getenv("FLOWCHART_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("FLOWCHART_CACHE_TTL", "86400")),
+    db_path=os.getenv("FLOWCHART_CACHE_DB") or None,
+)
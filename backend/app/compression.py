@@ -0,0 +1,87 @@
+import gzip
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli  # Optional: without it responses are gzip-only.
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Bodies that are already compressed (png) or streamed (SSE) are passed through.
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "image/svg+xml")
+
+
+def pick_encoding(accept_encoding: str) -> str:
+    """Best content-coding we can produce for an Accept-Encoding header ("" = identity)."""
+    accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return ""
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+class CompressionMiddleware:
+    """
+    brotli/gzip for whole-body responses of at least `minimum_size` bytes.
+    Unlike Starlette's GZipMiddleware, streaming responses are never buffered
+    (SSE must reach the client event by event), and responses that already
+    carry Content-Encoding (precompressed SVGs, cached job bodies) are left alone.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = pick_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            if start is not None:
+                initial, start = start, None
+                headers = MutableHeaders(raw=initial["headers"])
+                body = message.get("body", b"")
+                if (
+                    message.get("more_body", False)
+                    or "content-encoding" in headers
+                    or len(body) < self.minimum_size
+                    or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                ):
+                    passthrough = True
+                    await send(initial)
+                    await send(message)
+                    return
+                body = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                await send(initial)
+                await send({**message, "body": body})
+                return
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
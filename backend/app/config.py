@@ -0,0 +1,87 @@
+import os
+import tempfile
+from dataclasses import dataclass, fields
+from typing import Tuple
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Pipeline settings, one per environment variable of the same name in upper
+    case (documented in .env.example). Read once at import; stores, queues and
+    the LLM client read their own variables where they are built.
+    """
+    # Process roles and pool sizing.
+    queue_backend: str = "memory"  # memory | sqlite | redis
+    run_workers: bool = True
+    worker_concurrency: int = 4
+    llm_concurrency: int = 4
+    mmdc_concurrency: int = 2
+    function_concurrency: int = 4  # Per job.
+    shutdown_drain_timeout: float = 10
+    queue_max_attempts: int = 3
+    queue_cancel_check_interval: float = 2
+    change_feed_interval: float = 0.5
+    job_timeout: float = 300
+
+    # Admission and queueing.
+    client_jobs_per_minute: float = 30  # 0 disables.
+    client_jobs_burst: int = 10
+    batch_interactive_weight: int = 4
+    job_priority_small_bytes: int = 2048
+    job_priority_large_bytes: int = 32768
+    job_priority_aging: float = 30
+    idempotency_key_ttl: float = 86400
+    max_batch_files: int = 5000
+    max_batch_bytes: int = 50 * 1024 * 1024
+    batch_extensions: Tuple[str, ...] = (".c",)
+
+    # LLM calls.
+    llm_tokens_per_minute: int = 60000  # 0 disables.
+    llm_microbatch_max_size: int = 1  # <= 1 disables.
+    llm_microbatch_max_tokens: int = 3000
+    llm_microbatch_delay: float = 0.05
+    llm_microbatch_snippet_tokens: int = 400
+    llm_preprocess: bool = True
+    llm_preprocess_max_initializer: int = 200
+    flowgen_max_complexity: int = 5
+    repair_attempts: int = 2
+    repair_max_per_job: int = 4
+
+    # Validation, rendering and responses.
+    mermaid_validator: str = "local"  # local | mmdc | both
+    mmdc_timeout: float = 30
+    diagram_max_nodes: int = 80  # 0 disables.
+    render_cache_dir: str = os.path.join(tempfile.gettempdir(), "h2loop-renders")
+    render_cache_max_files: int = 5000
+    render_max_age: int = 86400
+    response_cache_jobs: int = 2000
+    response_cache_bytes: int = 64 * 1024 * 1024
+    compress_min_bytes: int = 1024
+    partial_update_interval: float = 0.25
+    ready_max_queue_depth: int = 1000
+    ready_max_queue_wait: float = 300
+
+    # Retention and offloading.
+    retention_interval: float = 60
+    job_blob_dir: str = ""
+    job_blob_min_bytes: int = 4096
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """Defaults overridden by set, non-empty variables; flags are on only for "1"."""
+        values = {}
+        for field in fields(cls):
+            raw = os.getenv(field.name.upper())
+            if not raw:
+                continue
+            if field.type is bool:
+                values[field.name] = raw == "1"
+            elif field.type == Tuple[str, ...]:
+                values[field.name] = tuple(raw.split(","))
+            else:
+                values[field.name] = field.type(raw)
+        return cls(**values)
+
+
+settings = Settings.from_env()
@@ -0,0 +1,191 @@
+import re
+from dataclasses import dataclass
+from typing import List, NamedTuple
+
+
+class Token(NamedTuple):
+    """Lexical token with its character span in the original source."""
+    kind: str
+    text: str
+    start: int
+    end: int
+
+
+@dataclass
+class CFunction:
+    """
+    A function definition found in a C translation unit.
+    - source: exact text from return type through the closing brace.
+    - start_line/end_line: 1-based line numbers in the submission.
+    """
+    name: str
+    source: str
+    start_line: int
+    end_line: int
+
+
+_TOKEN_SPEC = [
+    ("comment", r"//[^\n]*|/\*[\s\S]*?\*/"),
+    ("preprocessor", r"(?m:^[ \t]*#(?:\\\n|[^\n])*)"),
+    ("string", r'"(?:\\.|[^"\\\n])*"'),
+    ("char", r"'(?:\\.|[^'\\\n])*'"),
+    ("ident", r"[A-Za-z_]\w*"),
+    ("number", r"\.?\d(?:[eEpP][+-]|[\w.])*"),
+    ("space", r"\n|[^\S\n]+"),  # Stop at newlines so indented directives are seen.
+    ("punct", r"->|\+\+|--|<<=?|>>=?|[<>=!&|^+\-*/%]=|&&|\|\||\.\.\.|##|[^\s\w]"),
+]
+_TOKEN_RE = re.compile("|".join(f"(?P<{kind}>{pattern})" for kind, pattern in _TOKEN_SPEC))
+
+# Identifiers that can precede "( ... ) {" at file scope without being a function name.
+_NOT_FUNCTION_NAMES = {
+    "if", "for", "while", "switch", "return", "sizeof", "do", "else",
+    "__attribute__", "__declspec", "_Alignas", "alignas",
+}
+
+
+def tokenize(code: str) -> List[Token]:
+    """
+    Split C source into tokens, dropping whitespace, comments and preprocessor lines.
+    Unterminated literals degrade to single punctuation tokens rather than raising.
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(code):
+        kind = match.lastgroup
+        if kind in ("space", "comment", "preprocessor"):
+            continue
+        tokens.append(Token(kind, match.group(), match.start(), match.end()))
+    return tokens
+
+
+def _matching_open(tokens: List[Token], close_index: int) -> int:
+    """Index of the "(" matching the ")" at close_index, or -1."""
+    depth = 0
+    for i in range(close_index, -1, -1):
+        text = tokens[i].text
+        if text == ")":
+            depth += 1
+        elif text == "(":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def _matching_close(tokens: List[Token], open_index: int) -> int:
+    """Index of the "}" matching the "{" at open_index, or -1 if unbalanced."""
+    depth = 0
+    for i in range(open_index, len(tokens)):
+        text = tokens[i].text
+        if text == "{":
+            depth += 1
+        elif text == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def _function_name(tokens: List[Token], brace_index: int) -> int:
+    """
+    Index of the function name for a file-scope "{" at brace_index, or -1.
+    Handles trailing __attribute__((...)) between the parameter list and body,
+    and declarators returning function pointers: void (*name(int))(int) {.
+    """
+    i = brace_index - 1
+    while i >= 0 and tokens[i].text == ")":
+        open_index = _matching_open(tokens, i)
+        if open_index <= 0:
+            return -1
+        name = tokens[open_index - 1]
+        if name.kind == "ident" and name.text in ("__attribute__", "__declspec"):
+            i = open_index - 2
+            continue
+        if name.kind == "ident" and name.text not in _NOT_FUNCTION_NAMES:
+            return open_index - 1
+        if name.text == ")":
+            i = open_index - 2  # Step inside the parenthesized declarator.
+            continue
+        return -1
+    return -1
+
+
+def _kr_header(tokens: List[Token], start: int, end: int) -> int:
+    """
+    Index of the ")" closing a K&R identifier list, as in `int add(a, b) int a;`,
+    within the file-scope declaration tokens[start:end], or -1.
+    """
+    for i in range(start + 1, end):
+        after = tokens[i + 1]
+        if tokens[i].text != ")" or after.kind != "ident" or after.text in ("__attribute__", "__declspec"):
+            continue
+        open_index = _matching_open(tokens, i)
+        if open_index <= start or tokens[open_index - 1].kind != "ident":
+            continue
+        names = tokens[open_index + 1:i]
+        if names and all(
+            token.kind == "ident" if index % 2 == 0 else token.text == ","
+            for index, token in enumerate(names)
+        ):
+            return i
+    return -1
+
+
+def _declares_parameters(tokens: List[Token], header: int, brace_index: int) -> bool:
+    """Whether every name in the K&R list ending at `header` is declared before the body."""
+    declared = {token.text for token in tokens[header + 1:brace_index] if token.kind == "ident"}
+    names = tokens[_matching_open(tokens, header) + 1:header:2]
+    return all(token.text in declared for token in names)
+
+
+def split_functions(code: str) -> List[CFunction]:
+    """
+    Find file-scope function definitions in C source without a compiler.
+    Struct/enum bodies and brace initializers are skipped; prototypes are ignored.
+    Old-style (K&R) definitions keep their parameter declarations.
+    Returns functions in source order (empty list if none are found).
+    """
+    tokens = tokenize(code)
+    functions: List[CFunction] = []
+    decl_start = 0  # First token of the current file-scope declaration.
+    kr_start, kr_header = 0, -1  # Open K&R definition: its first token and list ")".
+    depth = 0
+    i = 0
+    while i < len(tokens):
+        text = tokens[i].text
+        if depth == 0 and text == ";":
+            if kr_header < 0:
+                kr_header = _kr_header(tokens, decl_start, i)
+                kr_start = decl_start
+            decl_start = i + 1
+        elif text == "{":
+            if depth == 0:
+                start_index = decl_start
+                name_index = -1
+                if kr_header >= 0 and _declares_parameters(tokens, kr_header, i):
+                    start_index = kr_start
+                    name_index = _function_name(tokens, kr_header + 1)
+                kr_header = -1
+                if name_index < 0:
+                    name_index = _function_name(tokens, i)
+                body_end = _matching_close(tokens, i)
+                if name_index >= 0 and body_end >= 0:
+                    start = tokens[start_index].start
+                    end = tokens[body_end].end
+                    functions.append(
+                        CFunction(
+                            name=tokens[name_index].text,
+                            source=code[start:end],
+                            start_line=code.count("\n", 0, start) + 1,
+                            end_line=code.count("\n", 0, end) + 1,
+                        )
+                    )
+                    i = body_end + 1
+                    decl_start = i
+                    continue
+            depth += 1
+        elif text == "}":
+            # Closing a struct/initializer does not end the declaration.
+            depth = max(depth - 1, 0)
+        i += 1
+    return functions
+
@@ -0,0 +1,359 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from .cparser import Token, tokenize
+
+
+class FlowgenError(ValueError):
+    """The code could not be parsed into statements (caller may fall back to the LLM)."""
+
+
+@dataclass
+class Stmt:
+    """
+    Statement node of a C function body.
+    kind: block, expr, if, while, do, for, switch, case, break, continue,
+    return, goto, label, empty. text holds the condition/expression/label.
+    """
+    kind: str
+    text: str = ""
+    body: List["Stmt"] = field(default_factory=list)
+    orelse: List["Stmt"] = field(default_factory=list)
+    init: str = ""
+    step: str = ""
+
+
+MAX_LABEL = 60
+MERGE_STATEMENTS = 4  # Consecutive plain statements folded into one box.
+_DECISION_KEYWORDS = {"if", "while", "for", "case", "&&", "||", "?"}
+
+
+class _Parser:
+    """Recursive descent over cparser tokens; builds Stmt trees, not full expressions."""
+
+    def __init__(self, code: str, tokens: List[Token]):
+        self.code = code
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset: int = 0) -> str:
+        index = self.pos + offset
+        return self.tokens[index].text if index < len(self.tokens) else ""
+
+    def expect(self, text: str):
+        if self.peek() != text:
+            found = self.peek() or "end of input"
+            raise FlowgenError(f"Expected '{text}', got '{found}'")
+        self.pos += 1
+
+    def span(self, start: int, end: int) -> str:
+        """Source text for tokens[start:end], whitespace collapsed."""
+        if start >= end:
+            return ""
+        text = self.code[self.tokens[start].start:self.tokens[end - 1].end]
+        return " ".join(text.split())
+
+    def until(self, stops: Tuple[str, ...]) -> str:
+        """Consume tokens up to (not including) a stop token at bracket depth 0."""
+        start, depth = self.pos, 0
+        while self.pos < len(self.tokens):
+            text = self.peek()
+            if depth == 0 and text in stops:
+                return self.span(start, self.pos)
+            if text in "([{":
+                depth += 1
+            elif text in ")]}":
+                depth -= 1
+                if depth < 0:
+                    break
+            self.pos += 1
+        raise FlowgenError(f"Expected one of {', '.join(stops)}")
+
+    def paren(self) -> str:
+        self.expect("(")
+        text = self.until((")",))
+        self.expect(")")
+        return text
+
+    def items(self, closer: Optional[str]) -> List[Stmt]:
+        stmts = []
+        while self.pos < len(self.tokens) and self.peek() != closer:
+            stmts.append(self.statement())
+        if closer is not None:
+            self.expect(closer)
+        return stmts
+
+    def statement(self) -> Stmt:
+        text = self.peek()
+        if text == "{":
+            self.pos += 1
+            return Stmt("block", body=self.items("}"))
+        if text == ";":
+            self.pos += 1
+            return Stmt("empty")
+        if text == "if":
+            self.pos += 1
+            cond = self.paren()
+            then = self.statement()
+            orelse = []
+            if self.peek() == "else":
+                self.pos += 1
+                orelse = [self.statement()]
+            return Stmt("if", cond, body=[then], orelse=orelse)
+        if text in ("while", "switch"):
+            self.pos += 1
+            cond = self.paren()
+            return Stmt(text, cond, body=[self.statement()])
+        if text == "do":
+            self.pos += 1
+            body = self.statement()
+            self.expect("while")
+            cond = self.paren()
+            self.expect(";")
+            return Stmt("do", cond, body=[body])
+        if text == "for":
+            self.pos += 1
+            self.expect("(")
+            init = self.until((";",))
+            self.expect(";")
+            cond = self.until((";",))
+            self.expect(";")
+            step = self.until((")",))
+            self.expect(")")
+            return Stmt("for", cond, body=[self.statement()], init=init, step=step)
+        if text == "case":
+            self.pos += 1
+            value = self.until((":",))
+            self.expect(":")
+            return Stmt("case", value)
+        if text == "default" and self.peek(1) == ":":
+            self.pos += 2
+            return Stmt("case", "")
+        if text in ("break", "continue"):
+            self.pos += 1
+            self.expect(";")
+            return Stmt(text)
+        if text == "return":
+            self.pos += 1
+            value = self.until((";",))
+            self.expect(";")
+            return Stmt("return", value)
+        if text == "goto":
+            self.pos += 1
+            target = self.until((";",))
+            self.expect(";")
+            return Stmt("goto", target)
+        if self.pos < len(self.tokens) and self.tokens[self.pos].kind == "ident" and self.peek(1) == ":":
+            self.pos += 2
+            return Stmt("label", text)
+        if text in ("else", "}", ")", ""):
+            raise FlowgenError(f"Unexpected '{text or 'end of input'}'")
+        value = self.until((";",))
+        self.expect(";")
+        return Stmt("expr", value)
+
+
+def parse_body(code: str) -> Tuple[str, List[Stmt]]:
+    """
+    Parse a function definition (or a bare statement list) into (name, statements).
+    The body is the last top-level brace block; name is the identifier before "(".
+    """
+    tokens = tokenize(code)
+    if not tokens:
+        raise FlowgenError("No code")
+    if tokens[-1].text != "}":
+        return "", _Parser(code, tokens).items(None)
+    depth = 0
+    for open_index in range(len(tokens) - 1, -1, -1):
+        text = tokens[open_index].text
+        if text == "}":
+            depth += 1
+        elif text == "{":
+            depth -= 1
+            if depth == 0:
+                break
+    else:
+        raise FlowgenError("Unbalanced braces")
+    header = tokens[:open_index]
+    name = ""
+    for i in range(len(header) - 1):
+        if header[i].kind == "ident" and header[i + 1].text == "(":
+            name = header[i].text
+            break
+    if not name:
+        # Not a function definition: parse everything as statements.
+        return "", _Parser(code, tokens).items(None)
+    parser = _Parser(code, tokens)
+    parser.pos = open_index + 1
+    return name, parser.items("}")
+
+
+def complexity(code: str) -> int:
+    """Cyclomatic complexity estimate: 1 + decision points (if/loops/case/&&/||/?:)."""
+    return 1 + sum(1 for token in tokenize(code) if token.text in _DECISION_KEYWORDS)
+
+
+def _label(text: str) -> str:
+    """Quoted Mermaid label; entities keep quotes/angles out of the grammar. Lines become <br/>."""
+    lines = []
+    for line in text.split("\n"):
+        if len(line) > MAX_LABEL:
+            line = line[:MAX_LABEL - 3].rstrip() + "..."
+        line = line.replace("#", "#35;").replace("&", "#amp;").replace('"', "#quot;")
+        lines.append(line.replace("<", "#lt;").replace(">", "#gt;"))
+    return '"' + "<br/>".join(lines) + '"'
+
+
+def _edge_label(text: str) -> str:
+    """Link text between pipes: no quotes or pipes, kept short."""
+    text = re.sub(r'["|]', "", text).strip()
+    return text[:30] or "case"
+
+
+Exit = Tuple[str, Optional[str]]  # (node id, edge label) waiting for a successor.
+
+
+class _Builder:
+    """Emits a Mermaid flowchart by threading dangling exits through statements."""
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self.count = 0
+        self.labels: Dict[str, str] = {}
+        self.breaks: List[List[Exit]] = []
+        self.continues: List[str] = []
+        self.end_id = "End"
+
+    def node(self, label: str, shape: str = "[") -> str:
+        self.count += 1
+        node_id = f"N{self.count}"
+        closer = {"[": "]", "{": "}", "([": "])", "[/": "/]", "((": "))"}[shape]
+        self.lines.append(f"    {node_id}{shape}{_label(label)}{closer}")
+        return node_id
+
+    def link(self, exits: List[Exit], target: str):
+        for source, label in exits:
+            arrow = f"-->|{_edge_label(label)}|" if label else "-->"
+            self.lines.append(f"    {source} {arrow} {target}")
+
+    def label_node(self, name: str) -> str:
+        if name not in self.labels:
+            self.labels[name] = self.node(f"{name}:", "([")
+        return self.labels[name]
+
+    def sequence(self, stmts: List[Stmt], exits: List[Exit]) -> List[Exit]:
+        i = 0
+        while i < len(stmts):
+            stmt = stmts[i]
+            if stmt.kind == "expr":
+                run = [stmt.text]
+                while (
+                    len(run) < MERGE_STATEMENTS and i + 1 < len(stmts) and stmts[i + 1].kind == "expr"
+                ):
+                    i += 1
+                    run.append(stmts[i].text)
+                node_id = self.node("\n".join(run))
+                self.link(exits, node_id)
+                exits = [(node_id, None)]
+            else:
+                exits = self.statement(stmt, exits)
+            i += 1
+        return exits
+
+    def statement(self, stmt: Stmt, exits: List[Exit]) -> List[Exit]:
+        kind = stmt.kind
+        if kind == "block":
+            return self.sequence(stmt.body, exits)
+        if kind in ("empty", "case"):
+            return exits
+        if kind == "expr":
+            return self.sequence([stmt], exits)
+        if kind == "if":
+            cond = self.node(f"{stmt.text}?", "{")
+            self.link(exits, cond)
+            then_exits = self.sequence(stmt.body, [(cond, "yes")])
+            else_exits = self.sequence(stmt.orelse, [(cond, "no")])
+            return then_exits + else_exits
+        if kind in ("while", "for"):
+            if kind == "for" and stmt.init:
+                init = self.node(stmt.init)
+                self.link(exits, init)
+                exits = [(init, None)]
+            cond = self.node(f"{stmt.text or 'forever'}?", "{")
+            self.link(exits, cond)
+            step = self.node(stmt.step) if kind == "for" and stmt.step else None
+            self.breaks.append([])
+            self.continues.append(step or cond)
+            body_exits = self.sequence(stmt.body, [(cond, "yes")])
+            self.continues.pop()
+            if step:
+                self.link(body_exits, step)
+                body_exits = [(step, None)]
+            self.link(body_exits, cond)
+            after = self.breaks.pop()
+            return after + ([(cond, "no")] if stmt.text else [])
+        if kind == "do":
+            start = self.node("do", "((")
+            self.link(exits, start)
+            cond = self.node(f"{stmt.text}?", "{")
+            self.breaks.append([])
+            self.continues.append(cond)
+            body_exits = self.sequence(stmt.body, [(start, None)])
+            self.continues.pop()
+            self.link(body_exits, cond)
+            self.link([(cond, "yes")], start)
+            return self.breaks.pop() + [(cond, "no")]
+        if kind == "switch":
+            switch = self.node(f"switch {stmt.text}", "{")
+            self.link(exits, switch)
+            body = stmt.body[0].body if stmt.body and stmt.body[0].kind == "block" else stmt.body
+            self.breaks.append([])
+            flow: List[Exit] = []
+            has_default = False
+            for child in body:
+                if child.kind == "case":
+                    has_default = has_default or not child.text
+                    flow = flow + [(switch, child.text or "default")]
+                else:
+                    flow = self.statement(child, flow)
+            after = self.breaks.pop() + flow
+            return after + ([] if has_default else [(switch, "default")])
+        if kind == "break":
+            if self.breaks:
+                self.breaks[-1].extend(exits)
+            return []
+        if kind == "continue":
+            if self.continues:
+                self.link(exits, self.continues[-1])
+            return []
+        if kind == "return":
+            node_id = self.node(f"return {stmt.text}".strip(), "[/")
+            self.link(exits, node_id)
+            self.link([(node_id, None)], self.end_id)
+            return []
+        if kind == "goto":
+            self.link(exits, self.label_node(stmt.text))
+            return []
+        if kind == "label":
+            node_id = self.label_node(stmt.text)
+            self.link(exits, node_id)
+            return [(node_id, None)]
+        raise FlowgenError(f"Unknown statement kind '{kind}'")
+
+
+def generate_flowchart(code: str, name: Optional[str] = None) -> str:
+    """
+    Deterministic C-to-Mermaid flowchart for one function (or a statement list).
+    Control flow follows if/else, while/do/for, switch/case (with fallthrough),
+    break/continue, return and goto; straight-line statements are merged into
+    boxes of up to MERGE_STATEMENTS. Raises FlowgenError on unparseable input.
+    """
+    parsed_name, stmts = parse_body(code)
+    builder = _Builder()
+    builder.lines.append("flowchart TD")
+    start = builder.node(f"start {name or parsed_name or 'program'}", "([")
+    builder.lines.append(f"    {builder.end_id}([{_label('end')}])")
+    exits = builder.sequence(stmts, [(start, None)])
+    builder.link(exits, builder.end_id)
+    return "\n".join(builder.lines) + "\n"
@@ -1,10 +1,128 @@
+import asyncio
 import os
+import random
 import re
 import textwrap
-from typing import Optional
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 
 from langchain_openai import AzureChatOpenAI
 
+from . import metrics
+from .ratelimit import TokenBudgetScheduler, estimate_tokens
+from .validator import MermaidSyntaxError, parse_flowchart
+
+# Bump whenever the prompt or sanitizing changes so cached flowcharts are not reused.
+PROMPT_VERSION = "3"
+
+
+class LLMError(RuntimeError):
+    """LLM call failed after retries (message is surfaced as the job error)."""
+
+
+class LLMUnavailableError(LLMError):
+    """Circuit breaker is open; the call was rejected without hitting Azure."""
+
+
+class MalformedMermaidError(LLMError):
+    """Streamed output stopped parsing as Mermaid; generation was aborted early."""
+
+    def __init__(self, partial: str, error: MermaidSyntaxError):
+        super().__init__(f"Aborted malformed LLM output: {error}")
+        self.partial = partial
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+    - closed: calls pass; failure_threshold failures in a row open the circuit.
+    - open: calls fail fast until reset_timeout elapses.
+    - half-open: one trial call; success closes, failure re-opens.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """
+        Raise LLMUnavailableError if the call must not go out. Returns True
+        when the call is the half-open trial: the caller must then record an
+        outcome or release_trial() (e.g. when cancelled).
+        """
+        state = self.state
+        if state == "open" or (state == "half-open" and self._trial_in_flight):
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            raise LLMUnavailableError(
+                f"LLM backend unavailable (circuit open, retry in {max(remaining, 0):.0f}s)"
+            )
+        if state == "half-open":
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def release_trial(self):
+        """A trial ended without an outcome (cancelled): let the next call be the trial."""
+        self._trial_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    """Seconds from a Retry-After / retry-after-ms header on an API error, if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def _is_retryable(exc: Exception) -> bool:
+    """429, 5xx, timeouts and connection errors are transient; 4xx are not."""
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    name = type(exc).__name__
+    return name in ("APIConnectionError", "APITimeoutError") or isinstance(exc, (ConnectionError, OSError))
+
+
+# Section header of each diagram in a micro-batched reply (generate_batch).
+_SNIPPET_HEADER_RE = re.compile(r"^[#*\s]*Snippet\s+(\d+)\b.*$", re.IGNORECASE | re.MULTILINE)
+
+_SYSTEM_PROMPT = (
+    "You generate valid Mermaid flowcharts for C code. CRITICAL: Never use quotes inside node labels. "
+    "Use simple text without quotes or special characters. Focus on main program flow."
+)
+
+# A label that is quoted as a whole (["a[i]"], {"x?"}, [/"ret"/]) is already valid Mermaid.
+_QUOTED_LABEL_RE = re.compile(r'[\[({][/\\]?\s*"[^"]*"\s*[/\\]?[\])}]')
+
 
 def extract_mermaid(text: str) -> str:
     """
@@ -17,45 +135,251 @@ def extract_mermaid(text: str) -> str:
     return text.strip()
 
 
+def split_labeled_mermaid(text: str, count: int) -> List[Optional[str]]:
+    """
+    Diagrams of a micro-batched reply, by snippet number (1..count).
+    Each "### Snippet n" section goes through extract_mermaid; a snippet whose
+    section is missing, repeated or has no flowchart comes back as None.
+    """
+    headers = list(_SNIPPET_HEADER_RE.finditer(text))
+    sections: Dict[int, List[str]] = {}
+    for index, header in enumerate(headers):
+        end = headers[index + 1].start() if index + 1 < len(headers) else len(text)
+        sections.setdefault(int(header.group(1)), []).append(text[header.end():end])
+    results: List[Optional[str]] = []
+    for number in range(1, count + 1):
+        found = sections.get(number, [])
+        mermaid = extract_mermaid(found[0]) if len(found) == 1 else ""
+        results.append(mermaid if mermaid.startswith(("flowchart", "graph")) else None)
+    return results
+
+
+class MermaidStream:
+    """
+    Incremental extractor for the ```mermaid fence of a streamed response.
+    feed() takes raw text chunks; complete lines inside the fence accumulate in
+    `lines`, so the partial diagram is always whole lines (never half a node).
+    """
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self._pending = ""
+        self._state = "before"  # before -> inside -> after the fence
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+    def feed(self, chunk: str) -> bool:
+        """Consume a chunk; True if new diagram lines were completed."""
+        self._pending += chunk
+        added = False
+        while "\n" in self._pending and self._state != "after":
+            line, self._pending = self._pending.split("\n", 1)
+            stripped = line.strip()
+            if self._state == "before":
+                if stripped.startswith("```"):
+                    self._state = "inside"
+                elif stripped.startswith(("flowchart", "graph")):
+                    # Unfenced diagram (extract_mermaid accepts these too).
+                    self._state = "inside"
+                    self.lines.append(line.rstrip())
+                    added = True
+            elif stripped.startswith("```"):
+                self._state = "after"
+            elif stripped:
+                self.lines.append(line.rstrip())
+                added = True
+        return added
+
+
 class LLMClient:
     """
     Azure OpenAI via LangChain; falls back to stub if not configured.
     Expected env: AZURE_API_KEY, AZURE_API_ENDPOINT, AZURE_DEPLOYMENT, optional AZURE_API_VERSION.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        scheduler: Optional[TokenBudgetScheduler] = None,
+        semaphore: Optional[asyncio.Semaphore] = None,
+    ):
         """
         Initialize LLM client from environment variables.
         Falls back to stub mode if Azure credentials not configured.
+        scheduler admits calls against the token quota; semaphore caps calls in flight.
         """
         self.deployment = os.getenv("AZURE_DEPLOYMENT")
         self.endpoint = os.getenv("AZURE_API_ENDPOINT")
         self.api_key = os.getenv("AZURE_API_KEY")
         self.api_version = os.getenv("AZURE_API_VERSION", "2024-06-01")
+        self.call_timeout = float(os.getenv("LLM_CALL_TIMEOUT", "60"))
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", "4"))
+        self.backoff_base = float(os.getenv("LLM_BACKOFF_BASE", "1"))
+        self.backoff_max = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "30")),
+        )
+        # Completion tokens reserved per call on top of the prompt estimate.
+        self.completion_tokens = int(os.getenv("LLM_COMPLETION_TOKENS", "800"))
+        # Ask for a usage chunk at the end of each stream (needs api-version >= 2024-10-21).
+        self.stream_usage = os.getenv("LLM_STREAM_USAGE", "0") == "1"
+        self.scheduler = scheduler
+        self.semaphore = semaphore or asyncio.Semaphore(4)
+        self._azure: Optional[AzureChatOpenAI] = None
+
+    @property
+    def configured(self) -> bool:
+        """True when Azure credentials are present (otherwise stub mode)."""
+        return bool(self.deployment and self.endpoint and self.api_key)
 
     def _client(self) -> Optional[AzureChatOpenAI]:
         """
-        Lazy Azure OpenAI client creation.
+        Lazy Azure OpenAI client creation; one instance (and HTTP connection
+        pool) is reused for every call. Retries are handled by _invoke, so the
+        SDK's own retry loop is disabled.
         Returns None if credentials missing (triggers stub mode).
         """
-        if not (self.deployment and self.endpoint and self.api_key):
+        if not self.configured:
             return None
-        return AzureChatOpenAI(
-            azure_deployment=self.deployment,
-            azure_endpoint=self.endpoint,
-            api_key=self.api_key,
-            api_version=self.api_version,
-            temperature=0,
-        )
+        if self._azure is None:
+            self._azure = AzureChatOpenAI(
+                azure_deployment=self.deployment,
+                azure_endpoint=self.endpoint,
+                api_key=self.api_key,
+                api_version=self.api_version,
+                temperature=0,
+                timeout=self.call_timeout,
+                max_retries=0,
+            )
+        return self._azure
+
+    def _backoff(self, attempt: int, exc: Exception) -> float:
+        """Full-jitter exponential backoff, floored by the server's Retry-After."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = _retry_after(exc)
+        return max(delay, retry_after) if retry_after is not None else delay
 
-    async def generate_from_code(self, code: str) -> str:
+    async def _stream(
+        self,
+        client: AzureChatOpenAI,
+        messages: List[Tuple[str, str]],
+        on_chunk: Optional[Callable[[str], Awaitable[None]]],
+    ):
+        """Stream one completion, merging chunks into a single message (with usage if sent)."""
+        message = None
+        # AzureChatOpenAI has no stream_usage flag; stream_options goes straight to the API.
+        options = {"stream_options": {"include_usage": True}} if self.stream_usage else {}
+        async for chunk in client.astream(messages, **options):
+            message = chunk if message is None else message + chunk
+            if on_chunk and chunk.content:
+                await on_chunk(chunk.content)
+        return message
+
+    async def _invoke(
+        self,
+        client: AzureChatOpenAI,
+        messages: List[Tuple[str, str]],
+        deadline: Optional[float] = None,
+        batch: bool = False,
+        chunk_handler: Optional[Callable[[], Callable[[str], Awaitable[None]]]] = None,
+        completions: int = 1,
+    ):
+        """
+        Streamed call with a per-call timeout, retries on transient errors and
+        the circuit breaker. deadline (loop.time()) caps total time incl. backoff.
+        completions: diagrams expected in the reply (token reservation).
+        Every attempt is admitted by the token scheduler before taking a slot,
+        so queued calls wait in priority order rather than holding the semaphore.
+        chunk_handler() makes a fresh per-attempt callback that sees each content
+        delta; raising MalformedMermaidError from it aborts without a retry.
+        """
+        loop = asyncio.get_running_loop()
+        estimated = sum(estimate_tokens(text) for _, text in messages) + self.completion_tokens * completions
+        attempt = 0
+        while True:
+            # Admission first: the breaker only hands out a half-open trial to a
+            # call that is about to go out, so waiting here cannot strand it.
+            if self.scheduler:
+                await self.scheduler.acquire(estimated, batch=batch)
+            timeout = self.call_timeout
+            if deadline is not None:
+                timeout = min(timeout, deadline - loop.time())
+            try:
+                if timeout <= 0:
+                    raise LLMError("LLM call failed: job deadline exceeded")
+                trial = self.breaker.before_call()
+            except LLMError as exc:
+                if isinstance(exc, LLMUnavailableError):
+                    metrics.llm_calls.inc(outcome="circuit_open")
+                if self.scheduler:
+                    self.scheduler.record_usage(estimated, 0)  # Nothing was sent; refund.
+                raise
+            sent = False
+            try:
+                async with self.semaphore:
+                    sent = True
+                    on_chunk = chunk_handler() if chunk_handler else None
+                    message = await asyncio.wait_for(self._stream(client, messages, on_chunk), timeout=timeout)
+            except asyncio.CancelledError:
+                metrics.llm_calls.inc(outcome="cancelled")  # Job cancelled or worker stopping.
+                if trial:
+                    self.breaker.release_trial()  # No outcome; another call may try.
+                if self.scheduler and not sent:
+                    self.scheduler.record_usage(estimated, 0)  # Cancelled waiting for a slot; refund.
+                raise
+            except MalformedMermaidError:
+                self.breaker.record_success()  # The backend is answering, just badly.
+                metrics.llm_calls.inc(outcome="aborted")
+                raise
+            except Exception as exc:
+                retryable = _is_retryable(exc)
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    # The backend answered; a bad request says nothing about its health.
+                    self.breaker.record_success()
+                if self.scheduler and getattr(exc, "status_code", None) == 429:
+                    self.scheduler.throttled(_retry_after(exc))
+                delay = self._backoff(attempt, exc)
+                out_of_time = deadline is not None and loop.time() + delay >= deadline
+                if not retryable or attempt >= self.max_retries or out_of_time:
+                    metrics.llm_calls.inc(outcome="error")
+                    reason = "timed out" if isinstance(exc, asyncio.TimeoutError) else str(exc)
+                    raise LLMError(f"LLM call failed after {attempt + 1} attempt(s): {reason}") from exc
+                metrics.llm_calls.inc(outcome="retry")
+                print(f"[LLM] Attempt {attempt + 1} failed ({exc!r}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            metrics.llm_calls.inc(outcome="success")
+            usage = getattr(message, "usage_metadata", None) or {}
+            metrics.llm_tokens.inc(usage.get("input_tokens", 0), kind="prompt")
+            metrics.llm_tokens.inc(usage.get("output_tokens", 0), kind="completion")
+            if self.scheduler:
+                self.scheduler.record_usage(estimated, usage.get("total_tokens", estimated))
+                self.scheduler.succeeded()
+            return message
+
+    async def generate_from_code(
+        self,
+        code: str,
+        deadline: Optional[float] = None,
+        batch: bool = False,
+        on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
+        abort_malformed: bool = False,
+    ) -> str:
         """
-        Generate Mermaid flowchart from C code using Azure OpenAI (async).
+        Generate Mermaid flowchart from C code using Azure OpenAI (async, streamed).
         Returns stub flowchart if credentials not configured.
         Sanitizes quotes from output to prevent Mermaid parse errors.
-        TODO: Add timeout to prevent indefinite waits on slow LLM responses.
-        TODO: Add cost tracking or usage limits if exposing publicly.
-        TODO: Consider using ast-grep to pre-parse C code structure.
+        Transient failures are retried with backoff until deadline (loop time).
+        batch=True lowers the call's priority in the token scheduler.
+        on_partial(mermaid) gets the sanitized diagram-so-far after each new line.
+        abort_malformed stops the stream (MalformedMermaidError) as soon as the
+        partial diagram fails parse_flowchart's prefix check.
         """
         prompt = textwrap.dedent(
             f"""
@@ -79,41 +403,169 @@ class LLMClient:
             print("No client")
             return self.stub_flowchart()
 
-        try:
-            # Use ainvoke for async LangChain call
-            message = await client.ainvoke(
-                [
-                    (
-                        "system",
-                        "You generate valid Mermaid flowcharts for C code. CRITICAL: Never use quotes inside node labels. Use simple text without quotes or special characters. Focus on main program flow.",
-                    ),
-                    ("user", prompt),
-                ]
-            )
-            content: str = getattr(message, "content", "") or ""
-            mermaid_text = extract_mermaid(content)
-            # Clean up any quotes that might cause parse errors
-            mermaid_text = self._sanitize_mermaid(mermaid_text)
-            return mermaid_text
-        except Exception as exc:
-            raise RuntimeError(f"LLM call failed: {exc}") from exc
-    
+        message = await self._invoke(
+            client,
+            [("system", _SYSTEM_PROMPT), ("user", prompt)],
+            deadline=deadline,
+            batch=batch,
+            chunk_handler=(lambda: self._partial_handler(on_partial, abort_malformed))
+            if on_partial or abort_malformed else None,
+        )
+        content: str = getattr(message, "content", "") or ""
+        mermaid_text = extract_mermaid(content)
+        # Clean up any quotes that might cause parse errors
+        mermaid_text = self._sanitize_mermaid(mermaid_text)
+        return mermaid_text
+
+    async def generate_batch(
+        self, codes: List[str], deadline: Optional[float] = None, batch: bool = False
+    ) -> List[Optional[str]]:
+        """
+        One call for several small snippets (micro-batching, app/batching.py):
+        the reply holds one labeled Mermaid block per snippet, split back with
+        split_labeled_mermaid and sanitized like generate_from_code's output.
+        Entries are None where the reply did not match; callers retry those
+        one at a time. Not streamed per snippet, so there are no partials.
+        """
+        client = self._client()
+        if not client:
+            return [self.stub_flowchart() for _ in codes]
+
+        snippets = "\n\n".join(
+            f"### Snippet {number}\n```c\n{code}\n```" for number, code in enumerate(codes, 1)
+        )
+        prompt = textwrap.dedent(
+            """
+            Analyze each of the {count} C snippets below independently and produce one Mermaid
+            flowchart per snippet representing its program flow.
+
+            IMPORTANT RULES for valid Mermaid syntax:
+            - Use flowchart TD syntax
+            - NEVER use quotes inside node labels
+            - Use simple descriptive text without quotes
+            - Example: A[Read input] not A[Read "input"]
+
+            Reply with exactly {count} sections, in order. Start each with the line
+            "### Snippet <number>" followed by ONLY a mermaid fenced block.
+            """
+        ).strip().format(count=len(codes)) + "\n\n" + snippets
+
+        message = await self._invoke(
+            client,
+            [("system", _SYSTEM_PROMPT), ("user", prompt)],
+            deadline=deadline,
+            batch=batch,
+            completions=len(codes),
+        )
+        content: str = getattr(message, "content", "") or ""
+        return [
+            self._sanitize_mermaid(mermaid) if mermaid is not None else None
+            for mermaid in split_labeled_mermaid(content, len(codes))
+        ]
+
+    async def repair_mermaid(
+        self,
+        code: str,
+        mermaid: str,
+        error: str,
+        deadline: Optional[float] = None,
+        batch: bool = False,
+    ) -> str:
+        """
+        Targeted re-prompt: send the invalid diagram and its parser error back
+        and ask for a corrected diagram (not a fresh generation from scratch).
+        The C code is included so truncated diagrams can be completed.
+        Returns the diagram unchanged in stub mode.
+        """
+        prompt = textwrap.dedent(
+            """
+            The Mermaid flowchart below fails to parse. Fix it so it is valid Mermaid.
+            Keep the same nodes and edges; only change what is needed to fix the error.
+            If the diagram is cut off, complete it from the C code.
+            Quote node labels that contain brackets or parentheses, e.g. A["f(x)"].
+            Never use `end` as a node id.
+
+            Parser error:
+            {error}
+
+            Diagram:
+            ```mermaid
+            {mermaid}
+            ```
+
+            C code:
+            {code}
+
+            Return ONLY the corrected mermaid fenced block.
+            """
+        ).strip().format(error=error, mermaid=mermaid, code=code)
+
+        client = self._client()
+        if not client:
+            return mermaid
+
+        message = await self._invoke(
+            client,
+            [
+                ("system", "You fix syntax errors in Mermaid flowcharts. Reply with a mermaid fenced block only."),
+                ("user", prompt),
+            ],
+            deadline=deadline,
+            batch=batch,
+        )
+        content: str = getattr(message, "content", "") or ""
+        # Not sanitized: quoted labels are valid here and the caller re-runs repair_locally.
+        return extract_mermaid(content)
+
+    def _partial_handler(
+        self, on_partial: Optional[Callable[[str], Awaitable[None]]], abort_malformed: bool
+    ) -> Callable[[str], Awaitable[None]]:
+        """Per-attempt chunk callback: track the fence, check and report whole lines."""
+        stream = MermaidStream()
+
+        async def handle(chunk: str):
+            if not stream.feed(chunk):
+                return
+            partial = self._sanitize_mermaid(stream.text)
+            if abort_malformed:
+                try:
+                    parse_flowchart(partial, partial=True)
+                except MermaidSyntaxError as exc:
+                    raise MalformedMermaidError(partial, exc) from None
+            if on_partial:
+                await on_partial(partial)
+
+        return handle
+
     def _sanitize_mermaid(self, mermaid_text: str) -> str:
         """
         Remove quotes from inside node labels to prevent Mermaid parse errors.
         Applies regex twice per line to handle multiple quotes.
+        Labels quoted as a whole are kept: the quotes are what make brackets
+        inside them legal.
         """
         lines = []
         for line in mermaid_text.split('\n'):
-            # Remove quotes from inside brackets and parentheses
-            # Pattern: find content between [ ] or ( ) and remove quotes
-            line = re.sub(r'\[([^\]]*)"([^\]]*)\]', r'[\1\2]', line)
-            line = re.sub(r'\[([^\]]*)"([^\]]*)\]', r'[\1\2]', line)  # Apply twice for multiple quotes
-            line = re.sub(r'\(([^\)]*)"([^\)]*)\)', r'(\1\2)', line)
-            line = re.sub(r'\(([^\)]*)"([^\)]*)\)', r'(\1\2)', line)  # Apply twice for multiple quotes
-            lines.append(line)
+            parts = []
+            last = 0
+            for quoted in _QUOTED_LABEL_RE.finditer(line):
+                parts.append(self._strip_label_quotes(line[last:quoted.start()]))
+                parts.append(quoted.group(0))
+                last = quoted.end()
+            parts.append(self._strip_label_quotes(line[last:]))
+            lines.append("".join(parts))
         return '\n'.join(lines)
 
+    @staticmethod
+    def _strip_label_quotes(text: str) -> str:
+        # Remove quotes from inside brackets and parentheses
+        # Pattern: find content between [ ] or ( ) and remove quotes
+        text = re.sub(r'\[([^\]]*)"([^\]]*)\]', r'[\1\2]', text)
+        text = re.sub(r'\[([^\]]*)"([^\]]*)\]', r'[\1\2]', text)  # Apply twice for multiple quotes
+        text = re.sub(r'\(([^\)]*)"([^\)]*)\)', r'(\1\2)', text)
+        text = re.sub(r'\(([^\)]*)"([^\)]*)\)', r'(\1\2)', text)  # Apply twice for multiple quotes
+        return text
+
     def stub_flowchart(self) -> str:
         """
         Fallback stub when LLM is not configured.
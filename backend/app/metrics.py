@@ -0,0 +1,202 @@
+import math
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; spans sub-ms local validation up to multi-minute batch queue waits.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(header + self.samples())
+
+
+class Counter(_Metric):
+    """Monotonic count; callback mirrors a counter kept elsewhere (e.g. cache hits)."""
+    kind = "counter"
+
+    def __init__(
+        self, name: str, help_text: str, labels: Sequence[str] = (), callback: Optional[Callable[[], float]] = None
+    ):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[LabelValues, float] = {}
+        self.callback = callback
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        if self.callback:
+            return [f"{self.name} {_format_value(self.callback())}"]
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(self.values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Set directly, or computed at scrape time from a callback."""
+    kind = "gauge"
+
+    def __init__(
+        self, name: str, help_text: str, labels: Sequence[str] = (), callback: Optional[Callable[[], float]] = None
+    ):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[LabelValues, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels: str):
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels: str) -> float:
+        if self.callback:
+            return self.callback()
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        if self.callback:
+            return [f"{self.name} {_format_value(self.callback())}"]
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(self.values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.counts: Dict[LabelValues, List[int]] = {}
+        self.sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        counts = self.counts.setdefault(key, [0] * len(self.buckets))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        self.sums[key] = self.sums.get(key, 0.0) + value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key in sorted(self.counts):
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts[key]):
+                cumulative += count
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(self.sums[key])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Holds metrics in registration order and renders Prometheus text format 0.0.4."""
+
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = (), callback=None) -> Counter:
+        return self.register(Counter(name, help_text, labels, callback))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, help_text, labels, callback))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = Registry()
+
+# Pipeline instruments; gauges that mirror live state get callbacks in services.
+jobs_submitted = registry.counter("h2loop_jobs_submitted_total", "Jobs accepted.", ["lane"])
+jobs_finished = registry.counter("h2loop_jobs_finished_total", "Jobs finished.", ["status"])
+jobs_evicted = registry.counter("h2loop_jobs_evicted_total", "Finished jobs removed by retention.")
+jobs_in_flight = registry.gauge("h2loop_jobs_in_flight", "Jobs currently being processed by a worker.")
+stage_seconds = registry.histogram(
+    "h2loop_stage_seconds",
+    "Latency per pipeline stage (queue_wait, llm, local_generate, validation, repair, end_to_end).",
+    ["stage"],
+)
+llm_calls = registry.counter("h2loop_llm_calls_total", "LLM calls by outcome.", ["outcome"])
+llm_batched = registry.counter(
+    "h2loop_llm_batched_snippets_total", "Micro-batching candidates by outcome (batched, fallback, single).", ["outcome"]
+)
+llm_batch_size = registry.histogram(
+    "h2loop_llm_batch_size", "Snippets per micro-batched LLM call.", buckets=(2, 3, 4, 6, 8, 12, 16, 32)
+)
+preprocess_tokens = registry.counter(
+    "h2loop_preprocess_tokens_total",
+    "Estimated tokens of code bound for LLM prompts before (source) and after (reduced) preprocessing.",
+    ["kind"],
+)
+llm_tokens = registry.counter("h2loop_llm_tokens_total", "LLM tokens reported by the backend.", ["kind"])
+validations = registry.counter("h2loop_validations_total", "Mermaid validations by result.", ["result"])
+repairs = registry.counter("h2loop_repairs_total", "Invalid diagrams by repair outcome (local, llm, failed).", ["outcome"])
+functions_generated = registry.counter(
+    "h2loop_functions_total", "Per-function flowcharts by generator.", ["generator"]
+)
+functions_reused = registry.counter(
+    "h2loop_functions_reused_total", "Function results carried over unchanged from a job's previous revision."
+)
+diagrams_simplified = registry.counter(
+    "h2loop_diagrams_simplified_total", "Diagrams over DIAGRAM_MAX_NODES served as a summary with folded parts."
+)
@@ -1,10 +1,14 @@
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, Iterable, List, Literal, Optional
 
 from pydantic import BaseModel, ConfigDict, Field
 
 
+# auto: local generator for simple functions (or when no LLM is configured), LLM otherwise.
+GenerationMode = Literal["auto", "llm", "local"]
+
+
 class JobStatus:
     """
     Job status constants for tracking processing stages.
@@ -17,6 +21,9 @@ class JobStatus:
     VALIDATING = "validating"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"  # DELETE /api/jobs/{id}; functions finished before it are kept.
+    # Not a job status: batch_counts() bucket for finished jobs removed by retention.
+    EVICTED = "evicted"
     
     # Legacy aliases for compatibility
     QUEUED = "submitted"
@@ -24,25 +31,38 @@ class JobStatus:
     SUCCESS = "completed"
 
 
-@dataclass
+@dataclass(slots=True)
 class FunctionResult:
     """
     Result of flowchart generation for a single function/code block.
-    - validated: whether mmdc successfully parsed the Mermaid syntax.
-    - error: optional error message if validation failed.
+    - validated: whether the Mermaid validator accepted the syntax.
+    - error: parse error / mmdc stderr if validation failed, or the LLM error.
+    - generator: "local" (app/flowgen.py) or "llm".
+    - reused: copied from the previous revision because the function is unchanged.
+    - summary: bounded overview of a diagram too large to render whole (app/simplify.py);
+      its folded steps are served as parts.
     """
     name: str
     mermaid: str
     validated: bool
     error: Optional[str] = None
+    generator: Optional[str] = None
+    reused: bool = False
+    summary: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class JobState:
     """
-    Internal job state (in-memory store).
+    Internal job state held by the JobStore (see app/store.py).
     Tracks status, original code, progress, and generated flowcharts.
-    NOTE: Lost on restart; no persistence layer.
+    Persisted across restarts only with JOB_STORE=sqlite.
+    offloaded: code/mermaid blobs live in the BlobStore (app/blobs.py) and
+    are blank here; services.get_job returns a hydrated copy.
+    parent_id/revision: set for resubmissions (POST /api/jobs/{id}/revisions);
+    functions unchanged since the parent job reuse its results.
+    source_tokens/reduced_tokens: estimated tokens of the code bound for LLM
+    prompts before and after local preprocessing (app/preprocess.py).
     """
     id: str
     code: str
@@ -53,11 +73,53 @@ class JobState:
     error: Optional[str] = None
     created_at: datetime = field(default_factory=datetime.utcnow)
     updated_at: datetime = field(default_factory=datetime.utcnow)
+    batch_id: Optional[str] = None
+    path: Optional[str] = None
+    mode: str = "auto"
+    # Function name -> diagram-so-far while its LLM response is streaming.
+    partial_functions: Dict[str, str] = field(default_factory=dict)
+    offloaded: bool = False
+    parent_id: Optional[str] = None
+    revision: int = 1
+    source_tokens: int = 0
+    reduced_tokens: int = 0
+
+
+@dataclass(slots=True)
+class BatchState:
+    """
+    A group of jobs submitted together (one file per job).
+    Progress is aggregated from the member jobs on read.
+    """
+    id: str
+    job_ids: List[str] = field(default_factory=list)
+    created_at: datetime = field(default_factory=datetime.utcnow)
 
 
 class CreateJobRequest(BaseModel):
     """Request payload for creating a new job (POST /api/jobs)."""
     code: str
+    mode: GenerationMode = "auto"
+
+
+class CreateRevisionRequest(BaseModel):
+    """
+    Request payload for POST /api/jobs/{id}/revisions (edited resubmission).
+    mode defaults to the previous revision's mode.
+    """
+    code: str
+    mode: Optional[GenerationMode] = None
+
+
+class BatchFile(BaseModel):
+    path: str
+    code: str
+
+
+class CreateBatchRequest(BaseModel):
+    """Request payload for POST /api/batches: one job per file."""
+    files: List[BatchFile]
+    mode: GenerationMode = "auto"
 
 
 class FunctionResultResponse(BaseModel):
@@ -65,6 +127,16 @@ class FunctionResultResponse(BaseModel):
     mermaid: str
     validated: bool
     error: Optional[str] = None
+    generator: Optional[str] = None
+    reused: bool = False
+    summary: Optional[str] = None
+
+
+class FunctionPartResponse(BaseModel):
+    """One folded step of a summarized diagram (GET /api/jobs/{id}/functions/{name}/parts/{part})."""
+    id: str
+    title: str
+    mermaid: str
 
 
 class JobSummaryResponse(BaseModel):
@@ -80,6 +152,34 @@ class JobSummaryResponse(BaseModel):
     processed_functions: int = Field(0, alias="processedFunctions")
     created_at: datetime = Field(..., alias="createdAt")
     updated_at: datetime = Field(..., alias="updatedAt")
+    batch_id: Optional[str] = Field(None, alias="batchId")
+    path: Optional[str] = None
+    mode: str = "auto"
+    parent_id: Optional[str] = Field(None, alias="parentId")
+    revision: int = 1
+
+
+class BatchJobRef(BaseModel):
+    id: str
+    path: Optional[str] = None
+
+
+class BatchSummaryResponse(BaseModel):
+    """
+    Aggregate progress for a batch (GET /api/batches/{id}).
+    status_counts maps job status -> number of jobs in it.
+    """
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: str
+    total_jobs: int = Field(0, alias="totalJobs")
+    completed_jobs: int = Field(0, alias="completedJobs")
+    failed_jobs: int = Field(0, alias="failedJobs")
+    cancelled_jobs: int = Field(0, alias="cancelledJobs")
+    done: bool = False
+    status_counts: Dict[str, int] = Field(default_factory=dict, alias="statusCounts")
+    created_at: datetime = Field(..., alias="createdAt")
+    jobs: Optional[List[BatchJobRef]] = None
 
 
 class JobDetailResponse(JobSummaryResponse):
@@ -90,6 +190,9 @@ class JobDetailResponse(JobSummaryResponse):
     code: str
     error: Optional[str] = None
     functions: List[FunctionResultResponse] = Field(default_factory=list)
+    partial_functions: Dict[str, str] = Field(default_factory=dict, alias="partialFunctions")
+    source_tokens: int = Field(0, alias="sourceTokens")
+    reduced_tokens: int = Field(0, alias="reducedTokens")
 
 
 def to_summary(job: JobState) -> JobSummaryResponse:
@@ -101,6 +204,11 @@ def to_summary(job: JobState) -> JobSummaryResponse:
         processedFunctions=job.processed_functions,
         createdAt=job.created_at,
         updatedAt=job.updated_at,
+        batchId=job.batch_id,
+        path=job.path,
+        mode=job.mode,
+        parentId=job.parent_id,
+        revision=job.revision,
     )
 
 
@@ -111,7 +219,65 @@ def to_detail(job: JobState) -> JobDetailResponse:
         code=job.code,
         error=job.error,
         functions=[
-            FunctionResultResponse(**asdict(func)) for func in job.functions
+            FunctionResultResponse(**function_dict(func)) for func in job.functions
         ],
+        partialFunctions=job.partial_functions,
+        sourceTokens=job.source_tokens,
+        reducedTokens=job.reduced_tokens,
+    )
+
+
+
+def to_batch_summary(
+    batch: BatchState, counts: Dict[str, int], jobs: Optional[List[JobState]] = None
+) -> BatchSummaryResponse:
+    """Convert a batch plus its per-status job counts to the API response."""
+    completed = counts.get(JobStatus.COMPLETED, 0)
+    failed = counts.get(JobStatus.FAILED, 0)
+    cancelled = counts.get(JobStatus.CANCELLED, 0)
+    evicted = counts.get(JobStatus.EVICTED, 0)  # Finished, then removed by retention.
+    return BatchSummaryResponse(
+        id=batch.id,
+        totalJobs=len(batch.job_ids),
+        completedJobs=completed,
+        failedJobs=failed,
+        cancelledJobs=cancelled,
+        done=completed + failed + cancelled + evicted >= len(batch.job_ids),
+        statusCounts=counts,
+        createdAt=batch.created_at,
+        jobs=[BatchJobRef(id=job.id, path=job.path) for job in jobs] if jobs is not None else None,
     )
 
+
+def function_dict(func: FunctionResult) -> Dict[str, Any]:
+    """FunctionResultResponse as a plain dict, without the model or asdict's deep copy."""
+    return {
+        "name": func.name,
+        "mermaid": func.mermaid,
+        "validated": func.validated,
+        "error": func.error,
+        "generator": func.generator,
+        "reused": func.reused,
+        "summary": func.summary,
+    }
+
+
+def to_changes(job: JobState, names: Iterable[str]) -> Dict[str, Any]:
+    """
+    JSON-ready subset of the detail payload for push diffs.
+    Keys use the API's camelCase aliases; internal-only fields are skipped.
+    """
+    changes: Dict[str, Any] = {}
+    for name in names:
+        field_info = JobDetailResponse.model_fields.get(name)
+        if field_info is None:
+            continue
+        value = getattr(job, name)
+        if name == "functions":
+            value = [function_dict(func) for func in value]
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, dict):
+            value = dict(value)
+        changes[field_info.alias or name] = value
+    return changes
@@ -0,0 +1,233 @@
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+from .ratelimit import estimate_tokens
+
+_COMMENT_OR_LITERAL = re.compile(
+    r'//[^\n]*|/\*[\s\S]*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\''
+)
+_LITERAL_OR_SPACE = re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|[ \t]{2,}|\t')
+_DIRECTIVE = re.compile(r"^\s*#\s*(\w+)\s*(.*?)\s*$")
+_INTEGER = re.compile(r"^\(*\s*(0[xX][0-9a-fA-F]+|\d+)[uUlL]*\s*\)*$")
+# Directives that never affect control flow (the headers themselves are not in the submission).
+_DROPPED_DIRECTIVES = {"include", "pragma", "ident", "line"}
+_KEPT_ELEMENTS = 3  # Leading elements left in an elided initializer.
+
+
+@dataclass
+class Preprocessed:
+    """Reduced source for an LLM prompt plus estimated tokens before/after."""
+    code: str
+    original_tokens: int
+    reduced_tokens: int
+
+
+def strip_comments(code: str, keep_lines: bool = False) -> str:
+    """
+    Replace each comment with one space (as the C preprocessor does); literals are kept.
+    keep_lines: a multi-line comment also leaves its line breaks, so line numbers hold.
+    """
+    def _strip(match: "re.Match[str]") -> str:
+        token = match.group(0)
+        if not token.startswith("/"):
+            return token
+        return " " + "\n" * token.count("\n") if keep_lines else " "
+
+    return _COMMENT_OR_LITERAL.sub(_strip, code)
+
+
+def _condition(expression: str) -> Optional[bool]:
+    """Value of an #if/#elif condition if it is an integer literal (#if 0, #if 1); else None."""
+    negated = expression.startswith("!")
+    match = _INTEGER.match(expression[1:].strip() if negated else expression)
+    if not match:
+        return None
+    value = int(match.group(1), 0) != 0
+    return not value if negated else value
+
+
+class _Conditional:
+    """One #if level: known (literal condition) levels are resolved, unknown ones kept verbatim."""
+    __slots__ = ("known", "active", "taken")
+
+    def __init__(self, known: bool, active: bool):
+        self.known = known
+        self.active = active
+        self.taken = active
+
+
+def resolve_conditionals(code: str, keep_lines: bool = False) -> str:
+    """
+    Evaluate #if/#elif/#else/#endif whose conditions are integer literals:
+    dead branches (e.g. #if 0 blocks) and the directives themselves go away.
+    Anything else (#ifdef, macros, expressions) is left untouched, and so is
+    everything inside it apart from nested literal conditionals.
+    keep_lines: removed lines become empty lines instead, so line numbers hold.
+    """
+    stack: List[_Conditional] = []
+    out: List[str] = []
+    lines = code.split("\n")
+    for index, line in enumerate(lines):
+        if keep_lines:
+            out.extend([""] * (index - len(out)))  # Each line adds at most one to out.
+        match = _DIRECTIVE.match(line)
+        name, argument = (match.group(1), match.group(2)) if match else ("", "")
+        live = all(level.active for level in stack)
+        if name in ("if", "ifdef", "ifndef"):
+            value = _condition(argument) if name == "if" and live else None
+            stack.append(_Conditional(value is not None, value is not False))
+            if value is None and live:
+                out.append(line)
+            continue
+        if name in ("elif", "else", "endif") and stack:
+            level = stack[-1]
+            if not level.known:
+                if all(outer.active for outer in stack[:-1]):
+                    out.append(line)
+                if name == "endif":
+                    stack.pop()
+                continue
+            if name == "endif":
+                stack.pop()
+                continue
+            value = True if name == "else" else _condition(argument)
+            if level.taken:
+                level.active = False
+            elif value is None:
+                # #if 0 ... #elif FOO: the rest is an ordinary conditional starting here.
+                level.known, level.active = False, True
+                if all(outer.active for outer in stack[:-1]):
+                    out.append(re.sub(r"#\s*elif", "#if", line, count=1))
+            else:
+                level.active = level.taken = value
+            continue
+        if live and name not in _DROPPED_DIRECTIVES:
+            out.append(line)
+    if keep_lines:
+        out.extend([""] * (len(lines) - len(out)))
+    return "\n".join(out)
+
+
+def _matching_brace(code: str, open_index: int) -> int:
+    """Index of the "}" closing the "{" at open_index (skipping literals), or -1."""
+    depth = 0
+    index = open_index
+    while index < len(code):
+        char = code[index]
+        if char in "\"'":
+            literal = _COMMENT_OR_LITERAL.match(code, index)
+            index = literal.end() if literal else index + 1
+            continue
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return index
+        index += 1
+    return -1
+
+
+def _top_level_elements(body: str) -> List[str]:
+    """Comma-separated elements of an initializer body, ignoring nested braces/parens/literals."""
+    elements, depth, start, index = [], 0, 0, 0
+    while index < len(body):
+        char = body[index]
+        if char in "\"'":
+            literal = _COMMENT_OR_LITERAL.match(body, index)
+            index = literal.end() if literal else index + 1
+            continue
+        if char in "{([":
+            depth += 1
+        elif char in "})]":
+            depth -= 1
+        elif char == "," and depth == 0:
+            elements.append(body[start:index])
+            start = index + 1
+        index += 1
+    if body[start:].strip():
+        elements.append(body[start:])
+    return elements
+
+
+def elide_initializers(code: str, max_chars: int) -> str:
+    """
+    Shorten brace initializers (= { ... }) longer than max_chars to their first
+    few elements plus a note of how many were left out. Data tables carry no
+    control flow, so the diagram does not depend on their contents.
+    """
+    if max_chars <= 0:
+        return code
+    parts: List[str] = []
+    last = 0
+    for match in re.finditer(r"=\s*\{", code):
+        open_index = match.end() - 1
+        if open_index < last:
+            continue
+        close_index = _matching_brace(code, open_index)
+        if close_index < 0:
+            break
+        body = code[open_index + 1:close_index]
+        if len(body) <= max_chars:
+            continue
+        elements = _top_level_elements(body)
+        if len(elements) <= _KEPT_ELEMENTS:
+            continue
+        kept = ", ".join(element.strip() for element in elements[:_KEPT_ELEMENTS])
+        omitted = len(elements) - _KEPT_ELEMENTS
+        parts.append(code[last:open_index + 1])
+        parts.append(f" {kept}, /* {omitted} more elements */ ")
+        last = close_index
+    parts.append(code[last:])
+    return "".join(parts)
+
+
+def normalize_whitespace(code: str) -> str:
+    """
+    Drop blank lines and trailing blanks, turn tabs and runs of blanks inside
+    a line into one space. Indentation is kept (it shows nesting) and
+    string/char literals are untouched.
+    """
+    lines = []
+    for line in code.split("\n"):
+        body = line.lstrip(" \t")
+        if not body.strip():
+            continue
+        indent = line[:len(line) - len(body)].replace("\t", "    ")
+        body = _LITERAL_OR_SPACE.sub(lambda m: m.group(0) if m.group(0)[0] in "\"'" else " ", body.rstrip())
+        lines.append(indent + body)
+    return "\n".join(lines)
+
+
+def preprocess_unit(code: str) -> str:
+    """
+    Translation-unit steps, run on a whole submission before it is split into
+    functions: comments, dead literal conditionals (#if 0, the untaken #else)
+    and #include/#pragma lines are removed, so functions in dead code are not
+    split out at all. Line breaks are kept, so line numbers still match the
+    submission.
+    """
+    return resolve_conditionals(strip_comments(code, keep_lines=True), keep_lines=True)
+
+
+def reduce_function(source: str, original: str, max_initializer_chars: int = 200) -> Preprocessed:
+    """
+    Per-function steps on a function split from preprocess_unit() output:
+    long initializer data and redundant whitespace are removed. original is
+    the function as submitted, for the token counts.
+    Control flow is untouched, so the flowchart should not change.
+    """
+    reduced = elide_initializers(source, max_initializer_chars)
+    reduced = normalize_whitespace(reduced)
+    if not reduced.strip():
+        reduced = original  # Nothing left (e.g. all comments): let the LLM see what was sent.
+    return Preprocessed(reduced, estimate_tokens(original), estimate_tokens(reduced))
+
+
+def preprocess_c(code: str, max_initializer_chars: int = 200) -> Preprocessed:
+    """
+    Local reduction of C source before it is embedded in an LLM prompt:
+    preprocess_unit() then reduce_function() over the whole of code.
+    """
+    return reduce_function(preprocess_unit(code), code, max_initializer_chars)
@@ -0,0 +1,686 @@
+import asyncio
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+
+@dataclass
+class Lease:
+    """
+    A job handed to one consumer; token identifies this delivery for ack/extend/release.
+    cancelled: the job was cancelled while leased (set by lease() or extend()).
+    """
+    job_id: str
+    token: str = ""
+    attempts: int = 1
+    cancelled: bool = False
+
+
+class FairJobQueue:
+    """
+    Drop-in for asyncio.Queue[str] (put/get/task_done/join/qsize) with two lanes.
+    Process-local: jobs live only in this event loop (see SQLiteJobQueue /
+    RedisJobQueue for queues shared between processes).
+    - Interactive lane: single submissions, ordered by arrival plus
+      priority * priority_aging seconds, so a higher priority class (lower
+      number) overtakes jobs that arrived up to that long before it, and a
+      low-priority job waits at most that much longer than under FIFO.
+    - Batch lane: one FIFO per batch, served round-robin across batches so a
+      huge upload cannot starve a smaller one (callers order files in a batch).
+    When both lanes have work, up to interactive_weight interactive jobs are
+    served per batch job, so single submissions stay responsive during bulk
+    runs while batches still make steady progress.
+    """
+
+    durable = False
+
+    def __init__(self, interactive_weight: int = 4, priority_aging: float = 30.0):
+        self.interactive_weight = max(interactive_weight, 1)
+        self.priority_aging = priority_aging
+        self._interactive: List[Tuple[float, int, str]] = []  # Heap of (rank, seq, job_id).
+        self._seq = itertools.count()
+        self._batches: "OrderedDict[str, Deque[str]]" = OrderedDict()
+        self._batch_size = 0
+        self._credit = 0
+        self._available = asyncio.Semaphore(0)
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+        self._enqueued_at: Dict[str, float] = {}  # Insertion order = oldest first.
+
+    def qsize(self) -> int:
+        return len(self._interactive) + self._batch_size
+
+    def lane_sizes(self) -> Dict[str, int]:
+        return {"interactive": len(self._interactive), "batch": self._batch_size}
+
+    def oldest_wait(self) -> float:
+        """Seconds the longest-queued job has been waiting (0 if empty)."""
+        for enqueued_at in self._enqueued_at.values():
+            return time.monotonic() - enqueued_at
+        return 0.0
+
+    def put_nowait(self, job_id: str, batch_id: Optional[str] = None, priority: int = 0):
+        now = time.monotonic()
+        if batch_id is None:
+            heapq.heappush(self._interactive, (now + priority * self.priority_aging, next(self._seq), job_id))
+        else:
+            self._batches.setdefault(batch_id, deque()).append(job_id)
+            self._batch_size += 1
+        self._enqueued_at.setdefault(job_id, now)
+        self._unfinished += 1
+        self._finished.clear()
+        self._available.release()
+
+    async def put(self, job_id: str, batch_id: Optional[str] = None, priority: int = 0):
+        self.put_nowait(job_id, batch_id, priority)
+
+    def _next_batch_job(self) -> str:
+        batch_id, jobs = next(iter(self._batches.items()))
+        job_id = jobs.popleft()
+        self._batch_size -= 1
+        if jobs:
+            self._batches.move_to_end(batch_id)
+        else:
+            del self._batches[batch_id]
+        return job_id
+
+    async def get(self) -> str:
+        while True:
+            await self._available.acquire()
+            if self.qsize():
+                break
+            # Permit left behind by cancel(); wait for the next put.
+        serve_interactive = self._interactive and (
+            not self._batch_size or self._credit < self.interactive_weight
+        )
+        if serve_interactive:
+            self._credit += 1
+            _, _, job_id = heapq.heappop(self._interactive)
+        else:
+            self._credit = 0
+            job_id = self._next_batch_job()
+        self._enqueued_at.pop(job_id, None)
+        return job_id
+
+    def task_done(self):
+        if self._unfinished <= 0:
+            raise ValueError("task_done() called too many times")
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._finished.set()
+
+    async def join(self):
+        await self._finished.wait()
+
+    async def put_many(self, job_ids: List[str], batch_id: Optional[str] = None, priority: int = 0):
+        for job_id in job_ids:
+            self.put_nowait(job_id, batch_id, priority)
+
+    async def cancel(self, job_id: str) -> str:
+        """
+        Drop a job that has not been handed out yet. Returns "queued" if it
+        was removed, "" if it is not waiting here (already handed out or done).
+        O(queue length); cancellation is rare.
+        """
+        if self._enqueued_at.pop(job_id, None) is None:
+            return ""
+        for index, entry in enumerate(self._interactive):
+            if entry[2] == job_id:
+                self._interactive[index] = self._interactive[-1]
+                self._interactive.pop()
+                heapq.heapify(self._interactive)
+                break
+        else:
+            for batch_id, jobs in self._batches.items():
+                if job_id in jobs:
+                    jobs.remove(job_id)
+                    self._batch_size -= 1
+                    if not jobs:
+                        del self._batches[batch_id]
+                    break
+        self.task_done()
+        return "queued"
+
+    # Lease interface shared with the durable queues; a lease here is just get().
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def lease(self) -> Lease:
+        return Lease(await self.get())
+
+    async def ack(self, lease: Lease):
+        self.task_done()
+
+    async def extend(self, lease: Lease) -> bool:
+        return True
+
+    async def release(self, lease: Lease):
+        """Shutdown: nothing to hand back, process-local jobs die with the process."""
+        self.task_done()
+
+
+class _LeasedQueue:
+    """
+    Shared plumbing for queues that outlive the process.
+    - lease() polls every poll_interval (or sooner after a local put) and marks
+      the job invisible for visibility_timeout; the worker extends the lease
+      while it runs, and a crashed worker's job reappears once it lapses
+      (at-least-once: a job may be processed again after a crash).
+    - ack() deletes the job; release() makes it visible again immediately.
+    - cancel() deletes a waiting job, or flags a leased one: the holder
+      learns of it from extend() and a crashed holder's redelivery from lease().
+    - Lane fairness mirrors FairJobQueue: up to interactive_weight interactive
+      jobs per batch job (counted per process), interactive jobs ranked by
+      arrival plus priority * priority_aging, and batch jobs ordered by
+      round so batches are interleaved rather than served one after another.
+    - join() stops leasing and waits for this process's in-flight leases only;
+      queued jobs stay for other (or future) workers.
+    - qsize()/lane_sizes()/oldest_wait() are served from stats refreshed
+      every poll_interval, so metrics and /ready never block on I/O.
+    """
+
+    durable = True
+
+    def __init__(self, interactive_weight: int = 4, visibility_timeout: float = 60.0, poll_interval: float = 0.5,
+                 priority_aging: float = 30.0):
+        self.interactive_weight = max(interactive_weight, 1)
+        self.priority_aging = priority_aging
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self._credit = 0
+        self._wake = asyncio.Event()
+        self._draining = False
+        self._leased: Set[str] = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._lanes = {"interactive": 0, "batch": 0}
+        self._oldest: Optional[float] = None
+        self._stats_task: Optional[asyncio.Task] = None
+
+    def qsize(self) -> int:
+        return sum(self._lanes.values())
+
+    def lane_sizes(self) -> Dict[str, int]:
+        return dict(self._lanes)
+
+    def oldest_wait(self) -> float:
+        return max(0.0, time.time() - self._oldest) if self._oldest else 0.0
+
+    async def start(self):
+        self._draining = False
+        if self._stats_task is None or self._stats_task.done():
+            self._stats_task = asyncio.create_task(self._stats_loop())
+
+    async def close(self):
+        if self._stats_task:
+            self._stats_task.cancel()
+            await asyncio.gather(self._stats_task, return_exceptions=True)
+            self._stats_task = None
+
+    async def _stats_loop(self):
+        while True:
+            try:
+                self._lanes, self._oldest = await self._stats()
+            except Exception as exc:
+                print(f"[Queue] Stats refresh failed: {exc}")
+            await asyncio.sleep(self.poll_interval)
+
+    def put_nowait(self, job_id: str, batch_id: Optional[str] = None):
+        raise RuntimeError("Durable queues are async; use await put()")
+
+    async def put(self, job_id: str, batch_id: Optional[str] = None, priority: int = 0):
+        await self.put_many([job_id], batch_id, priority)
+
+    async def put_many(self, job_ids: List[str], batch_id: Optional[str] = None, priority: int = 0):
+        """Idempotent: ids already queued (or leased) are left alone."""
+        if job_ids:
+            await self._put(job_ids, batch_id, time.time() + priority * self.priority_aging)
+            self._wake.set()
+
+    async def cancel(self, job_id: str) -> str:
+        """
+        "queued": removed before any worker got it; "leased": flagged for the
+        worker holding it; "": not in the queue (finished or never queued).
+        """
+        return await self._cancel(job_id, time.time())
+
+    async def lease(self) -> Lease:
+        while True:
+            if not self._draining:
+                prefer_batch = self._credit >= self.interactive_weight
+                token = uuid.uuid4().hex
+                leased = await self._lease(token, prefer_batch)
+                if leased:
+                    job_id, attempts, lane, cancelled = leased
+                    self._credit = self._credit + 1 if lane == "interactive" else 0
+                    self._leased.add(token)
+                    self._idle.clear()
+                    return Lease(job_id, token, attempts, cancelled)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _done(self, lease: Lease):
+        self._leased.discard(lease.token)
+        if not self._leased:
+            self._idle.set()
+
+    async def ack(self, lease: Lease):
+        try:
+            await self._ack(lease)
+        finally:
+            self._done(lease)
+
+    async def extend(self, lease: Lease) -> bool:
+        """
+        Push the lease expiry out. False if the lease is no longer ours (it
+        lapsed and the job was redelivered) or the job was cancelled, in which
+        case lease.cancelled is set.
+        """
+        state = await self._extend(lease)
+        if state == "cancelled":
+            lease.cancelled = True
+        return state == "ok"
+
+    async def release(self, lease: Lease):
+        try:
+            await self._release(lease)
+        finally:
+            self._done(lease)
+
+    async def join(self):
+        self._draining = True
+        await self._idle.wait()
+
+    # Backend primitives.
+    async def _put(self, job_ids: List[str], batch_id: Optional[str], rank: float):
+        """rank orders the interactive lane (epoch seconds, arrival plus priority handicap)."""
+        raise NotImplementedError
+
+    async def _lease(self, token: str, prefer_batch: bool):
+        """(job_id, attempts, lane, cancelled) or None when nothing is visible."""
+        raise NotImplementedError
+
+    async def _ack(self, lease: Lease):
+        raise NotImplementedError
+
+    async def _extend(self, lease: Lease) -> str:
+        """"ok", "cancelled" or "lost"."""
+        raise NotImplementedError
+
+    async def _cancel(self, job_id: str, now: float) -> str:
+        raise NotImplementedError
+
+    async def _release(self, lease: Lease):
+        raise NotImplementedError
+
+    async def _stats(self):
+        raise NotImplementedError
+
+
+class SQLiteJobQueue(_LeasedQueue):
+    """
+    Queue table in a SQLite file shared by API and worker processes on one
+    host (WAL; BEGIN IMMEDIATE serialises concurrent leases). Rows hold the
+    lane, order (batch round, rank), lease (visible_at, token, attempts) and
+    the cancelled flag.
+    """
+
+    def __init__(self, path: str, interactive_weight: int = 4, visibility_timeout: float = 60.0,
+                 poll_interval: float = 0.5, priority_aging: float = 30.0):
+        super().__init__(interactive_weight, visibility_timeout, poll_interval, priority_aging)
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS job_queue ("
+            " job_id TEXT PRIMARY KEY, batch_id TEXT, lane TEXT NOT NULL, round INTEGER NOT NULL,"
+            " enqueued_at REAL NOT NULL, visible_at REAL NOT NULL, token TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(job_queue)")}
+        if "rank" not in columns:
+            self._db.execute("ALTER TABLE job_queue ADD COLUMN rank REAL NOT NULL DEFAULT 0")
+        if "cancelled" not in columns:
+            self._db.execute("ALTER TABLE job_queue ADD COLUMN cancelled INTEGER NOT NULL DEFAULT 0")
+        self._db.execute("CREATE INDEX IF NOT EXISTS job_queue_ready ON job_queue (lane, visible_at)")
+        self._db.execute("DROP INDEX IF EXISTS job_queue_order")
+        self._db.execute("CREATE INDEX IF NOT EXISTS job_queue_rank ON job_queue (lane, round, rank)")
+
+    def _transaction(self, work):
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    async def _put(self, job_ids: List[str], batch_id: Optional[str], rank: float):
+        now = time.time()
+
+        def work(db):
+            base = 0
+            if batch_id is not None:
+                # New batches join the rotation at the round currently being served.
+                (base,) = db.execute(
+                    "SELECT COALESCE(MIN(round), 0) FROM job_queue WHERE lane = 'batch'"
+                ).fetchone()
+            db.executemany(
+                "INSERT OR IGNORE INTO job_queue (job_id, batch_id, lane, round, rank, enqueued_at, visible_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (job_id, batch_id, "interactive" if batch_id is None else "batch",
+                     base + index if batch_id is not None else 0, rank, now, now)
+                    for index, job_id in enumerate(job_ids)
+                ],
+            )
+
+        await asyncio.to_thread(self._transaction, work)
+
+    async def _lease(self, token: str, prefer_batch: bool):
+        now = time.time()
+        lanes = ("batch", "interactive") if prefer_batch else ("interactive", "batch")
+
+        def work(db):
+            for lane in lanes:
+                row = db.execute(
+                    "SELECT job_id, attempts, cancelled FROM job_queue WHERE lane = ? AND visible_at <= ?"
+                    " ORDER BY round, rank LIMIT 1",
+                    (lane, now),
+                ).fetchone()
+                if row:
+                    db.execute(
+                        "UPDATE job_queue SET visible_at = ?, token = ?, attempts = attempts + 1 WHERE job_id = ?",
+                        (now + self.visibility_timeout, token, row[0]),
+                    )
+                    return row[0], row[1] + 1, lane, bool(row[2])
+            return None
+
+        return await asyncio.to_thread(self._transaction, work)
+
+    async def _ack(self, lease: Lease):
+        await asyncio.to_thread(
+            self._transaction,
+            lambda db: db.execute("DELETE FROM job_queue WHERE job_id = ? AND token = ?", (lease.job_id, lease.token)),
+        )
+
+    async def _extend(self, lease: Lease) -> str:
+        until = time.time() + self.visibility_timeout
+
+        def work(db):
+            row = db.execute("SELECT token, cancelled FROM job_queue WHERE job_id = ?", (lease.job_id,)).fetchone()
+            if row is None or row[0] != lease.token:
+                return "lost"
+            if row[1]:
+                return "cancelled"
+            db.execute("UPDATE job_queue SET visible_at = ? WHERE job_id = ?", (until, lease.job_id))
+            return "ok"
+
+        return await asyncio.to_thread(self._transaction, work)
+
+    async def _cancel(self, job_id: str, now: float) -> str:
+        def work(db):
+            row = db.execute("SELECT token, visible_at FROM job_queue WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return ""
+            token, visible_at = row
+            if token is not None and visible_at > now:
+                db.execute("UPDATE job_queue SET cancelled = 1 WHERE job_id = ?", (job_id,))
+                return "leased"
+            db.execute("DELETE FROM job_queue WHERE job_id = ?", (job_id,))
+            return "queued"
+
+        return await asyncio.to_thread(self._transaction, work)
+
+    async def _release(self, lease: Lease):
+        now = time.time()
+        await asyncio.to_thread(
+            self._transaction,
+            lambda db: db.execute(
+                "UPDATE job_queue SET visible_at = ?, token = NULL WHERE job_id = ? AND token = ?",
+                (now, lease.job_id, lease.token),
+            ),
+        )
+
+    def _read_stats(self):
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT lane, COUNT(*), MIN(enqueued_at) FROM job_queue WHERE token IS NULL OR visible_at <= ?"
+                " GROUP BY lane",
+                (time.time(),),
+            ).fetchall()
+        lanes = {"interactive": 0, "batch": 0}
+        oldest = None
+        for lane, count, first in rows:
+            lanes[lane] = count
+            oldest = first if oldest is None else min(oldest, first)
+        return lanes, oldest
+
+    async def _stats(self):
+        return await asyncio.to_thread(self._read_stats)
+
+    async def close(self):
+        await super().close()
+        with self._db_lock:
+            self._db.close()
+
+
+# Atomic Redis operations (EVAL). Job metadata lives in <prefix>:job:<id>;
+# lanes are sorted sets scored by order (interactive: rank; batch: round, then
+# arrival), leases a sorted set scored by expiry.
+_REDIS_PUT = """
+local base = 0
+if ARGV[2] == 'batch' then
+  local head = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+  if head[2] then base = math.floor(tonumber(head[2]) / 4294967296) end
+end
+local added = 0
+for i = 4, #ARGV do
+  local key = KEYS[2] .. ':job:' .. ARGV[i]
+  if redis.call('EXISTS', key) == 0 then
+    local score = ARGV[3]
+    if ARGV[2] == 'batch' then
+      local seq = redis.call('INCR', KEYS[2] .. ':seq')
+      score = (base + i - 4) * 4294967296 + seq
+    end
+    redis.call('HSET', key, 'lane', ARGV[2], 'score', score, 'enqueued_at', ARGV[1], 'attempts', 0)
+    redis.call('ZADD', KEYS[1], score, ARGV[i])
+    added = added + 1
+  end
+end
+return added
+"""
+
+_REDIS_LEASE = """
+local prefix = KEYS[4]
+local expired = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[1], 'LIMIT', 0, 100)
+for _, id in ipairs(expired) do
+  redis.call('ZREM', KEYS[3], id)
+  local meta = redis.call('HMGET', prefix .. ':job:' .. id, 'lane', 'score')
+  if meta[1] then
+    local lane_key = KEYS[1]
+    if meta[1] == 'batch' then lane_key = KEYS[2] end
+    redis.call('ZADD', lane_key, meta[2], id)
+    redis.call('HDEL', prefix .. ':job:' .. id, 'token')
+  end
+end
+local order = {KEYS[1], KEYS[2]}
+if ARGV[4] == '1' then order = {KEYS[2], KEYS[1]} end
+for _, lane_key in ipairs(order) do
+  local popped = redis.call('ZPOPMIN', lane_key)
+  if popped[1] then
+    local id = popped[1]
+    local key = prefix .. ':job:' .. id
+    redis.call('ZADD', KEYS[3], ARGV[2], id)
+    redis.call('HSET', key, 'token', ARGV[3])
+    local attempts = redis.call('HINCRBY', key, 'attempts', 1)
+    return {id, attempts, redis.call('HGET', key, 'lane'), redis.call('HGET', key, 'cancelled') or '0'}
+  end
+end
+return false
+"""
+
+_REDIS_ACK = """
+local key = KEYS[2] .. ':job:' .. ARGV[1]
+if redis.call('HGET', key, 'token') ~= ARGV[2] then return 0 end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('DEL', key)
+return 1
+"""
+
+_REDIS_EXTEND = """
+local meta = redis.call('HMGET', KEYS[2] .. ':job:' .. ARGV[1], 'token', 'cancelled')
+if meta[1] ~= ARGV[2] then return 'lost' end
+if meta[2] == '1' then return 'cancelled' end
+redis.call('ZADD', KEYS[1], 'XX', ARGV[3], ARGV[1])
+return 'ok'
+"""
+
+_REDIS_CANCEL = """
+local key = KEYS[4] .. ':job:' .. ARGV[1]
+if redis.call('EXISTS', key) == 0 then return '' end
+local expiry = redis.call('ZSCORE', KEYS[3], ARGV[1])
+if expiry and tonumber(expiry) > tonumber(ARGV[2]) then
+  redis.call('HSET', key, 'cancelled', '1')
+  return 'leased'
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('DEL', key)
+return 'queued'
+"""
+
+_REDIS_RELEASE = """
+local key = KEYS[4] .. ':job:' .. ARGV[1]
+if redis.call('HGET', key, 'token') ~= ARGV[2] then return 0 end
+redis.call('ZREM', KEYS[3], ARGV[1])
+local meta = redis.call('HMGET', key, 'lane', 'score')
+local lane_key = KEYS[1]
+if meta[1] == 'batch' then lane_key = KEYS[2] end
+redis.call('ZADD', lane_key, meta[2], ARGV[1])
+redis.call('HDEL', key, 'token')
+return 1
+"""
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisJobQueue(_LeasedQueue):
+    """
+    Queue in Redis (or anything speaking its protocol with EVAL, e.g. a local
+    stand-in such as fakeredis[lua]) so workers can run on other hosts.
+    Every state change is one Lua script, so a lease is never lost between
+    popping a job and recording its expiry. Needs the optional `redis` package.
+    """
+
+    def __init__(self, url: str, prefix: str = "h2loop:queue", interactive_weight: int = 4,
+                 visibility_timeout: float = 60.0, poll_interval: float = 0.5, priority_aging: float = 30.0,
+                 client=None):
+        super().__init__(interactive_weight, visibility_timeout, poll_interval, priority_aging)
+        if client is None:
+            try:
+                from redis import asyncio as redis_asyncio
+            except ImportError as exc:
+                raise RuntimeError("QUEUE_BACKEND=redis needs the 'redis' package") from exc
+            client = redis_asyncio.from_url(url)
+        self.redis = client
+        self.prefix = prefix
+        self._interactive = f"{prefix}:interactive"
+        self._batch = f"{prefix}:batch"
+        self._leases = f"{prefix}:leases"
+
+    async def _put(self, job_ids: List[str], batch_id: Optional[str], rank: float):
+        lane = "interactive" if batch_id is None else "batch"
+        target = self._interactive if batch_id is None else self._batch
+        await self.redis.eval(_REDIS_PUT, 2, target, self.prefix, time.time(), lane, rank, *job_ids)
+
+    async def _lease(self, token: str, prefer_batch: bool):
+        now = time.time()
+        result = await self.redis.eval(
+            _REDIS_LEASE, 4, self._interactive, self._batch, self._leases, self.prefix,
+            now, now + self.visibility_timeout, token, "1" if prefer_batch else "0",
+        )
+        if not result:
+            return None
+        job_id, attempts, lane, cancelled = (_decode(value) for value in result)
+        return job_id, int(attempts), lane, cancelled == "1"
+
+    async def _ack(self, lease: Lease):
+        await self.redis.eval(_REDIS_ACK, 2, self._leases, self.prefix, lease.job_id, lease.token)
+
+    async def _extend(self, lease: Lease) -> str:
+        until = time.time() + self.visibility_timeout
+        return _decode(
+            await self.redis.eval(_REDIS_EXTEND, 2, self._leases, self.prefix, lease.job_id, lease.token, until)
+        )
+
+    async def _cancel(self, job_id: str, now: float) -> str:
+        return _decode(
+            await self.redis.eval(
+                _REDIS_CANCEL, 4, self._interactive, self._batch, self._leases, self.prefix, job_id, now,
+            )
+        ) or ""
+
+    async def _release(self, lease: Lease):
+        await self.redis.eval(
+            _REDIS_RELEASE, 4, self._interactive, self._batch, self._leases, self.prefix,
+            lease.job_id, lease.token,
+        )
+
+    async def _stats(self):
+        lanes = {
+            "interactive": await self.redis.zcard(self._interactive),
+            "batch": await self.redis.zcard(self._batch),
+        }
+        oldest = None
+        for key in (self._interactive, self._batch):
+            head = await self.redis.zrange(key, 0, 0)
+            if head:
+                job_id = _decode(head[0])
+                enqueued_at = await self.redis.hget(f"{self.prefix}:job:{job_id}", "enqueued_at")
+                if enqueued_at is not None:
+                    oldest = float(enqueued_at) if oldest is None else min(oldest, float(enqueued_at))
+        return lanes, oldest
+
+    async def close(self):
+        await super().close()
+        close = getattr(self.redis, "aclose", None) or self.redis.close
+        await close()
+
+
+def create_queue(interactive_weight: int = 4, priority_aging: float = 30.0):
+    """Build the queue selected by QUEUE_BACKEND (memory | sqlite | redis)."""
+    backend = os.getenv("QUEUE_BACKEND", "memory")
+    visibility = float(os.getenv("QUEUE_VISIBILITY_TIMEOUT", "60"))
+    poll = float(os.getenv("QUEUE_POLL_INTERVAL", "0.5"))
+    if backend == "sqlite":
+        path = os.getenv("QUEUE_PATH") or os.getenv("JOB_STORE_PATH", "jobs.db")
+        return SQLiteJobQueue(path, interactive_weight, visibility, poll, priority_aging)
+    if backend == "redis":
+        return RedisJobQueue(
+            os.getenv("QUEUE_REDIS_URL", "redis://localhost:6379/0"),
+            prefix=os.getenv("QUEUE_REDIS_PREFIX", "h2loop:queue"),
+            interactive_weight=interactive_weight, visibility_timeout=visibility, poll_interval=poll,
+            priority_aging=priority_aging,
+        )
+    return FairJobQueue(interactive_weight, priority_aging)
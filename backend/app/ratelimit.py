@@ -0,0 +1,144 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Rough chars-per-token for C source and English prompt text (cl100k averages ~3.5-4).
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap prompt-size estimate; no tokenizer dependency needed for admission."""
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+class TokenBudgetScheduler:
+    """
+    Admission control for LLM calls against a shared tokens-per-minute quota.
+    - Token bucket refilled at `rate` tokens/s (capacity = burst).
+    - Waiters are served earliest-virtual-deadline first: deadline = arrival +
+      tokens / max_rate, scaled by batch_penalty for batch jobs. Small and
+      interactive calls jump ahead, but nothing waits forever.
+    - Adaptive (AIMD): a 429 halves the refill rate and pauses admission for
+      Retry-After; each success adds back a slice of the configured rate.
+    - record_usage() corrects the bucket with the actual token count once known.
+    """
+
+    def __init__(
+        self,
+        tokens_per_minute: int,
+        burst: Optional[int] = None,
+        batch_penalty: float = 4.0,
+        min_rate_fraction: float = 0.1,
+    ):
+        self.max_rate = tokens_per_minute / 60
+        self.rate = self.max_rate
+        self.capacity = burst or tokens_per_minute
+        self.batch_penalty = batch_penalty
+        self.min_rate = self.max_rate * min_rate_fraction
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.estimated_tokens = 0
+        self.used_tokens = 0
+        self.throttle_count = 0
+        self._waiters: List[Tuple[float, int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _dispatch(self):
+        """Admit waiters in deadline order while the budget allows; else arm a timer."""
+        self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():  # Cancelled while waiting.
+                heapq.heappop(self._waiters)
+                continue
+            if now < self.paused_until:
+                wait = self.paused_until - now
+            elif self.tokens >= tokens:
+                heapq.heappop(self._waiters)
+                self.tokens -= tokens
+                future.set_result(None)
+                continue
+            else:
+                wait = (tokens - self.tokens) / self.rate
+            self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+            return
+
+    async def acquire(self, tokens: int, batch: bool = False):
+        """Wait until `tokens` may be spent. Calls larger than the burst are clamped."""
+        tokens = min(tokens, self.capacity)
+        self.estimated_tokens += tokens
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        deadline = time.monotonic() + tokens / self.max_rate * (self.batch_penalty if batch else 1)
+        heapq.heappush(self._waiters, (deadline, next(self._seq), tokens, future))
+        if self._timer is not None:
+            self._timer.cancel()
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.tokens += tokens  # Admitted just as we were cancelled; refund.
+            raise
+
+    def record_usage(self, estimated: int, actual: int):
+        """Charge (or refund) the difference between estimate and real usage."""
+        self.used_tokens += actual
+        self.tokens -= actual - min(estimated, self.capacity)
+
+    def throttled(self, retry_after: Optional[float] = None):
+        """Backend returned 429: back off multiplicatively and pause admission."""
+        self.throttle_count += 1
+        now = time.monotonic()
+        self._refill(now)
+        self.rate = max(self.rate / 2, self.min_rate)
+        self.tokens = min(self.tokens, 0.0)
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+
+    def succeeded(self):
+        """Successful call: recover the refill rate additively."""
+        self._refill(time.monotonic())
+        self.rate = min(self.rate + self.max_rate / 20, self.max_rate)
+
+
+class ClientRateLimiter:
+    """
+    Per-client request limiter (one token bucket per key, e.g. client IP).
+    check() returns None when the request is admitted, else seconds to wait.
+    Idle buckets are dropped once full so the map stays bounded.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: Optional[int] = None, max_clients: int = 10000):
+        self.rate = requests_per_minute / 60
+        self.capacity = burst or max(1, int(requests_per_minute))
+        self.max_clients = max_clients
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, updated)
+
+    def check(self, key: str, cost: float = 1.0) -> Optional[float]:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (float(self.capacity), now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        if tokens < cost:
+            self._buckets[key] = (tokens, now)
+            return (cost - tokens) / self.rate
+        self._buckets[key] = (tokens - cost, now)
+        if len(self._buckets) > self.max_clients:
+            self._prune(now)
+        return None
+
+    def _prune(self, now: float):
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if tokens + (now - updated) * self.rate >= self.capacity:
+                del self._buckets[key]
@@ -0,0 +1,174 @@
+import asyncio
+import gzip
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli  # Optional: br variants are only written when installed.
+except ImportError:  # pragma: no cover
+    brotli = None
+
+MEDIA_TYPES = {"svg": "image/svg+xml", "png": "image/png"}
+COMPRESSIBLE = ("svg",)
+
+
+class RenderError(RuntimeError):
+    """mmdc failed, timed out or is not installed (message is safe to show)."""
+
+
+async def run_mmdc(
+    mermaid_text: str, fmt: str, timeout: float, semaphore: asyncio.Semaphore
+) -> Tuple[Optional[bytes], Optional[str]]:
+    """
+    Render with the mermaid CLI in a temp dir; kills the process on timeout.
+    Returns (image bytes, None) or (None, error).
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        inp = Path(tmpdir) / "diagram.mmd"
+        out = Path(tmpdir) / f"diagram.{fmt}"
+        inp.write_text(mermaid_text)
+        # Each mmdc boots headless Chromium, so cap how many run at once.
+        async with semaphore:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    "mmdc", "-i", str(inp), "-o", str(out),
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+            except FileNotFoundError:
+                return None, "mmdc not found on PATH"
+            try:
+                _, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                return None, f"mmdc timed out after {timeout:.0f}s"
+            except asyncio.CancelledError:
+                process.kill()
+                raise
+        if process.returncode == 0 and out.exists():
+            return out.read_bytes(), None
+        message = stderr.decode(errors="replace").strip()
+        return None, (message[-500:] or f"mmdc exited with code {process.returncode}")
+
+
+@dataclass
+class Artifact:
+    """A rendered diagram on disk; variants maps content-encoding ("" = identity) to path."""
+    etag: str
+    media_type: str
+    variants: Dict[str, str]
+
+    def pick(self, accept_encoding: str) -> Tuple[str, str]:
+        """(encoding, path) best matching an Accept-Encoding header."""
+        accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self.variants:
+                return encoding, self.variants[encoding]
+        return "", self.variants[""]
+
+
+class ArtifactCache:
+    """
+    Content-addressed store of rendered diagrams: <directory>/<sha256>.<fmt>,
+    plus .gz (and .br with the brotli package) for SVG, compressed once at
+    write time. The key covers the Mermaid text and format, so an artifact
+    never goes stale and its hash doubles as a strong ETag. Diagrams that
+    mmdc validation already rendered are stored via put(); anything else is
+    rendered on first request, with concurrent requests sharing one mmdc run.
+    Oldest files are pruned past max_files.
+    """
+
+    def __init__(
+        self, directory: str, timeout: float = 30.0,
+        semaphore: Optional[asyncio.Semaphore] = None, max_files: int = 5000,
+    ):
+        self.directory = directory
+        self.timeout = timeout
+        self.semaphore = semaphore or asyncio.Semaphore(2)
+        self.max_files = max_files
+        self._inflight: Dict[str, asyncio.Future] = {}
+        os.makedirs(directory, exist_ok=True)
+        self._count = len(os.listdir(directory))
+
+    @staticmethod
+    def key(mermaid_text: str, fmt: str) -> str:
+        return hashlib.sha256(f"{fmt}\0{mermaid_text}".encode()).hexdigest()
+
+    def _artifact(self, key: str, fmt: str) -> Optional[Artifact]:
+        path = os.path.join(self.directory, f"{key}.{fmt}")
+        if not os.path.exists(path):
+            return None
+        variants = {"": path}
+        for encoding, suffix in (("gzip", ".gz"), ("br", ".br")):
+            if os.path.exists(path + suffix):
+                variants[encoding] = path + suffix
+        return Artifact(etag=f'"{key[:32]}"', media_type=MEDIA_TYPES[fmt], variants=variants)
+
+    def _write(self, key: str, fmt: str, data: bytes) -> Artifact:
+        path = os.path.join(self.directory, f"{key}.{fmt}")
+        outputs = [(path, data)]
+        if fmt in COMPRESSIBLE:
+            outputs.append((path + ".gz", gzip.compress(data, 9, mtime=0)))
+            if brotli is not None:
+                outputs.append((path + ".br", brotli.compress(data)))
+        # Compressed variants first, so a visible identity file implies complete variants.
+        for target, payload in reversed(outputs):
+            tmp = f"{target}.tmp"
+            with open(tmp, "wb") as handle:
+                handle.write(payload)
+            os.replace(tmp, target)
+        self._count += len(outputs)
+        if self._count > self.max_files:
+            self._prune()
+        return self._artifact(key, fmt)
+
+    def _prune(self):
+        entries: List[os.DirEntry] = [entry for entry in os.scandir(self.directory) if entry.is_file()]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        excess = len(entries) - self.max_files * 3 // 4
+        for entry in entries[:max(excess, 0)]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        self._count = len(entries) - max(excess, 0)
+
+    async def put(self, mermaid_text: str, fmt: str, data: bytes):
+        key = self.key(mermaid_text, fmt)
+        if self._artifact(key, fmt) is None:
+            await asyncio.to_thread(self._write, key, fmt, data)
+
+    async def get(self, mermaid_text: str, fmt: str) -> Artifact:
+        """Cached artifact, rendering it first if needed; raises RenderError."""
+        if fmt not in MEDIA_TYPES:
+            raise ValueError(f"Unsupported format '{fmt}'")
+        key = self.key(mermaid_text, fmt)
+        artifact = self._artifact(key, fmt)
+        if artifact:
+            return artifact
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            data, error = await run_mmdc(mermaid_text, fmt, self.timeout, self.semaphore)
+            if data is None:
+                raise RenderError(error or "Render failed")
+            artifact = await asyncio.to_thread(self._write, key, fmt, data)
+        except BaseException as exc:
+            if isinstance(exc, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(exc)
+                future.exception()  # Mark retrieved when nobody was waiting.
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        future.set_result(artifact)
+        return artifact
@@ -0,0 +1,140 @@
+import re
+from typing import Callable, List, Optional, Tuple
+
+from .validator import SHAPES, MermaidSyntaxError, parse_flowchart
+
+MAX_LOCAL_FIXES = 25  # One fix per parse error; bounded so pathological input terminates.
+
+_NODE_MSG_RE = re.compile(r"node '(\w+)'")
+_RESERVED_RE = re.compile(r"Reserved word '(\w+)'")
+_OPENERS = "[({"
+_CLOSERS = "])}"
+
+
+def _label_span(line: str, node_id: str) -> Optional[Tuple[int, int, str, str]]:
+    """
+    (label start, label end, opener, closer) of node_id's shape on this line.
+    Brackets nested inside the label are skipped, so `B[call f(x)]` spans "call f(x)".
+    If the closer is missing the span runs to the next link or end of line.
+    """
+    for match in re.finditer(rf"(?<![\w\"]){re.escape(node_id)}(?!\w)", line):
+        pos = match.end()
+        opener, closer = next(((o, c) for o, c in SHAPES if line.startswith(o, pos)), (None, None))
+        if opener is None:
+            continue
+        start = pos + len(opener)
+        depth = 0
+        for i in range(start, len(line)):
+            if depth == 0 and line.startswith(closer, i):
+                return start, i, opener, closer
+            ch = line[i]
+            if ch in _OPENERS:
+                depth += 1
+            elif ch in _CLOSERS:
+                depth = max(depth - 1, 0)
+        link = re.search(r"\s(?:-->|---|-\.|==>|&)", line[start:])
+        end = start + link.start() if link else len(line.rstrip())
+        return start, end, opener, closer
+    return None
+
+
+def _quote_label(line: str, node_id: str) -> str:
+    """Wrap node_id's label in quotes (closing the shape if needed)."""
+    span = _label_span(line, node_id)
+    if span is None:
+        return line
+    start, end, _, closer = span
+    label = line[start:end].strip()
+    if len(label) > 1 and label[0] == label[-1] == '"':
+        label = label[1:-1]
+    label = label.replace('"', "#quot;")
+    rest = line[end:]
+    if not rest.startswith(closer):
+        rest = closer + rest
+    return f'{line[:start]}"{label}"{rest}'
+
+
+def _rename_id(lines: List[str], old: str) -> List[str]:
+    """Rename a reserved node id everywhere it is used as an id (not as `end` keyword lines)."""
+    new = f"{old}_"
+    pattern = re.compile(rf'(?<![\w"#]){re.escape(old)}(?![\w"])')
+    renamed = []
+    for line in lines:
+        stripped = line.strip()
+        if stripped == old or stripped.startswith(("subgraph ", "%%")):
+            renamed.append(line)
+            continue
+        out, last = [], 0
+        for match in pattern.finditer(line):
+            prefix = line[:match.start()]
+            # Leave occurrences inside labels alone.
+            depth = sum(prefix.count(ch) for ch in _OPENERS) - sum(prefix.count(ch) for ch in _CLOSERS)
+            if depth > 0 or prefix.count('"') % 2 or prefix.count("|") % 2:
+                continue
+            out.append(line[last:match.start()] + new)
+            last = match.end()
+        renamed.append("".join(out) + line[last:])
+    return renamed
+
+
+def _fix(lines: List[str], error: MermaidSyntaxError) -> Optional[List[str]]:
+    """Apply one targeted fix for a parse error; None if we don't know how."""
+    index = error.line - 1
+    message = error.message
+    reserved = _RESERVED_RE.search(message)
+    if reserved:
+        return _rename_id(lines, reserved.group(1))
+    node = _NODE_MSG_RE.search(message)
+    if node and 0 <= index < len(lines) and ("label of node" in message or "Unbalanced brackets" in message):
+        fixed = _quote_label(lines[index], node.group(1))
+        if fixed != lines[index]:
+            return lines[:index] + [fixed] + lines[index + 1:]
+        return None
+    if message.startswith("Unterminated string") and 0 <= index < len(lines):
+        return lines[:index] + [lines[index].replace('"', "")] + lines[index + 1:]
+    if message.startswith("Diagram must start"):
+        body = [line for line in lines if not line.strip().startswith("```") and line.strip() != "mermaid"]
+        return body if body != lines else ["flowchart TD"] + lines
+    if message == "Empty diagram":
+        return None
+    if message.startswith("'end' without matching"):
+        return lines[:index] + lines[index + 1:]
+    if "is missing 'end'" in message:
+        return lines + ["end"]
+    if message.startswith("Unknown direction") and 0 <= index < len(lines):
+        return lines[:index] + lines[index + 1:]
+    return None
+
+
+def repair_locally(mermaid_text: str, parse: Callable[[str], object] = parse_flowchart) -> Tuple[str, bool]:
+    """
+    Fix common LLM Mermaid mistakes without another model call, one parse
+    error at a time: unquoted labels containing brackets/quotes, missing
+    closing brackets, reserved ids such as `end`, stray fences/headers and
+    unbalanced subgraphs. Returns (text, parses_now).
+    """
+    lines = mermaid_text.strip().splitlines()
+    for _ in range(MAX_LOCAL_FIXES):
+        text = "\n".join(lines)
+        try:
+            parse(text)
+            return text, True
+        except MermaidSyntaxError as exc:
+            fixed = _fix(lines, exc)
+            if fixed is None or fixed == lines:
+                return text, False
+            lines = fixed
+    return "\n".join(lines), False
+
+
+class RepairBudget:
+    """LLM re-prompts left for one job (shared by all of its functions)."""
+
+    def __init__(self, limit: int):
+        self.remaining = limit
+
+    def take(self) -> bool:
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
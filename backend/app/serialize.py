@@ -0,0 +1,185 @@
+import itertools
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import orjson
+
+from .compression import compress
+from .models import JobState, function_dict
+
+# API field name -> JobState attribute, in response order.
+SUMMARY_FIELDS = {
+    "id": "id",
+    "status": "status",
+    "totalFunctions": "total_functions",
+    "processedFunctions": "processed_functions",
+    "createdAt": "created_at",
+    "updatedAt": "updated_at",
+    "batchId": "batch_id",
+    "path": "path",
+    "mode": "mode",
+    "parentId": "parent_id",
+    "revision": "revision",
+}
+DETAIL_FIELDS = {
+    **SUMMARY_FIELDS,
+    "code": "code",
+    "error": "error",
+    "functions": "functions",
+    "partialFunctions": "partial_functions",
+    "sourceTokens": "source_tokens",
+    "reducedTokens": "reduced_tokens",
+}
+
+
+def dumps(value: Any) -> bytes:
+    """orjson encoding; naive datetimes come out as isoformat(), as with Pydantic."""
+    return orjson.dumps(value)
+
+
+def _value(job: JobState, attribute: str) -> Any:
+    value = getattr(job, attribute)
+    if attribute == "functions":
+        return [function_dict(func) for func in value]
+    if attribute == "partial_functions":
+        return dict(value)
+    return value
+
+
+def summary_dict(job: JobState) -> Dict[str, Any]:
+    """JobSummaryResponse as a plain dict (camelCase keys), without building the model."""
+    return {name: getattr(job, attribute) for name, attribute in SUMMARY_FIELDS.items()}
+
+
+def detail_dict(job: JobState, fields: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
+    """JobDetailResponse as a plain dict; fields (API names) selects a subset."""
+    names = fields or DETAIL_FIELDS
+    return {name: _value(job, DETAIL_FIELDS[name]) for name in names}
+
+
+def parse_fields(raw: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """
+    ?fields=id,status,functions -> ("id", "status", "functions"), in response order.
+    None/empty means every field. Raises ValueError naming unknown fields.
+    """
+    if not raw:
+        return None
+    requested = {name.strip() for name in raw.split(",") if name.strip()}
+    unknown = requested - DETAIL_FIELDS.keys()
+    if unknown:
+        raise ValueError(", ".join(sorted(unknown)))
+    return tuple(name for name in DETAIL_FIELDS if name in requested) or None
+
+
+@dataclass
+class Body:
+    """A serialized response body plus its compressed variants (made on first use)."""
+    etag: str
+    data: bytes
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+    # Told the size of each new compressed variant (BodyCache byte accounting).
+    on_grow: Optional[Callable[[int], None]] = field(default=None, repr=False)
+
+    @property
+    def size(self) -> int:
+        return len(self.data) + sum(len(data) for data in self.encoded.values())
+
+    def encode(self, encoding: str) -> bytes:
+        if not encoding:
+            return self.data
+        if encoding not in self.encoded:
+            self.encoded[encoding] = compress(self.data, encoding)
+            if self.on_grow:
+                self.on_grow(len(self.encoded[encoding]))
+        return self.encoded[encoding]
+
+
+class BodyCache:
+    """
+    LRU (by job) of serialized job bodies, one per variant ("summary",
+    "detail", or a ?fields= selection), so unchanged jobs are not
+    re-serialized or re-compressed on every poll.
+
+    ETags derive from updated_at, so entries written by another process
+    (shared queue) are detected as stale without any invalidation message.
+    Streaming partials change the detail body without touching updated_at;
+    invalidate(partial=True) bumps a per-job revision that goes into the ETag.
+
+    Detail bodies hold the code and every diagram, so besides max_jobs the
+    cache is bounded by max_bytes (bodies plus compressed variants); a body
+    larger than that on its own is served but not kept.
+    """
+
+    def __init__(self, max_jobs: int = 2000, max_bytes: int = 0):
+        self.max_jobs = max_jobs
+        self.max_bytes = max_bytes  # 0 = no byte limit.
+        self.bytes = 0
+        self._bodies: "OrderedDict[str, Dict[str, Body]]" = OrderedDict()
+        self._revisions: Dict[str, int] = {}  # Only jobs with live partials.
+        self._counter = itertools.count(1)
+
+    def etag(self, job: JobState, variant: str) -> str:
+        stamp = int(job.updated_at.timestamp() * 1_000_000)
+        tag = zlib.crc32(variant.encode())
+        return f'"{stamp:x}-{self._revisions.get(job.id, 0)}-{tag:08x}"'
+
+    def lookup(self, job: JobState, variant: str) -> Optional[Body]:
+        bodies = self._bodies.get(job.id)
+        body = bodies.get(variant) if bodies else None
+        if body is None or body.etag != self.etag(job, variant):
+            return None
+        self._bodies.move_to_end(job.id)
+        return body
+
+    def store(self, job_id: str, variant: str, etag: str, data: bytes) -> Body:
+        body = Body(etag, data)
+        if self.max_jobs <= 0 or (self.max_bytes and len(data) > self.max_bytes):
+            return body
+        bodies = self._bodies.setdefault(job_id, {})
+        replaced = bodies.get(variant)
+        if replaced is not None:
+            self.bytes -= replaced.size
+        bodies[variant] = body
+        self.bytes += body.size
+        body.on_grow = lambda size: self._grow(job_id, body, size)
+        self._bodies.move_to_end(job_id)
+        self._evict(keep=job_id)
+        return body
+
+    def _grow(self, job_id: str, body: Body, size: int):
+        bodies = self._bodies.get(job_id)
+        if bodies is None or not any(cached is body for cached in bodies.values()):
+            return  # Already evicted or replaced.
+        self.bytes += size
+        self._evict(keep=job_id)
+
+    def _evict(self, keep: str):
+        """Drop least recently used jobs past max_jobs / max_bytes (never keep, the one just used)."""
+        while len(self._bodies) > self.max_jobs or (self.max_bytes and self.bytes > self.max_bytes):
+            oldest = next(iter(self._bodies))
+            if oldest == keep:
+                break
+            self._drop(oldest)
+
+    def _drop(self, job_id: str):
+        bodies = self._bodies.pop(job_id, None)
+        if bodies:
+            self.bytes -= sum(body.size for body in bodies.values())
+
+    def get(self, job: JobState, variant: str, build: Callable[[], bytes]) -> Body:
+        """Cached body for the job's current state, else build() and cache it."""
+        return self.lookup(job, variant) or self.store(job.id, variant, self.etag(job, variant), build())
+
+    def invalidate(self, job_id: str, partial: bool = False):
+        """
+        Drop a job's bodies. partial=True: the change did not bump updated_at,
+        so give the job a fresh revision; otherwise updated_at changed and the
+        revision can go (it only has to differ from earlier ETags of this job).
+        """
+        self._drop(job_id)
+        if partial:
+            self._revisions[job_id] = next(self._counter)
+        else:
+            self._revisions.pop(job_id, None)
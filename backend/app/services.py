@@ -1,184 +1,1045 @@
 import asyncio
-import tempfile
+import hashlib
+import math
+import time
+import tarfile
 import uuid
+from dataclasses import replace
 from datetime import datetime
-from pathlib import Path
-from typing import Dict, List
+from typing import Awaitable, BinaryIO, Callable, Dict, List, Optional, Tuple
 
 from fastapi import HTTPException
 
-from .llm import LLMClient
-from .models import FunctionResult, JobState, JobStatus
-# from .websockets import manager
+from . import metrics
+from .batching import MicroBatcher
+from .blobs import BlobStore
+from .cache import CachedFlowchart, cache_key, flowchart_cache
+from .config import settings
+from .cparser import CFunction, split_functions
+from .flowgen import FlowgenError, complexity, generate_flowchart
+from .llm import LLMClient, LLMError, MalformedMermaidError
+from .models import BatchState, FunctionResult, JobState, JobStatus, function_dict, to_changes
+from .queueing import Lease, create_queue
+from .preprocess import preprocess_unit, reduce_function
+from .ratelimit import ClientRateLimiter, TokenBudgetScheduler
+from .render import Artifact, ArtifactCache, RenderError
+from .repair import RepairBudget, repair_locally
+from .serialize import Body, BodyCache, detail_dict, dumps, summary_dict
+from .simplify import Part, Simplified, simplify_mermaid
+from .store import TERMINAL_STATUSES, JobPage, JobQuery, JobStore, create_store, decode_cursor, retention_policy
+from .validator import MermaidValidator
+from .websockets import manager
 
-jobs: Dict[str, JobState] = {}  # In-memory; restart loses state.
-
-job_queue: "asyncio.Queue[str]" = asyncio.Queue()  # Single consumer worker; add concurrency if needed.
+job_store: JobStore = create_store(shared=settings.queue_backend != "memory")
+# Shared by all pool consumers.
+job_queue = create_queue(settings.batch_interactive_weight, settings.job_priority_aging)
 jobs_lock = asyncio.Lock()
-llm_client = LLMClient()
-worker_task: asyncio.Task | None = None
+llm_semaphore = asyncio.Semaphore(settings.llm_concurrency)
+llm_scheduler = TokenBudgetScheduler(settings.llm_tokens_per_minute) if settings.llm_tokens_per_minute > 0 else None
+llm_client = LLMClient(scheduler=llm_scheduler, semaphore=llm_semaphore)
+llm_batcher = (
+    MicroBatcher(
+        llm_client, max_size=settings.llm_microbatch_max_size, max_tokens=settings.llm_microbatch_max_tokens,
+        max_delay=settings.llm_microbatch_delay, snippet_tokens=settings.llm_microbatch_snippet_tokens,
+    )
+    if settings.llm_microbatch_max_size > 1 else None
+)
+client_limiter = (
+    ClientRateLimiter(settings.client_jobs_per_minute, burst=settings.client_jobs_burst)
+    if settings.client_jobs_per_minute > 0 else None
+)
+mmdc_semaphore = asyncio.Semaphore(settings.mmdc_concurrency)
+render_cache = ArtifactCache(
+    settings.render_cache_dir, timeout=settings.mmdc_timeout, semaphore=mmdc_semaphore,
+    max_files=settings.render_cache_max_files,
+)
+mermaid_validator = MermaidValidator(
+    settings.mermaid_validator, timeout=settings.mmdc_timeout, semaphore=mmdc_semaphore, artifacts=render_cache
+)
+worker_tasks: List[asyncio.Task] = []
+# Job id -> (process_job task, lease) for jobs this process is running; cancel_job() uses it.
+running_jobs: Dict[str, Tuple[asyncio.Task, Lease]] = {}
+retention = retention_policy()
+blob_store = BlobStore(settings.job_blob_dir, settings.job_blob_min_bytes) if settings.job_blob_dir else None
+body_cache = BodyCache(settings.response_cache_jobs, settings.response_cache_bytes)
+retention_task: Optional[asyncio.Task] = None
+change_feed_task: Optional[asyncio.Task] = None
+
+
+def _ratio(numerator: float, denominator: float) -> float:
+    return numerator / denominator if denominator else 0.0
+
+
+def workers_alive() -> int:
+    return sum(1 for task in worker_tasks if not task.done())
+
+
+# Scrape-time views of live state.
+metrics.registry.gauge("h2loop_queue_depth", "Jobs waiting in the queue.", callback=lambda: job_queue.qsize())
+metrics.registry.gauge(
+    "h2loop_queue_oldest_wait_seconds", "Age of the longest-waiting queued job.", callback=lambda: job_queue.oldest_wait()
+)
+metrics.registry.gauge("h2loop_workers_alive", "Worker pool consumers running.", callback=lambda: workers_alive())
+metrics.registry.gauge(
+    "h2loop_llm_circuit_open", "1 while the LLM circuit breaker rejects calls.",
+    callback=lambda: float(llm_client.breaker.state == "open"),
+)
+metrics.registry.counter(
+    "h2loop_flowchart_cache_hits_total", "Flowchart cache hits (incl. coalesced).", callback=lambda: flowchart_cache.hits
+)
+metrics.registry.counter(
+    "h2loop_flowchart_cache_misses_total", "Flowchart cache misses.", callback=lambda: flowchart_cache.misses
+)
+metrics.registry.gauge(
+    "h2loop_flowchart_cache_hit_ratio", "Cache hits / lookups since start.",
+    callback=lambda: _ratio(flowchart_cache.hits, flowchart_cache.hits + flowchart_cache.misses),
+)
+metrics.registry.gauge(
+    "h2loop_validation_failure_ratio", "Invalid / total Mermaid validations since start.",
+    callback=lambda: _ratio(
+        metrics.validations.get(result="invalid"),
+        metrics.validations.get(result="invalid") + metrics.validations.get(result="valid"),
+    ),
+)
+
+
+def readiness() -> Tuple[bool, List[str]]:
+    """
+    Ready unless the pool is degraded or the backlog is past READY_* thresholds.
+    Returns (ready, reasons) for the /ready probe.
+    """
+    reasons = []
+    alive = workers_alive()
+    if settings.run_workers and alive < max(settings.worker_concurrency, 1):
+        reasons.append(f"{alive}/{max(settings.worker_concurrency, 1)} workers alive")
+    if job_queue.qsize() > settings.ready_max_queue_depth:
+        reasons.append(f"queue depth {job_queue.qsize()} > {settings.ready_max_queue_depth}")
+    if job_queue.oldest_wait() > settings.ready_max_queue_wait:
+        reasons.append(
+            f"oldest queued job waiting {job_queue.oldest_wait():.0f}s > {settings.ready_max_queue_wait:.0f}s"
+        )
+    return not reasons, reasons
 
 
 def _now() -> datetime:
     return datetime.utcnow()
 
 
-async def enqueue_job(code: str) -> JobState:
+def job_priority(code: str) -> int:
+    """Priority class by submission size (0 = served first); see JOB_PRIORITY_*."""
+    if len(code) <= settings.job_priority_small_bytes:
+        return 0
+    return 1 if len(code) <= settings.job_priority_large_bytes else 2
+
+
+async def enqueue_job(
+    code: str, mode: str = "auto", idempotency_key: Optional[str] = None, parent: Optional[JobState] = None
+) -> Tuple[JobState, bool]:
     """
     Create and enqueue a new job for processing.
-    Returns JobState immediately; worker picks up from queue.
-    NOTE: Jobs stored in-memory only; restart will lose all jobs.
-    TODO: Add persistence layer (DB/Redis) for durability.
+    Returns (job, replayed) once the store has accepted it; worker picks up from queue.
+    mode: auto | llm | local (see GenerationMode).
+    parent: previous revision of this code (see revise_job).
+    With an idempotency_key, a repeat of the same request within
+    IDEMPOTENCY_KEY_TTL returns the original job (replayed=True) instead of
+    creating and paying for a duplicate. Reusing a key for a different
+    request raises HTTPException(422).
     """
     job_id = uuid.uuid4().hex
-    job = JobState(id=job_id, code=code, status=JobStatus.SUBMITTED)
-    async with jobs_lock:
-        jobs[job_id] = job
-    await job_queue.put(job_id)
-    return job
+    if idempotency_key:
+        request = f"{parent.id}\0{mode}\0{code}" if parent else f"{mode}\0{code}"
+        fingerprint = hashlib.sha256(request.encode()).hexdigest()
+        existing = await job_store.claim_idempotency_key(
+            idempotency_key, fingerprint, job_id, settings.idempotency_key_ttl
+        )
+        if existing:
+            existing_id, existing_fingerprint = existing
+            if existing_fingerprint != fingerprint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+            job = await job_store.get(existing_id)
+            if job:
+                return job, True
+            # The original job is gone (evicted, or never stored): start afresh.
+            await job_store.forget_idempotency_key(idempotency_key)
+            return await enqueue_job(code, mode, idempotency_key, parent)
+    job = JobState(id=job_id, code=code, status=JobStatus.SUBMITTED, mode=mode)
+    if parent:
+        job.parent_id, job.revision, job.path = parent.id, parent.revision + 1, parent.path
+    await job_store.add(job)
+    manager.publish_changes(job, to_changes(job, ["status"]))
+    await job_queue.put(job_id, priority=job_priority(code))
+    metrics.jobs_submitted.inc(lane="interactive")
+    return job, False
 
 
-async def list_jobs() -> List[JobState]:
+async def revise_job(
+    job_id: str, code: str, mode: Optional[str] = None, idempotency_key: Optional[str] = None
+) -> Tuple[JobState, bool]:
     """
-    Return all jobs from in-memory store.
-    TODO: Add filtering by status, pagination, and sorting options.
+    Submit an edited version of a job's code as its next revision: a new job
+    with parent_id=job_id (the parent is left untouched). When it runs, the
+    functions whose source is unchanged since the parent (modulo comments and
+    whitespace) reuse the parent's validated results; only the rest are
+    generated and validated. mode defaults to the parent's.
+    Raises HTTPException(404) if job_id is unknown.
     """
-    async with jobs_lock:
-        return list(jobs.values())
+    parent = await job_store.get(job_id)
+    if not parent:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await enqueue_job(code, mode or parent.mode, idempotency_key, parent)
+
+
+async def enqueue_batch(
+    files: List[Tuple[str, str]], mode: str = "auto"
+) -> Tuple[BatchState, List[JobState]]:
+    """
+    Create one job per (path, code) pair with a single bulk store write and
+    queue them on the batch lane, which the worker pool serves fairly
+    against interactive submissions. Within the batch, smaller files are
+    queued first so results start arriving sooner.
+    """
+    batch = BatchState(id=uuid.uuid4().hex)
+    jobs = [
+        JobState(
+            id=uuid.uuid4().hex, code=code, status=JobStatus.SUBMITTED,
+            batch_id=batch.id, path=path, mode=mode,
+        )
+        for path, code in files
+    ]
+    batch.job_ids = [job.id for job in jobs]
+    await job_store.add_batch(batch)
+    await job_store.add_many(jobs)
+    # One list refresh instead of a summary event per job.
+    manager.publish_resync()
+    await job_queue.put_many([job.id for job in sorted(jobs, key=lambda job: len(job.code))], batch_id=batch.id)
+    metrics.jobs_submitted.inc(len(jobs), lane="batch")
+    return batch, jobs
+
+
+def extract_tar_sources(fileobj: BinaryIO) -> List[Tuple[str, str]]:
+    """
+    Read (path, code) pairs for BATCH_EXTENSIONS files from a tar archive
+    (plain or compressed). Blocking; run in a thread. Enforces MAX_BATCH_FILES.
+    """
+    files = []
+    with tarfile.open(fileobj=fileobj, mode="r:*") as archive:
+        for member in archive:
+            if not member.isfile() or not member.name.endswith(settings.batch_extensions):
+                continue
+            if len(files) >= settings.max_batch_files:
+                raise HTTPException(status_code=413, detail=f"More than {settings.max_batch_files} files")
+            handle = archive.extractfile(member)
+            code = handle.read().decode("utf-8", errors="replace") if handle else ""
+            if code.strip():
+                files.append((member.name, code))
+    return files
+
+
+def check_client_rate(client_id: str):
+    """Per-client admission for job submission; 429 with Retry-After when over the limit."""
+    if client_limiter is None:
+        return
+    retry_after = client_limiter.check(client_id)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many job submissions; slow down",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+async def get_batch(batch_id: str) -> Tuple[BatchState, Dict[str, int]]:
+    """
+    Retrieve a batch and its per-status job counts.
+    Raises HTTPException(404) if not found.
+    """
+    batch = await job_store.get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    counts = await job_store.batch_counts(batch_id)
+    evicted = len(batch.job_ids) - sum(counts.values())
+    if evicted > 0:
+        counts[JobStatus.EVICTED] = evicted
+    return batch, counts
+
+
+async def list_jobs(query: JobQuery) -> JobPage:
+    """
+    Return one page of jobs from the store's secondary indexes.
+    Supports status filter, created_at/updated_at sort, cursors and since= deltas.
+    """
+    return await job_store.query(query)
+
+
+def jobs_version() -> int:
+    """Store write counter; changes whenever any job changes (list ETags)."""
+    return job_store.version
 
 
 async def get_job(job_id: str) -> JobState:
     """
     Retrieve a single job by ID.
-    Raises HTTPException(404) if not found in memory.
+    Raises HTTPException(404) if not found in the store.
+    Offloaded jobs come back as a hydrated copy (blobs read from disk); the
+    resident instance stays compact.
     """
-    async with jobs_lock:
-        job = jobs.get(job_id)
+    job = await job_store.get(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
+    if job.offloaded and blob_store:
+        return await asyncio.to_thread(blob_store.load, job) or job
     return job
 
 
+async def job_body(
+    job_id: str, fields: Optional[Tuple[str, ...]] = None, if_none_match: Optional[str] = None
+) -> Tuple[str, Optional[Body]]:
+    """
+    Serialized detail payload (GET /api/jobs/{id}) as (etag, body).
+    body is None when if_none_match already names the current state (304).
+    Bodies come from body_cache while the job is unchanged; offloaded blobs
+    are only read back from disk on a miss, and only if the fields need them.
+    Raises HTTPException(404) if not found.
+    """
+    job = await job_store.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    variant = ",".join(fields) if fields else "detail"
+    etag = body_cache.etag(job, variant)
+    if if_none_match == etag:
+        return etag, None
+    body = body_cache.lookup(job, variant)
+    if body is None:
+        source = job
+        if job.offloaded and blob_store and (not fields or {"code", "functions"} & set(fields)):
+            source = await asyncio.to_thread(blob_store.load, job) or job
+        body = body_cache.store(job_id, variant, etag, dumps(detail_dict(source, fields)))
+    return etag, body
+
+
+def summaries_body(jobs: List[JobState]) -> bytes:
+    """JSON array of job summaries, each reused from body_cache when unchanged."""
+    parts = [
+        body_cache.get(job, "summary", lambda job=job: dumps(summary_dict(job))).data for job in jobs
+    ]
+    return b"[" + b",".join(parts) + b"]"
+
+
+async def render_function(job_id: str, name: str, fmt: str) -> Artifact:
+    """
+    Rendered diagram of one function's flowchart (svg or png) from render_cache;
+    the summary for diagrams that have one.
+    Raises HTTPException: 404 unknown job/function or no diagram yet,
+    503 if mmdc is unavailable, 422 if it cannot render the diagram.
+    """
+    job = await get_job(job_id)
+    func = next((func for func in job.functions if func.name == name), None)
+    if func is None or not func.mermaid:
+        raise HTTPException(status_code=404, detail="Function diagram not found")
+    return await _render(func.summary or func.mermaid, fmt)
+
+
+async def _render(mermaid_text: str, fmt: str) -> Artifact:
+    try:
+        return await render_cache.get(mermaid_text, fmt)
+    except RenderError as exc:
+        status = 503 if "not found" in str(exc) or "timed out" in str(exc) else 422
+        raise HTTPException(status_code=status, detail=str(exc))
+
+
+async def function_part(job_id: str, name: str, part_id: str) -> Part:
+    """
+    Detail diagram behind a folded step of a function's summary, rebuilt from
+    the full diagram (simplify_mermaid is deterministic and cached).
+    Raises HTTPException 404 for unknown jobs, functions without a summary and unknown parts.
+    """
+    job = await get_job(job_id)
+    func = next((func for func in job.functions if func.name == name), None)
+    if func is None or not func.summary:
+        raise HTTPException(status_code=404, detail="Function has no summary diagram")
+    simplified = await _simplified(func.mermaid)
+    part = simplified.parts.get(part_id) if simplified else None
+    if part is None:
+        raise HTTPException(status_code=404, detail="Diagram part not found")
+    return part
+
+
+async def render_function_part(job_id: str, name: str, part_id: str, fmt: str) -> Artifact:
+    """Rendered part diagram (see render_function for errors)."""
+    part = await function_part(job_id, name, part_id)
+    return await _render(part.mermaid, fmt)
+
+
+async def cancel_job(job_id: str) -> Tuple[JobState, bool]:
+    """
+    Cancel a queued or running job (DELETE /api/jobs/{id}).
+    A running job's task is cancelled, which aborts its in-flight LLM streams
+    and kills its mmdc processes; functions finished before that are kept.
+    Returns (job, done). done is False when a worker in another process holds
+    the job: its next lease check (QUEUE_CANCEL_CHECK_INTERVAL) stops it.
+    Raises HTTPException: 404 unknown job, 409 if it already finished.
+    """
+    job = await get_job(job_id)
+    if job.status == JobStatus.CANCELLED:
+        return job, True
+    if job.status in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    running = running_jobs.get(job_id)
+    if running:
+        task, lease = running
+        lease.cancelled = True
+        task.cancel()
+        await asyncio.wait({task})
+    elif await job_queue.cancel(job_id) == "leased":
+        return job, False
+    # Not running here and no longer queued (or never handed to a worker):
+    # the status alone stops it, since process_job skips cancelled jobs.
+    await _mark_cancelled(job_id)
+    return await get_job(job_id), True
+
+
+async def _mark_cancelled(job_id: str):
+    job = await job_store.get(job_id)
+    if job is None or job.status in TERMINAL_STATUSES:
+        return
+    print(f"[Job {job_id}] Cancelled")
+    await update_job(job_id, status=JobStatus.CANCELLED, partial_functions={})
+    metrics.jobs_finished.inc(status=JobStatus.CANCELLED)
+
+
 async def update_job(job_id: str, **kwargs):
     """
     Update job fields and timestamp; intended for status transitions.
-    TODO: Wire broadcast once WebSocket endpoint is enabled.
+    The store batches the write, so frequent transitions stay cheap.
+    Push subscribers receive only the fields that actually changed.
     TODO: Add validation for allowed status transitions.
     """
     async with jobs_lock:
-        job = jobs.get(job_id)
+        job = await job_store.get(job_id)
         if not job:
             return
+        changed = [key for key, value in kwargs.items() if getattr(job, key) != value]
         for key, value in kwargs.items():
             setattr(job, key, value)
         job.updated_at = _now()
-        # TODO: Wire broadcast once WebSocket endpoint is enabled.
-        # manager.broadcast_job(job)
+        await job_store.save(job)
+        body_cache.invalidate(job_id)
+        if manager.has_subscribers(job_id):
+            manager.publish_changes(job, to_changes(job, changed + ["updated_at"]))
+
+
+async def append_function_result(job_id: str, result: FunctionResult):
+    """
+    Append one finished function to a job and bump processed_functions.
+    Subscribers get just the new entry plus its index (functionsOffset).
+    """
+    async with jobs_lock:
+        job = await job_store.get(job_id)
+        if not job:
+            return
+        job.functions.append(result)
+        job.processed_functions = len(job.functions)
+        job.updated_at = _now()
+        had_partial = job.partial_functions.pop(result.name, None) is not None
+        await job_store.save(job)
+        body_cache.invalidate(job_id)
+        if manager.has_subscribers(job_id):
+            names = ["processed_functions", "updated_at"] + (["partial_functions"] if had_partial else [])
+            changes = to_changes(job, names)
+            changes["functionsAppended"] = [function_dict(result)]
+            changes["functionsOffset"] = len(job.functions) - 1
+            manager.publish_changes(job, changes)
+
 
-async def validate_mermaid(mermaid_text: str) -> bool:
+async def set_partial_flowchart(job_id: str, name: str, mermaid: str):
     """
-    Validate Mermaid syntax using mmdc CLI (async subprocess).
-    Returns False on any error (missing CLI, parse error, etc).
-    NOTE: Silently fails; stderr not surfaced to caller.
-    TODO: Capture and return stderr for debugging parse errors.
-    TODO: Add timeout to prevent long-running validations.
+    Expose a function's streaming diagram-so-far (detail view and job channel
+    only; list subscribers are not notified). Cleared when the result lands.
     """
+    job = await job_store.get(job_id)
+    if not job:
+        return
+    job.partial_functions[name] = mermaid
+    body_cache.invalidate(job_id, partial=True)
+    if manager.subscribers.get(job_id):
+        manager.publish_changes(job, to_changes(job, ["partial_functions"]), list_summary=False)
+
+
+async def init_store():
+    """
+    Open the job store from lifespan startup and requeue jobs that a previous
+    process left unfinished (durable stores only).
+    With a shared queue, other processes may be mid-job, so nothing is reset:
+    leases of crashed workers lapse and those jobs are redelivered. Only
+    SUBMITTED jobs missing from the queue (crash between store write and
+    enqueue) are re-added, which put() makes idempotent.
+    """
+    await job_store.start()
+    await job_queue.start()
+    if job_queue.durable:
+        requeued = await _requeue_submitted()
+        if requeued:
+            print(f"[Store] Re-enqueued {requeued} submitted jobs")
+    else:
+        recovered = await job_store.recover()
+        for job_id in recovered:
+            job = await job_store.get(job_id)
+            if job:
+                await job_queue.put(job_id, batch_id=job.batch_id, priority=job_priority(job.code))
+        if recovered:
+            print(f"[Store] Requeued {len(recovered)} unfinished jobs")
+    global retention_task, change_feed_task
+    if retention.enabled and (retention_task is None or retention_task.done()):
+        retention_task = asyncio.create_task(_retention_loop())
+    if job_queue.durable and (change_feed_task is None or change_feed_task.done()):
+        change_feed_task = asyncio.create_task(_change_feed_loop())
+
+
+async def close_store():
+    """Stop background loops, then close the queue and flush and close the job store."""
+    global retention_task, change_feed_task
+    for task in (retention_task, change_feed_task):
+        if task:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    retention_task = change_feed_task = None
+    await job_queue.close()
+    await job_store.close()
+
+
+async def _requeue_submitted() -> int:
+    count, after = 0, None
+    while True:
+        page = await job_store.query(
+            JobQuery(status=JobStatus.SUBMITTED, sort="created_at", descending=False, limit=500, after=after)
+        )
+        for job in page.jobs:
+            await job_queue.put(job.id, batch_id=job.batch_id, priority=job_priority(job.code))
+        count += len(page.jobs)
+        if not page.next_cursor:
+            return count
+        after = decode_cursor(page.next_cursor)
+
+
+# Everything a worker process changes on a job (partial diagrams stay process-local).
+_FEED_FIELDS = ["status", "total_functions", "processed_functions", "functions", "error", "updated_at"]
+
+
+async def _change_feed_loop():
+    """
+    Shared queue: jobs run in other processes, so their update_job() calls
+    never reach this process's subscribers. Poll the store's since= index and
+    push each changed job to its WebSocket/SSE subscribers.
+    """
+    since = _now()
+    while True:
+        await asyncio.sleep(settings.change_feed_interval)
+        try:
+            if not manager.subscribers:
+                since = _now()
+                continue
+            page = await job_store.query(JobQuery(since=since, limit=500))
+            for job in page.jobs:
+                if manager.has_subscribers(job.id):
+                    fields = _FEED_FIELDS
+                    if job.offloaded:
+                        # Stored rows hold stripped diagrams; never push those as blanks.
+                        loaded = await asyncio.to_thread(blob_store.load, job) if blob_store else None
+                        if loaded is None:
+                            fields = [name for name in _FEED_FIELDS if name != "functions"]
+                        job = loaded or job
+                    manager.publish_changes(job, to_changes(job, fields))
+                since = max(since, job.updated_at)
+        except Exception as exc:
+            print(f"[Store] Change feed failed: {exc}")
+
+
+async def enforce_retention() -> List[str]:
+    """Evict finished jobs beyond the retention policy and drop their blobs."""
+    evicted = await job_store.enforce_retention(retention)
+    if evicted:
+        if blob_store:
+            await asyncio.to_thread(lambda: [blob_store.delete(job_id) for job_id in evicted])
+        metrics.jobs_evicted.inc(len(evicted))
+        manager.publish_resync()
+        print(f"[Store] Evicted {len(evicted)} finished jobs")
+    return evicted
+
+
+async def _retention_loop():
+    while True:
+        await asyncio.sleep(settings.retention_interval)
+        try:
+            await enforce_retention()
+        except Exception as exc:
+            print(f"[Store] Retention sweep failed: {exc}")
+
+
+async def _offload(job: JobState):
+    """Move a finished job's large blobs to disk (no-op without JOB_BLOB_DIR)."""
+    if blob_store is None or job.status not in TERMINAL_STATUSES:
+        return
+    if not blob_store.should_offload(job):
+        return
     try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            inp = Path(tmpdir) / "diagram.mmd"
-            out = Path(tmpdir) / "diagram.svg"
-            inp.write_text(mermaid_text)
-            
-            # Use asyncio subprocess for non-blocking execution
-            process = await asyncio.create_subprocess_exec(
-                "mmdc", "-i", str(inp), "-o", str(out),
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            await process.communicate()
-            return process.returncode == 0
-    except FileNotFoundError:
-        return False
-    except Exception:
+        await asyncio.to_thread(blob_store.write, job)
+    except OSError as exc:
+        print(f"[Job {job.id}] Blob offload failed: {exc}")
+        return
+    blob_store.strip(job)
+    await job_store.save(job)
+
+
+async def _simplified(mermaid_text: str) -> Optional[Simplified]:
+    """simplify_mermaid off the event loop (large diagrams take a while to parse and fold)."""
+    if settings.diagram_max_nodes <= 0 or not mermaid_text:
+        return None
+    return await asyncio.to_thread(simplify_mermaid, mermaid_text, settings.diagram_max_nodes)
+
+
+async def _with_summary(result: FunctionResult) -> FunctionResult:
+    """Attach the summary diagram when a validated diagram has more than DIAGRAM_MAX_NODES nodes."""
+    if not result.validated:
+        return result
+    simplified = await _simplified(result.mermaid)
+    if simplified is None:
+        return result
+    metrics.diagrams_simplified.inc()
+    return replace(result, summary=simplified.summary)
+
+
+async def validate_mermaid(mermaid_text: str) -> Tuple[bool, Optional[str]]:
+    """
+    Validate Mermaid syntax via the shared MermaidValidator.
+    Returns (valid, error); error carries the parse error or mmdc stderr.
+    Defaults to the in-process parser, so no subprocess per diagram.
+    """
+    started = time.perf_counter()
+    if settings.mermaid_validator != "local":
+        # Large diagrams are checked (and rendered) through their summary.
+        simplified = await _simplified(mermaid_text)
+        if simplified is not None:
+            mermaid_text = simplified.summary
+    valid, error = await mermaid_validator.validate(mermaid_text)
+    metrics.stage_seconds.observe(time.perf_counter() - started, stage="validation")
+    metrics.validations.inc(result="valid" if valid else "invalid")
+    return valid, error
+
+
+async def _generate_flowchart(
+    job_id: str,
+    name: str,
+    code: str,
+    on_generated: Callable[[], Awaitable[None]],
+    deadline: float,
+    batch: bool = False,
+    budget: Optional[RepairBudget] = None,
+) -> CachedFlowchart:
+    """
+    Run LLM generation + Mermaid validation (+ repair) for one function on a
+    cache miss; on_generated fires once the LLM step is done, and retries stop
+    at deadline (event loop time). Partial diagrams are pushed as they stream;
+    small functions may share a call through llm_batcher.
+    """
+    print(f"[Job {job_id}] Generating flowchart for {name} with LLM...")
+    last_push = 0.0
+
+    async def on_partial(mermaid: str):
+        nonlocal last_push
+        now = asyncio.get_running_loop().time()
+        if now - last_push >= settings.partial_update_interval:
+            last_push = now
+            await set_partial_flowchart(job_id, name, mermaid)
+
+    started = time.perf_counter()
+    generate = llm_batcher.generate if llm_batcher and llm_batcher.accepts(code) else llm_client.generate_from_code
+    try:
+        mermaid = await generate(
+            code, deadline=deadline, batch=batch, on_partial=on_partial,
+            abort_malformed=settings.mermaid_validator != "mmdc",
+        )
+    except MalformedMermaidError as exc:
+        print(f"[Job {job_id}] {exc}")
+        await on_generated()
+        # A truncated prefix could be "fixed" into a valid but incomplete diagram: LLM only.
+        return await _repair_flowchart(
+            job_id, name, code, exc.partial, str(exc), deadline, batch, budget, local=False
+        )
+    finally:
+        metrics.stage_seconds.observe(time.perf_counter() - started, stage="llm")
+    await on_generated()
+
+    print(f"[Job {job_id}] Validating Mermaid syntax for {name}...")
+    valid, error = await validate_mermaid(mermaid)
+    if valid:
+        return CachedFlowchart(mermaid=mermaid, validated=True, error=None)
+    return await _repair_flowchart(job_id, name, code, mermaid, error or "", deadline, batch, budget)
+
+
+async def _repair_flowchart(
+    job_id: str,
+    name: str,
+    code: str,
+    mermaid: str,
+    error: str,
+    deadline: float,
+    batch: bool,
+    budget: Optional[RepairBudget],
+    local: bool = True,
+) -> CachedFlowchart:
+    """
+    Repair loop for an invalid diagram: first repair_locally (free), then up to
+    REPAIR_ATTEMPTS targeted LLM re-prompts carrying the parser error, each
+    drawn from the job's shared budget. Returns the last attempt if none validate.
+    """
+    if local:
+        fixed, _ = repair_locally(mermaid)
+        if fixed != mermaid:
+            valid, fixed_error = await validate_mermaid(fixed)
+            if valid:
+                print(f"[Job {job_id}] Repaired {name} locally")
+                metrics.repairs.inc(outcome="local")
+                return CachedFlowchart(mermaid=fixed, validated=True, error=None)
+            mermaid, error = fixed, fixed_error or error
+
+    for attempt in range(settings.repair_attempts):
+        if budget is not None and not budget.take():
+            print(f"[Job {job_id}] Repair budget exhausted; keeping invalid {name}")
+            break
+        print(f"[Job {job_id}] Re-prompting LLM to repair {name} (attempt {attempt + 1}): {error}")
+        started = time.perf_counter()
+        try:
+            candidate = await llm_client.repair_mermaid(code, mermaid, error, deadline=deadline, batch=batch)
+        except LLMError as exc:
+            print(f"[Job {job_id}] Repair call for {name} failed: {exc}")
+            break
+        finally:
+            metrics.stage_seconds.observe(time.perf_counter() - started, stage="repair")
+        candidate, _ = repair_locally(candidate)
+        valid, candidate_error = await validate_mermaid(candidate)
+        if valid:
+            metrics.repairs.inc(outcome="llm")
+            return CachedFlowchart(mermaid=candidate, validated=True, error=None)
+        mermaid, error = candidate, candidate_error or error
+
+    metrics.repairs.inc(outcome="failed")
+    return CachedFlowchart(mermaid=mermaid, validated=False, error=error)
+
+
+def _use_local_generator(mode: str, func: CFunction) -> bool:
+    """auto picks the local generator for simple functions or when no LLM is configured."""
+    if mode == "local":
+        return True
+    if mode == "llm":
         return False
+    return not llm_client.configured or complexity(func.source) <= settings.flowgen_max_complexity
+
+
+async def _local_flowchart(job_id: str, func: CFunction, mode: str) -> Optional[FunctionResult]:
+    """
+    Deterministic in-process flowchart (app/flowgen.py); no cache needed at
+    millisecond cost. Returns None when auto mode should fall back to the LLM.
+    """
+    started = time.perf_counter()
+    try:
+        mermaid = generate_flowchart(func.source, func.name)
+        metrics.stage_seconds.observe(time.perf_counter() - started, stage="local_generate")
+    except FlowgenError as exc:
+        if mode == "local":
+            return FunctionResult(
+                name=func.name, mermaid="", validated=False, error=f"Local generator: {exc}", generator="local"
+            )
+        print(f"[Job {job_id}] Local generator could not parse {func.name} ({exc}); using LLM")
+        return None
+    valid, error = await validate_mermaid(mermaid)
+    if not valid and mode != "local":
+        print(f"[Job {job_id}] Local flowchart for {func.name} failed validation; using LLM")
+        return None
+    return FunctionResult(name=func.name, mermaid=mermaid, validated=valid, error=error, generator="local")
+
+
+def _split_job_code(code: str) -> List[CFunction]:
+    """
+    Per-function units of a submission; the whole file when no function is found.
+    With LLM_PREPROCESS, comments and dead literal conditionals go first
+    (preprocess_unit), so functions under #if 0 are not generated; otherwise
+    the code is split as submitted.
+    """
+    unit = preprocess_unit(code) if settings.llm_preprocess else code
+    return split_functions(unit) or [
+        CFunction(name="flowchart", source=unit, start_line=1, end_line=unit.count("\n") + 1)
+    ]
+
+
+def _submitted_source(lines: List[str], func: CFunction) -> str:
+    """Lines of the submission a function came from (preprocess_unit keeps line numbers)."""
+    return "\n".join(lines[func.start_line - 1:func.end_line])
+
+
+async def _reusable_results(job: JobState) -> Dict[str, FunctionResult]:
+    """
+    Validated results of the job's previous revision, keyed by cache_key of
+    the function source they were generated from. Empty for first revisions,
+    when the mode changed, or once the parent was evicted by retention.
+    A parent still running contributes the functions it has finished.
+    """
+    if not job.parent_id:
+        return {}
+    try:
+        parent = await get_job(job.parent_id)
+    except HTTPException:
+        return {}
+    if parent.mode != job.mode:
+        return {}
+    by_name: Dict[str, List[FunctionResult]] = {}
+    for result in parent.functions:
+        by_name.setdefault(result.name, []).append(result)
+    reusable: Dict[str, FunctionResult] = {}
+    for func in _split_job_code(parent.code):
+        candidates = by_name.get(func.name)
+        if not candidates:
+            continue
+        result = candidates.pop(0)
+        if result.validated and result.mermaid:
+            reusable[cache_key(func.source)] = result
+    return reusable
 
 
 async def process_job(job_id: str):
     """
     Process a single job through the pipeline:
     1. PROCESSING → 2. GENERATING_FLOWCHART → 3. VALIDATING → 4. COMPLETED/FAILED
-    Each status update triggers a state change visible to polling clients.
-    TODO: Add retry logic with exponential backoff for LLM failures.
-    TODO: Add timeout for entire job to prevent infinite hangs.
-    TODO: Consider parsing C code with ast-grep before LLM call.
+    The code is split into functions, each drawn by the local generator, the
+    cache or the LLM (then validated and repaired), up to FUNCTION_CONCURRENCY
+    at a time; results are stored as they finish. Revisions reuse unchanged
+    functions. The job FAILS only if every function failed or it ran past JOB_TIMEOUT.
     """
     job = await get_job(job_id)
+    if job.status == JobStatus.CANCELLED:
+        return
+    deadline = asyncio.get_running_loop().time() + settings.job_timeout
+    if job.status == JobStatus.SUBMITTED:
+        # updated_at is the enqueue (or crash-recovery requeue) time.
+        metrics.stage_seconds.observe((_now() - job.updated_at).total_seconds(), stage="queue_wait")
     
-    # Step 1: Processing started
-    await update_job(job_id, status=JobStatus.PROCESSING, total_functions=1, updated_at=_now())
+    # Step 1: Processing started; split into per-function units
+    functions = _split_job_code(job.code)
+    submitted_lines = job.code.split("\n")
+    reusable = await _reusable_results(job)
+    if reusable:
+        print(f"[Job {job_id}] Revision {job.revision}: up to {len(reusable)} results reusable from {job.parent_id}")
+    # Redelivered jobs (shared queue, crashed worker) start over from a clean slate.
+    await update_job(
+        job_id, status=JobStatus.PROCESSING, total_functions=len(functions), processed_functions=0,
+        functions=[], error=None, partial_functions={},
+    )
     
-    try:
-        # Step 2: Generating flowchart with LLM
-        await update_job(job_id, status=JobStatus.GENERATING_FLOWCHART)
-        print(f"[Job {job_id}] Generating flowchart with LLM...")
-        mermaid = await llm_client.generate_from_code(job.code)
-        
-        # Step 3: Validating Mermaid syntax
-        await update_job(job_id, status=JobStatus.VALIDATING)
-        print(f"[Job {job_id}] Validating Mermaid syntax...")
-        valid = await validate_mermaid(mermaid)
-        
-        # Step 4: Storing results
-        job = await get_job(job_id)
-        job.functions.append(
-            FunctionResult(
-                name="flowchart",
-                mermaid=mermaid,
-                validated=valid,
-                error=None if valid else "Mermaid validation failed",
+    # Step 2: Generating flowcharts; job moves to VALIDATING once every LLM call returned
+    await update_job(job_id, status=JobStatus.GENERATING_FLOWCHART)
+    pending_generation = set(range(len(functions)))
+    results: List[FunctionResult | None] = [None] * len(functions)
+    limit = asyncio.Semaphore(settings.function_concurrency)
+    repair_budget = RepairBudget(settings.repair_max_per_job)
+    tokens = {"source_tokens": 0, "reduced_tokens": 0}
+
+    async def mark_generated(index: int):
+        if index in pending_generation:
+            pending_generation.discard(index)
+            if not pending_generation:
+                await update_job(job_id, status=JobStatus.VALIDATING)
+
+    async def llm_function(index: int, func: CFunction) -> FunctionResult:
+        try:
+            # Step 3b: Reduce the code locally, then generate + validate (or reuse a cached result)
+            code = func.source
+            if settings.llm_preprocess:
+                original = _submitted_source(submitted_lines, func)
+                prepared = reduce_function(func.source, original, settings.llm_preprocess_max_initializer)
+                code = prepared.code
+                tokens["source_tokens"] += prepared.original_tokens
+                tokens["reduced_tokens"] += prepared.reduced_tokens
+                metrics.preprocess_tokens.inc(prepared.original_tokens, kind="source")
+                metrics.preprocess_tokens.inc(prepared.reduced_tokens, kind="reduced")
+            result, cached = await flowchart_cache.get_or_compute(
+                cache_key(code),
+                lambda: _generate_flowchart(
+                    job_id, func.name, code, lambda: mark_generated(index), deadline,
+                    batch=job.batch_id is not None, budget=repair_budget,
+                ),
             )
-        )
-        
-        # Step 5: Completed successfully
+            if cached:
+                print(f"[Job {job_id}] Flowchart for {func.name} served from cache")
+            return FunctionResult(
+                name=func.name, mermaid=result.mermaid,
+                validated=result.validated, error=result.error, generator="llm",
+            )
+        except Exception as exc:
+            print(f"[Job {job_id}] Function {func.name} failed: {exc}")
+            return FunctionResult(name=func.name, mermaid="", validated=False, error=str(exc), generator="llm")
+
+    async def run_function(index: int, func: CFunction):
+        previous = reusable.get(cache_key(func.source)) if reusable else None
+        if previous is not None:
+            # Step 3c: Unchanged since the previous revision: no generation or validation
+            results[index] = replace(previous, reused=True)
+            metrics.functions_reused.inc()
+            await mark_generated(index)
+            await append_function_result(job_id, results[index])
+            return
+        async with limit:
+            outcome = None
+            if _use_local_generator(job.mode, func):
+                # Step 3a: Simple function (or local mode): in-process generator
+                outcome = await _local_flowchart(job_id, func, job.mode)
+            if outcome is None:
+                outcome = await llm_function(index, func)
+            await mark_generated(index)
+            metrics.functions_generated.inc(generator=outcome.generator or "llm")
+            outcome = await _with_summary(outcome)
+
+        # Step 4: Store incrementally so clients see progress per function
+        results[index] = outcome
+        await append_function_result(job_id, outcome)
+
+    try:
+        try:
+            # Not wait_for: cancel_job() must reach the gather directly.
+            async with asyncio.timeout(settings.job_timeout):
+                await asyncio.gather(*(run_function(i, func) for i, func in enumerate(functions)))
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"Job timed out after {settings.job_timeout:.0f}s") from None
+
+        # Step 5: Completed (results back in source order), unless nothing succeeded
+        errors = [res.error for res in results if not res.mermaid]
+        if len(errors) == len(results):
+            raise RuntimeError(errors[0] or "Flowchart generation failed")
         await update_job(
             job_id,
-            processed_functions=1,
-            status=JobStatus.COMPLETED
+            functions=results,
+            processed_functions=len(results),
+            partial_functions={},
+            status=JobStatus.COMPLETED,
+            **tokens,
         )
         print(f"[Job {job_id}] Completed successfully!")
         
     except Exception as exc:
         print(f"[Job {job_id}] Failed: {exc}")
-        await update_job(job_id, status=JobStatus.FAILED, error=str(exc))
+        await update_job(job_id, status=JobStatus.FAILED, error=str(exc), partial_functions={}, **tokens)
+    # The job read at the start is stale with stores that return copies (SQLite).
+    job = await job_store.get(job_id)
+    if job is None:
+        return
+    metrics.jobs_finished.inc(status=job.status)
+    metrics.stage_seconds.observe((job.updated_at - job.created_at).total_seconds(), stage="end_to_end")
+    await _offload(job)
 
 
-async def worker():
+async def _heartbeat(lease: Lease, task: asyncio.Task):
     """
-    Background worker that processes jobs from the queue.
-    Single consumer; blocks on empty queue.
-    NOTE: Never exits; no graceful shutdown handling.
-    TODO: Support cancellation on app shutdown.
-    TODO: Add multiple workers for concurrency if needed.
+    Keep a durable lease alive while the job runs (at least three extensions
+    per visibility timeout). Stops the job once the lease reports it was
+    cancelled through another process, or lost to a redelivery.
     """
-    print("[Worker] Started async worker")
+    interval = min(job_queue.visibility_timeout / 3, settings.queue_cancel_check_interval)
     while True:
-        job_id = await job_queue.get()
+        await asyncio.sleep(interval)
         try:
-            await process_job(job_id)
+            if not await job_queue.extend(lease):
+                task.cancel()
+                return
         except Exception as exc:
-            print(f"[Worker] Unexpected error processing job {job_id}: {exc}")
+            print(f"[Queue] Lease extension for {lease.job_id} failed: {exc}")
+
+
+async def worker(worker_id: int = 0):
+    """
+    Pool consumer that processes jobs from the shared queue until stop_worker().
+    Each job runs in its own task so cancel_job() can stop it without taking the
+    consumer down. The lease is acked only after the job's final state is
+    flushed, so a crash leads to redelivery rather than a lost job.
+    """
+    print(f"[Worker {worker_id}] Started async worker")
+    while True:
+        lease = await job_queue.lease()
+        job_id = lease.job_id
+        if lease.cancelled or lease.attempts > settings.queue_max_attempts:
+            # Cancelled (or crashed repeatedly) while an earlier worker held it.
+            if lease.cancelled:
+                await _mark_cancelled(job_id)
+            else:
+                await update_job(
+                    job_id, status=JobStatus.FAILED,
+                    error=f"Gave up after {settings.queue_max_attempts} delivery attempts",
+                )
+            await job_store.flush()
+            await job_queue.ack(lease)
+            continue
+        metrics.jobs_in_flight.inc()
+        job_store.pin(job_id)
+        task = asyncio.create_task(process_job(job_id))
+        running_jobs[job_id] = (task, lease)
+        heartbeat = asyncio.create_task(_heartbeat(lease, task)) if job_queue.durable else None
+        released = False
+        try:
+            await asyncio.wait({task})
+            if not task.cancelled():
+                task.result()
+            elif lease.cancelled:
+                await _mark_cancelled(job_id)
+            else:
+                # The lease lapsed and another worker owns the job now.
+                print(f"[Worker {worker_id}] Lost the lease on job {job_id}; dropping it")
+                released = True
+                await job_queue.release(lease)
+        except asyncio.CancelledError:
+            task.cancel()
+            await asyncio.wait({task})
+            if job_queue.durable:
+                released = True
+                await job_queue.release(lease)
+            else:
+                await update_job(job_id, status=JobStatus.FAILED, error="Worker shut down")
+            raise
+        except HTTPException:
+            print(f"[Worker {worker_id}] Job {job_id} no longer exists; dropping it")
+        except Exception as exc:
+            print(f"[Worker {worker_id}] Unexpected error processing job {job_id}: {exc}")
         finally:
-            job_queue.task_done()
+            running_jobs.pop(job_id, None)
+            if heartbeat:
+                heartbeat.cancel()
+            metrics.jobs_in_flight.dec()
+            if not released:
+                await job_store.flush()
+                await job_queue.ack(lease)
+            job_store.unpin(job_id)
 
 
-def start_worker():
+def start_worker(concurrency: int = settings.worker_concurrency):
     """
-    Start the background worker task from lifespan startup.
-    Idempotent: only creates task if none exists or previous is done.
-    TODO: Store task reference and cancel on shutdown for clean exit.
+    Start the worker pool from lifespan startup.
+    Idempotent: only tops up consumers that are missing or finished.
     """
-    global worker_task
-    if worker_task is None or worker_task.done():
-        worker_task = asyncio.create_task(worker())
-        print("[Worker] Background worker task created")
+    worker_tasks[:] = [task for task in worker_tasks if not task.done()]
+    for worker_id in range(len(worker_tasks), max(concurrency, 1)):
+        worker_tasks.append(asyncio.create_task(worker(worker_id)))
+    print(f"[Worker] Worker pool running with {len(worker_tasks)} consumers")
+
 
+async def stop_worker(drain_timeout: float = settings.shutdown_drain_timeout):
+    """
+    Gracefully stop the worker pool from lifespan shutdown.
+    Waits up to drain_timeout seconds for queued jobs to finish, then cancels.
+    """
+    if not worker_tasks:
+        return
+    try:
+        await asyncio.wait_for(job_queue.join(), timeout=drain_timeout)
+    except asyncio.TimeoutError:
+        print(f"[Worker] Drain timed out with {job_queue.qsize()} jobs queued; cancelling")
+    for task in worker_tasks:
+        task.cancel()
+    await asyncio.gather(*worker_tasks, return_exceptions=True)
+    worker_tasks.clear()
+    print("[Worker] Worker pool stopped")
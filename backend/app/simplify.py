@@ -0,0 +1,611 @@
+import html
+import math
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .validator import SHAPES, FlowchartGraph, FlowEdge, FlowNode, MermaidSyntaxError, parse_flowchart
+
+_CLOSERS: Dict[str, str] = {}
+for _opener, _closer in SHAPES:
+    _CLOSERS.setdefault(_opener, _closer)
+_CHAIN_SHAPES = {"[", "("}  # Plain statements; decisions and terminals are never merged.
+_CHAIN_LABEL_NODES = 3  # Chains up to this long become one node listing every statement.
+_MIN_FOLD = 3  # Smallest branch or loop body worth folding.
+_MAX_ARMS = 8  # Branches shown per decision before they are grouped.
+_ARM_NESTING = 2  # Branch folds inside branch folds; deeper nesting is left to region folds.
+_MIN_MAX_NODES = 8  # Smaller limits are raised to this (room for a region plus its boundary).
+_LABEL_CHARS = 60
+_ENTITY = re.compile(r"#(?:(\d+)|([a-zA-Z]+));")  # Mermaid's #35; / #quot; (HTML's &#35; / &quot;).
+_ROOT = "\0root"
+_EXIT = "\0exit"
+_STYLES = {
+    "folded": "classDef folded fill:#eef4ff,stroke:#3b6fd8,stroke-width:2px",
+    "boundary": "classDef boundary fill:#f7f7f7,stroke:#999,stroke-dasharray:4 3,color:#666",
+}
+
+
+@dataclass
+class Part:
+    """Detail diagram behind one folded node of a summary (or of another part)."""
+    id: str
+    title: str
+    mermaid: str
+
+
+@dataclass
+class Simplified:
+    """Summary of a large flowchart; folded nodes have the id of their Part."""
+    summary: str
+    parts: Dict[str, Part]
+    nodes: int  # Of the full diagram.
+
+
+def _quote(text: str) -> str:
+    return '"' + text.replace('"', "#quot;") + '"'
+
+
+def _plain(label: str) -> str:
+    """Edge label without the quotes of the |"..."| form."""
+    return label.strip().strip('"')
+
+
+def _edge_label(label: str) -> str:
+    label = _plain(label).replace('"', "#quot;").replace("|", "#124;")
+    return f'|"{label}"|' if any(ch in label for ch in "[](){}<>") else f"|{label}|"
+
+
+def to_mermaid(graph: FlowchartGraph, classes: Optional[Dict[str, List[str]]] = None) -> str:
+    """
+    Mermaid text for a parsed flowchart (inverse of parse_flowchart up to
+    formatting and styling). Labels are always quoted. classes maps a class
+    name from _STYLES to the node ids it applies to.
+    """
+    lines = [f"flowchart {graph.direction}"]
+    declared: Set[str] = set()
+
+    def declare(node: FlowNode, indent: str):
+        shape = node.shape if node.shape in _CLOSERS else "["
+        lines.append(f"{indent}{node.id}{shape}{_quote(node.label)}{_CLOSERS[shape]}")
+        declared.add(node.id)
+
+    for sub in graph.subgraphs:
+        lines.append(f"    subgraph {sub.id} [{_quote(sub.title)}]")
+        for node_id in sub.nodes:
+            if node_id in graph.nodes and node_id not in declared:
+                declare(graph.nodes[node_id], "        ")
+        lines.append("    end")
+    for node in graph.nodes.values():
+        if node.id not in declared:
+            declare(node, "    ")
+    for edge in graph.edges:
+        label = _edge_label(edge.label) if edge.label else ""
+        lines.append(f"    {edge.source} {edge.arrow}{label} {edge.target}")
+    for name, node_ids in (classes or {}).items():
+        present = [node_id for node_id in node_ids if node_id in graph.nodes]
+        if present:
+            lines.append(f"    {_STYLES[name]}")
+            lines.append(f"    class {','.join(present)} {name}")
+    return "\n".join(lines)
+
+
+def _text(label: str) -> str:
+    """Label as plain text: Mermaid entity codes (#quot;, #35;) decoded."""
+    return html.unescape(_ENTITY.sub(lambda m: f"&#{m[1]};" if m[1] else f"&{m[2]};", label))
+
+
+def _first_line(label: str) -> str:
+    line = label.split("<br/>")[0].strip()
+    return line if len(line) <= _LABEL_CHARS else line[:_LABEL_CHARS - 1] + "…"
+
+
+class _Graph:
+    """
+    Mutable flowchart for folding: adjacency maps keyed by (neighbour, label),
+    so contracting a set of nodes only touches their own edges. Node order
+    (first-seen position) is kept for output.
+    """
+
+    def __init__(self, direction: str):
+        self.direction = direction
+        self.nodes: Dict[str, FlowNode] = {}
+        self.position: Dict[str, float] = {}
+        self.out: Dict[str, Dict[Tuple[str, Optional[str]], FlowEdge]] = {}
+        self.inc: Dict[str, Dict[Tuple[str, Optional[str]], FlowEdge]] = {}
+
+    @classmethod
+    def build(cls, direction: str, nodes: Iterable[FlowNode], edges: Iterable[FlowEdge]) -> "_Graph":
+        graph = cls(direction)
+        for node in nodes:
+            graph.add_node(node, float(len(graph.nodes)))
+        for edge in edges:
+            graph.add_edge(edge)
+        return graph
+
+    def add_node(self, node: FlowNode, position: float):
+        self.nodes[node.id] = node
+        self.position[node.id] = position
+        self.out[node.id] = {}
+        self.inc[node.id] = {}
+
+    def add_edge(self, edge: FlowEdge):
+        edge = self.out[edge.source].setdefault((edge.target, edge.label), edge)
+        self.inc[edge.target].setdefault((edge.source, edge.label), edge)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def succ(self, node_id: str) -> List[str]:
+        return list(dict.fromkeys(target for target, _ in self.out[node_id]))
+
+    def pred(self, node_id: str) -> List[str]:
+        return list(dict.fromkeys(source for source, _ in self.inc[node_id]))
+
+    def label(self, source: str, target: str) -> Optional[str]:
+        return next((label for (other, label) in self.out[source] if other == target and label), None)
+
+    def edges(self, members: Optional[Set[str]] = None) -> List[FlowEdge]:
+        """All edges (or those touching members), by source position."""
+        sources = self.nodes if members is None else self.nodes.keys() & (
+            members | {source for node_id in members for source, _ in self.inc[node_id]}
+        )
+        ordered = sorted(sources, key=self.position.get)
+        return [
+            edge for source in ordered for edge in self.out[source].values()
+            if members is None or source in members or edge.target in members
+        ]
+
+    def contract(self, members: Set[str], node: FlowNode):
+        """Replace members by node; edges leaving it lose their labels (they belonged to members)."""
+        position = min(self.position[node_id] for node_id in members)
+        outgoing: List[str] = []
+        incoming: Dict[str, List[FlowEdge]] = {}
+        for node_id in sorted(members, key=self.position.get):
+            for edge in self.out.pop(node_id).values():
+                if edge.target not in members:
+                    del self.inc[edge.target][(node_id, edge.label)]
+                    outgoing.append(edge.target)
+            for edge in self.inc.pop(node_id).values():
+                if edge.source not in members:
+                    del self.out[edge.source][(node_id, edge.label)]
+                    incoming.setdefault(edge.source, []).append(edge)
+            del self.nodes[node_id], self.position[node_id]
+        self.add_node(node, position)
+        for source, edges in incoming.items():
+            # One edge per neighbour; several labels (e.g. grouped switch cases) are listed.
+            labels = list(dict.fromkeys(_plain(edge.label) for edge in edges if edge.label))
+            label = ", ".join(labels) if len(labels) <= 3 else f"{labels[0]} … {labels[-1]}"
+            self.add_edge(FlowEdge(source, node.id, label or None, edges[0].arrow))
+        for target in outgoing:
+            self.add_edge(FlowEdge(node.id, target, None, "-->"))
+
+    def flowchart(self) -> FlowchartGraph:
+        graph = FlowchartGraph(direction=self.direction)
+        for node_id in sorted(self.nodes, key=self.position.get):
+            graph.nodes[node_id] = self.nodes[node_id]
+        graph.edges = self.edges()
+        return graph
+
+
+def _dominators(succ: Dict[str, List[str]], root: str) -> Dict[str, str]:
+    """Immediate dominators of the nodes reachable from root (Cooper-Harvey-Kennedy); idom[root] == root."""
+    postorder: List[str] = []
+    seen = {root}
+    stack = [(root, iter(succ[root]))]
+    while stack:
+        node, children = stack[-1]
+        for child in children:
+            if child not in seen:
+                seen.add(child)
+                stack.append((child, iter(succ[child])))
+                break
+        else:
+            stack.pop()
+            postorder.append(node)
+    index = {node: i for i, node in enumerate(postorder)}
+    preds: Dict[str, List[str]] = {node: [] for node in postorder}
+    for node in postorder:
+        for child in succ[node]:
+            preds[child].append(node)
+
+    def intersect(a: str, b: str) -> str:
+        while a != b:
+            while index[a] < index[b]:
+                a = idom[a]
+            while index[b] < index[a]:
+                b = idom[b]
+        return a
+
+    idom = {root: root}
+    changed = True
+    while changed:
+        changed = False
+        for node in reversed(postorder):
+            if node == root:
+                continue
+            new = None
+            for parent in preds[node]:
+                if parent in idom:
+                    new = parent if new is None else intersect(parent, new)
+            if new is not None and idom.get(node) != new:
+                idom[node] = new
+                changed = True
+    return idom
+
+
+class _Analysis:
+    """Dominator and post-dominator trees of a graph, rooted at virtual entry/exit nodes."""
+
+    def __init__(self, graph: _Graph):
+        self.succ = {node_id: graph.succ(node_id) for node_id in graph.nodes}
+        self.pred = {node_id: graph.pred(node_id) for node_id in graph.nodes}
+        forward = dict(self.succ)
+        order = sorted(graph.nodes, key=graph.position.get)
+        # Entries: nodes without predecessors, plus one node of each cycle nothing else leads to.
+        forward[_ROOT] = [node_id for node_id in order if not self.pred[node_id]]
+        reached: Set[str] = set()
+        stack = list(forward[_ROOT])
+        for node_id in order:
+            if not stack and node_id not in reached:
+                forward[_ROOT].append(node_id)
+                stack.append(node_id)
+            while stack:
+                current = stack.pop()
+                if current not in reached:
+                    reached.add(current)
+                    stack.extend(self.succ[current])
+        self.idom = _dominators(forward, _ROOT)
+        backward = dict(self.pred)
+        backward[_EXIT] = [node_id for node_id in graph.nodes if not self.succ[node_id]]
+        self.ipdom = _dominators(backward, _EXIT)
+        self.children: Dict[str, List[str]] = {}
+        for node_id in order:  # Diagram order keeps folding deterministic.
+            parent = self.idom.get(node_id)
+            if parent is not None:
+                self.children.setdefault(parent, []).append(node_id)
+
+    def subtree(self, node_id: str) -> List[str]:
+        """Nodes dominated by node_id: single entry, so they can be folded into one node."""
+        nodes, stack = [], [node_id]
+        while stack:
+            current = stack.pop()
+            nodes.append(current)
+            stack.extend(self.children.get(current, []))
+        return nodes
+
+    def subtree_sizes(self, pinned: Set[str]) -> Dict[str, int]:
+        """Unpinned nodes in each dominator subtree, for every node reachable from the entry."""
+        order, stack = [], [_ROOT]
+        while stack:
+            current = stack.pop()
+            order.append(current)
+            stack.extend(self.children.get(current, []))
+        sizes: Dict[str, int] = {}
+        for node_id in reversed(order):
+            own = 0 if node_id in pinned or node_id == _ROOT else 1
+            sizes[node_id] = own + sum(sizes[child] for child in self.children.get(node_id, []))
+        return sizes
+
+    def arms(self, node_id: str) -> List[str]:
+        """
+        Branch entries of a decision: successors it dominates that are not its
+        join point (immediate post-dominator), e.g. then/else blocks, switch
+        arms and loop bodies.
+        """
+        if len(self.succ[node_id]) < 2:
+            return []
+        join = self.ipdom.get(node_id)
+        return [child for child in self.succ[node_id] if self.idom.get(child) == node_id and child != join]
+
+
+class _Simplifier:
+    """
+    Reduces a graph to at most max_nodes nodes, in order of increasing loss:
+    straight-line chains are merged, then branch/loop bodies are folded
+    innermost first, then decisions with many branches get their branches
+    grouped, and as a last resort dominator regions are folded (one that
+    makes the graph fit, else rounds of bounded regions side by side).
+    Every fold keeps what it hid as a Part: at most max_boundary stub nodes
+    for its neighbours, so a part of at most region_nodes members fits.
+    """
+
+    def __init__(self, max_nodes: int, taken: Set[str]):
+        self.max_nodes = max_nodes
+        self.max_boundary = max(2, max_nodes // 5)
+        self.region_nodes = max_nodes - self.max_boundary
+        self.taken = set(taken)
+        self.counter = 0
+        self.weight: Dict[str, int] = {}  # Merged/folded node -> nodes of the full diagram it stands for.
+        self.folded: List[str] = []
+        self.parts: Dict[str, Tuple[str, _Graph, Set[str]]] = {}  # id -> (title, graph, boundary)
+
+    def _weight(self, nodes: Iterable[str]) -> int:
+        return sum(self.weight.get(node_id, 1) for node_id in nodes)
+
+    def _over(self, graph: _Graph) -> bool:
+        return len(graph) > self.max_nodes
+
+    def _fold(self, graph: _Graph, members: Set[str], title: str, detail: str) -> str:
+        """Fold members into one node whose label is title plus detail; their diagram becomes a Part."""
+        self.counter += 1
+        fold_id = f"fold{self.counter}"
+        while fold_id in self.taken:
+            fold_id += "_"
+        self.taken.add(fold_id)
+        edges = graph.edges(members)
+        entries = {edge.source for edge in edges if edge.source not in members}
+        boundary = {edge.target for edge in edges if edge.source in members} - members | entries
+        nodes = [
+            graph.nodes[node_id] if node_id in members
+            else FlowNode(node_id, _first_line(graph.nodes[node_id].label), "([")
+            for node_id in sorted(members | boundary, key=graph.position.get)
+        ]
+        if len(boundary) > self.max_boundary:
+            # Entries first, then by diagram order; the rest share one stub.
+            ordered = sorted(boundary, key=lambda node_id: (node_id not in entries, graph.position[node_id]))
+            merged = set(ordered[self.max_boundary - 1:])
+            stub = f"{fold_id}_more"
+            nodes = [node for node in nodes if node.id not in merged]
+            nodes.append(FlowNode(stub, f"{len(merged)} more steps", "(["))
+            edges = [
+                FlowEdge(
+                    stub if edge.source in merged else edge.source,
+                    stub if edge.target in merged else edge.target,
+                    edge.label, edge.arrow,
+                )
+                for edge in edges
+            ]
+            boundary = boundary - merged | {stub}
+        self.parts[fold_id] = (title, _Graph.build(graph.direction, nodes, edges), boundary)
+        self.weight[fold_id] = self._weight(members)
+        self.folded.append(fold_id)
+        graph.contract(members, FlowNode(fold_id, f"{title}<br/>{detail}", "[["))
+        return fold_id
+
+    def _merge_chains(self, graph: _Graph, pinned: Set[str]):
+        succ = {node_id: graph.succ(node_id) for node_id in graph.nodes}
+        pred = {node_id: graph.pred(node_id) for node_id in graph.nodes}
+
+        def plain(node_id: str) -> bool:
+            return node_id not in pinned and graph.nodes[node_id].shape in _CHAIN_SHAPES
+
+        def linked(a: str, b: str) -> bool:
+            return succ[a] == [b] and pred[b] == [a] and graph.label(a, b) is None and plain(b)
+
+        chains, used = [], set()
+        order = sorted(graph.nodes, key=graph.position.get)
+        # Chain heads first; the second pass starts anywhere, for cycles of plain statements.
+        for index, node_id in enumerate(order + order):
+            if node_id in used or not plain(node_id):
+                continue
+            if index < len(order) and len(pred[node_id]) == 1 and plain(pred[node_id][0]) \
+                    and linked(pred[node_id][0], node_id):
+                continue  # Not the head of its chain.
+            chain = [node_id]
+            while len(succ[chain[-1]]) == 1:
+                following = succ[chain[-1]][0]
+                if following in used or following in chain or not linked(chain[-1], following):
+                    break
+                chain.append(following)
+            used.update(chain)
+            # Very long chains fold in segments, so each part still fits max_nodes with its neighbours.
+            limit = max(self.max_nodes - 2, _CHAIN_LABEL_NODES + 1)
+            chains.extend(
+                segment for segment in (chain[start:start + limit] for start in range(0, len(chain), limit))
+                if len(segment) > 1
+            )
+        for chain in chains:
+            labels = [graph.nodes[node_id].label for node_id in chain]
+            if len(chain) <= _CHAIN_LABEL_NODES:
+                self.weight[chain[0]] = self._weight(chain)
+                graph.contract(set(chain), FlowNode(chain[0], "<br/>".join(labels), "["))
+            else:
+                self._fold(
+                    graph, set(chain), f"{_first_line(labels[0])} … {_first_line(labels[-1])}",
+                    f"▸ {self._weight(chain)} steps",
+                )
+
+    def _fold_arms(self, graph: _Graph, pinned: Set[str]):
+        analysis = _Analysis(graph)
+        roots = {arm: decision for decision in analysis.succ for arm in analysis.arms(decision)}
+        regions = []
+        for arm, decision in roots.items():
+            members = [node_id for node_id in analysis.subtree(arm) if node_id not in pinned]
+            if len(members) < _MIN_FOLD:
+                continue
+            depth, ancestor = 0, analysis.idom.get(arm)
+            while ancestor not in (None, _ROOT):
+                depth += ancestor in roots
+                ancestor = analysis.idom.get(ancestor)
+            regions.append((depth, len(members), arm, decision, members))
+        # Innermost (then largest) first: the summary keeps the outer structure.
+        regions.sort(key=lambda region: (-region[0], -region[1]))
+        labels = {(decision, arm): graph.label(decision, arm) for arm, decision in roots.items()}
+        representative: Dict[str, str] = {}
+        nesting: Dict[str, int] = {}  # Fold -> branch folds nested in it, itself included.
+
+        def find(node_id: str) -> str:
+            root = node_id
+            while root in representative:
+                root = representative[root]
+            while node_id != root:  # Path compression: nested folds make long chains.
+                representative[node_id], node_id = root, representative[node_id]
+            return root
+
+        for _, _, arm, decision, members in regions:
+            if not self._over(graph):
+                return
+            current = {find(node_id) for node_id in members}
+            level = 1 + max(nesting.get(node_id, 0) for node_id in current)
+            # Early-return chains nest every else inside the previous one: stop a few levels down.
+            if len(current) < 2 or level > _ARM_NESTING:
+                continue
+            title = _first_line(graph.nodes[find(arm)].label)
+            if labels[(decision, arm)]:
+                title = f"{_plain(labels[(decision, arm)])}: {title}"
+            fold_id = self._fold(graph, current, title, f"▸ {self._weight(current)} steps")
+            nesting[fold_id] = level
+            for node_id in current:
+                representative[node_id] = fold_id
+
+    def _group_arms(self, graph: _Graph, pinned: Set[str]):
+        while self._over(graph):
+            analysis = _Analysis(graph)
+            widest = max(analysis.succ, key=lambda node_id: len(analysis.arms(node_id)))
+            arms = sorted((arm for arm in analysis.arms(widest) if arm not in pinned), key=graph.position.get)
+            if len(arms) <= _MAX_ARMS:
+                return
+            size = math.ceil(len(arms) / _MAX_ARMS)
+            for start in range(0, len(arms), size):
+                group = arms[start:start + size]
+                members = {node_id for arm in group for node_id in analysis.subtree(arm) if node_id not in pinned}
+                if len(members) < 2:
+                    continue
+                first, last = (
+                    _plain(graph.label(widest, arm) or _first_line(graph.nodes[arm].label))
+                    for arm in (group[0], group[-1])
+                )
+                self._fold(
+                    graph, members, f"{first} … {last}",
+                    f"▸ {len(group)} branches, {self._weight(members)} steps",
+                )
+
+    def _fold_subtrees(self, graph: _Graph, pinned: Set[str]):
+        while self._over(graph):
+            analysis = _Analysis(graph)
+            sizes = analysis.subtree_sizes(pinned)
+            # Whole components (children of the virtual root) only when there are several.
+            several = len(analysis.children.get(_ROOT, [])) > 1
+            needed = len(graph) - self.max_nodes + 1
+            fitting = [
+                node_id for node_id, size in sizes.items()
+                if max(needed, 2) <= size <= self.region_nodes and node_id not in pinned and node_id != _ROOT
+                and (several or analysis.idom.get(node_id) != _ROOT)
+            ]
+            if fitting:
+                chosen = min(fitting, key=sizes.get)
+                members = {node_id for node_id in analysis.subtree(chosen) if node_id not in pinned}
+                self._fold(
+                    graph, members, _first_line(graph.nodes[chosen].label), f"▸ {self._weight(members)} steps"
+                )
+                continue
+            # No single region of bounded size will do (e.g. a long run of small ifs).
+            before = len(graph)
+            self._fold_regions(graph, analysis, pinned)
+            if len(graph) >= before:
+                return
+
+    def _fold_regions(self, graph: _Graph, analysis: _Analysis, pinned: Set[str]):
+        """
+        One round of bounded folds. Bottom-up over the dominator tree, the
+        children of a node whose region would exceed region_nodes are packed,
+        in diagram order, into runs of at most region_nodes nodes, and each
+        run is folded. The folds sit side by side, so repeated rounds nest
+        only logarithmically deep.
+        """
+        order, stack = [], [_ROOT]
+        while stack:
+            current = stack.pop()
+            order.append(current)
+            stack.extend(analysis.children.get(current, []))
+        size: Dict[str, int] = {}  # Nodes left in the node's region after its children's folds.
+        pins: Dict[str, int] = {}  # Pinned nodes among them (never folded).
+        runs: List[List[str]] = []
+        for node_id in reversed(order):
+            children = analysis.children.get(node_id, [])
+            total = (node_id != _ROOT) + sum(size[child] for child in children)
+            pins[node_id] = (node_id in pinned) + sum(pins[child] for child in children)
+            if total > self.region_nodes and children:
+                packed: List[List[str]] = [[]]
+                packed_size = 0
+                for child in children:
+                    if packed[-1] and packed_size + size[child] > self.region_nodes:
+                        packed.append([])
+                        packed_size = 0
+                    packed[-1].append(child)
+                    packed_size += size[child]
+                if node_id == _ROOT and len(packed) == 1:
+                    packed = []  # Folding the only component would leave a one-node diagram.
+                # Largest runs first, only as many as it takes to fit.
+                foldable = sorted(
+                    (sum(size[child] - pins[child] for child in run), index) for index, run in enumerate(packed)
+                )
+                while foldable and total > self.region_nodes:
+                    unpinned, index = foldable.pop()
+                    if unpinned < 2:
+                        break
+                    runs.append(packed[index])
+                    total -= unpinned - 1  # The run's unpinned nodes become one.
+            size[node_id] = total
+        owner: Dict[str, int] = {}
+        for index, run in enumerate(runs):
+            for child in run:
+                owner[child] = index
+        members: List[List[str]] = [[] for _ in runs]
+        for node_id in order:  # Top-down: a node belongs to the run of its nearest folded ancestor.
+            parent = analysis.idom.get(node_id)
+            if node_id not in owner and parent in owner:
+                owner[node_id] = owner[parent]
+            if node_id in owner and node_id not in pinned:
+                members[owner[node_id]].append(node_id)
+        for run, nodes in sorted(zip(runs, members), key=lambda item: graph.position[item[0][0]]):
+            first, last = (_first_line(graph.nodes[child].label) for child in (run[0], run[-1]))
+            title = first if len(run) == 1 else f"{first} … {last}"
+            self._fold(graph, set(nodes), title, f"▸ {self._weight(nodes)} steps")
+
+    def summarize(self, graph: _Graph, pinned: Set[str] = frozenset()):
+        """Reduce graph in place (pinned nodes are never merged or folded)."""
+        self._merge_chains(graph, pinned)
+        if self._over(graph):
+            self._fold_arms(graph, pinned)
+        if self._over(graph):
+            self._group_arms(graph, pinned)
+        if self._over(graph):
+            self._fold_subtrees(graph, pinned)
+
+    def render_parts(self) -> Dict[str, Part]:
+        """Parts as Mermaid; parts still too large are summarized in turn (their folds become parts too)."""
+        pending = list(self.parts)
+        while pending:
+            part_id = pending.pop(0)
+            _, part, boundary = self.parts[part_id]
+            if self._over(part):
+                known = set(self.parts)
+                self.summarize(part, boundary)
+                pending.extend(part_id for part_id in self.parts if part_id not in known)
+        return {
+            part_id: Part(
+                part_id, _text(title),
+                to_mermaid(part.flowchart(), {"folded": self.folded, "boundary": sorted(boundary)}),
+            )
+            for part_id, (title, part, boundary) in self.parts.items()
+        }
+
+
+def simplify(graph: FlowchartGraph, max_nodes: int) -> Optional[Simplified]:
+    """
+    Summary diagram of at most ~max_nodes nodes plus lazily viewable parts,
+    or None when the graph is small enough to render as is. Subgraphs and
+    styling of the original are not carried over.
+    """
+    if max_nodes <= 0 or len(graph.nodes) <= max_nodes:
+        return None
+    max_nodes = max(max_nodes, _MIN_MAX_NODES)
+    work = _Graph.build(graph.direction, graph.nodes.values(), graph.edges)
+    simplifier = _Simplifier(max_nodes, set(graph.nodes))
+    simplifier.summarize(work)
+    summary = to_mermaid(work.flowchart(), {"folded": simplifier.folded})
+    return Simplified(summary=summary, parts=simplifier.render_parts(), nodes=len(graph.nodes))
+
+
+@lru_cache(maxsize=128)
+def simplify_mermaid(mermaid_text: str, max_nodes: int) -> Optional[Simplified]:
+    """simplify() of a Mermaid diagram; None if it is small or does not parse. Cached by text."""
+    if max_nodes <= 0:
+        return None
+    try:
+        graph = parse_flowchart(mermaid_text)
+    except MermaidSyntaxError:
+        return None
+    return simplify(graph, max_nodes)
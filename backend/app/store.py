@@ -0,0 +1,703 @@
+import asyncio
+import base64
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, fields
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from .models import BatchState, FunctionResult, JobState, JobStatus
+
+# Statuses a job can be stranded in if the process dies mid-pipeline.
+# SUBMITTED is included because the queue itself is not persisted.
+RECOVERABLE_STATUSES = (
+    JobStatus.SUBMITTED,
+    JobStatus.PROCESSING,
+    JobStatus.GENERATING_FLOWCHART,
+    JobStatus.VALIDATING,
+)
+
+# Only finished jobs are eligible for retention eviction.
+TERMINAL_STATUSES = (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+SORT_FIELDS = ("created_at", "updated_at")
+_MAX_ID = "\U0010ffff"  # Sorts after every job id; used for "strictly after this time".
+
+IndexKey = Tuple[str, str]  # (timestamp, job id); ids break timestamp ties.
+
+
+def _ts(value: datetime) -> str:
+    """Fixed-width ISO timestamp so string order matches time order."""
+    return value.isoformat(timespec="microseconds")
+
+
+def encode_cursor(key: IndexKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> IndexKey:
+    """Raises ValueError on a malformed cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, job_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(timestamp), str(job_id)
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+@dataclass
+class JobQuery:
+    """
+    Listing parameters shared by all stores.
+    - after: keyset position (from a cursor) in the chosen sort order.
+    - since: delta mode; jobs updated strictly after this time, oldest change first.
+    """
+    status: Optional[str] = None
+    sort: str = "created_at"
+    descending: bool = True
+    limit: int = 100
+    after: Optional[IndexKey] = None
+    since: Optional[datetime] = None
+
+    def normalized(self) -> "JobQuery":
+        if self.since is None:
+            return self
+        return JobQuery(
+            status=self.status, sort="updated_at", descending=False, limit=self.limit,
+            after=self.after or (_ts(self.since), _MAX_ID),
+        )
+
+
+@dataclass
+class RetentionPolicy:
+    """
+    Bounds on how many jobs a store keeps; 0 disables a limit.
+    Finished jobs are evicted oldest-update first until all limits hold.
+    - max_jobs: total jobs (any status).
+    - max_age: seconds since a finished job's last update.
+    - max_bytes: estimated resident size of all jobs (see job_size).
+    """
+    max_jobs: int = 0
+    max_age: float = 0
+    max_bytes: int = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_jobs or self.max_age or self.max_bytes)
+
+
+_JOB_OVERHEAD = 512  # Rough per-job cost of the object, timestamps and index keys.
+
+
+def job_size(job: JobState) -> int:
+    """Estimated bytes a job pins in memory (offloaded blobs excluded)."""
+    size = _JOB_OVERHEAD + len(job.code) + len(job.error or "")
+    for func in job.functions:
+        size += 128 + len(func.name) + len(func.mermaid) + len(func.error or "") + len(func.summary or "")
+    return size
+
+
+def _select_evictions(
+    candidates: "Iterable[Tuple[str, str, int]]", count: int, total_bytes: int, policy: RetentionPolicy
+) -> List[str]:
+    """
+    candidates: (updated_at, id, size) of finished jobs, oldest first.
+    Returns ids to evict so the store fits the policy.
+    """
+    cutoff = _ts(datetime.utcnow() - timedelta(seconds=policy.max_age)) if policy.max_age else None
+    evicted = []
+    for updated_at, job_id, size in candidates:
+        too_old = cutoff is not None and updated_at < cutoff
+        too_many = policy.max_jobs and count > policy.max_jobs
+        too_big = policy.max_bytes and total_bytes > policy.max_bytes
+        if not (too_old or too_many or too_big):
+            break
+        evicted.append(job_id)
+        count -= 1
+        total_bytes -= size
+    return evicted
+
+
+@dataclass
+class JobPage:
+    jobs: List[JobState] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+
+
+def _page(keys: List[IndexKey], limit: int, jobs: List[JobState]) -> JobPage:
+    """Build a page from limit+1 fetched keys; the extra one signals a next page."""
+    next_cursor = encode_cursor(keys[limit - 1]) if len(keys) > limit else None
+    return JobPage(jobs=jobs[:limit], next_cursor=next_cursor)
+
+
+class _SortedIndex:
+    """Sorted (timestamp, id) keys with O(log n) lookup for keyset pagination."""
+
+    def __init__(self):
+        self.keys: List[IndexKey] = []
+
+    def add(self, key: IndexKey):
+        insort(self.keys, key)
+
+    def remove(self, key: IndexKey):
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+
+    def scan(self, after: Optional[IndexKey], count: int, descending: bool) -> List[IndexKey]:
+        if descending:
+            end = bisect_left(self.keys, after) if after else len(self.keys)
+            return self.keys[max(0, end - count):end][::-1]
+        start = bisect_right(self.keys, after) if after else 0
+        return self.keys[start:start + count]
+
+
+def job_to_dict(job: JobState) -> Dict[str, Any]:
+    """JSON-safe dict for a JobState (datetimes as ISO strings)."""
+    data = asdict(job)
+    data["created_at"] = job.created_at.isoformat()
+    data["updated_at"] = job.updated_at.isoformat()
+    return data
+
+
+def job_from_dict(data: Dict[str, Any]) -> JobState:
+    """Inverse of job_to_dict; unknown keys are ignored so old rows keep loading."""
+    known = {f.name for f in fields(JobState)}
+    values = {key: value for key, value in data.items() if key in known}
+    values["functions"] = [FunctionResult(**func) for func in values.get("functions", [])]
+    for key in ("created_at", "updated_at"):
+        if isinstance(values.get(key), str):
+            values[key] = datetime.fromisoformat(values[key])
+    return JobState(**values)
+
+
+class JobStore:
+    """
+    Storage interface for jobs. The pipeline mutates a job in place and calls
+    save() after every mutation, so get() must return the same JobState
+    instance for a job this process is working on: any unfinished job in an
+    identity-map store, only pinned jobs when the store is shared. Other reads
+    (finished jobs in SQLite, unpinned jobs in shared mode) may return fresh
+    copies; changes to a copy only persist through save().
+    """
+
+    version: int = 0  # Bumped on every write; used for list ETags.
+
+    async def start(self):
+        """Open resources / background tasks; called from lifespan startup."""
+
+    async def close(self):
+        """Flush pending writes and release resources on shutdown."""
+
+    async def add(self, job: JobState):
+        raise NotImplementedError
+
+    async def add_many(self, jobs: List[JobState]):
+        """Bulk insert (one write for a whole batch)."""
+        for job in jobs:
+            await self.add(job)
+
+    async def get(self, job_id: str) -> Optional[JobState]:
+        raise NotImplementedError
+
+    async def save(self, job: JobState):
+        raise NotImplementedError
+
+    async def add_batch(self, batch: BatchState):
+        raise NotImplementedError
+
+    async def get_batch(self, batch_id: str) -> Optional[BatchState]:
+        raise NotImplementedError
+
+    async def batch_counts(self, batch_id: str) -> Dict[str, int]:
+        """Number of member jobs per status."""
+        raise NotImplementedError
+
+    async def query(self, query: JobQuery) -> JobPage:
+        """One page of jobs in the requested order, served from an index."""
+        raise NotImplementedError
+
+    async def recover(self) -> List[str]:
+        """Reset jobs stranded by a crash to SUBMITTED and return their ids for requeue."""
+        return []
+
+    async def flush(self):
+        """Make pending writes visible to other processes (no-op for in-process stores)."""
+
+    def pin(self, job_id: str):
+        """Keep job_id's instance resident while this process works on it (shared stores)."""
+
+    def unpin(self, job_id: str):
+        """Undo pin(); the job may be re-read from the backing store afterwards."""
+
+    async def enforce_retention(self, policy: RetentionPolicy) -> List[str]:
+        """Delete finished jobs beyond the policy; returns the evicted ids."""
+        return []
+
+    async def claim_idempotency_key(
+        self, key: str, fingerprint: str, job_id: str, ttl: float
+    ) -> Optional[Tuple[str, str]]:
+        """
+        Atomically bind an Idempotency-Key to (job_id, fingerprint) unless a
+        binding younger than ttl seconds exists. Returns that existing
+        (job_id, fingerprint), or None when this call claimed the key.
+        """
+        raise NotImplementedError
+
+    async def forget_idempotency_key(self, key: str):
+        """Drop a binding whose job no longer exists (evicted, or lost in a crash)."""
+        raise NotImplementedError
+
+
+class InMemoryJobStore(JobStore):
+    """
+    Process-local dict store; restart loses state.
+    Maintains sorted secondary indexes (overall and per status, by created_at
+    and updated_at) so listing never scans every job.
+    """
+
+    def __init__(self):
+        self.jobs: Dict[str, JobState] = {}
+        self.batches: Dict[str, BatchState] = {}
+        self._indexes: Dict[Tuple[Optional[str], str], _SortedIndex] = {}
+        self._indexed: Dict[str, Tuple[str, IndexKey, IndexKey]] = {}
+        # key -> (job_id, fingerprint, claimed_at); insertion order = oldest first.
+        self._idempotency: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+
+    def _index(self, status: Optional[str], sort: str) -> _SortedIndex:
+        return self._indexes.setdefault((status, sort), _SortedIndex())
+
+    def _reindex(self, job: JobState):
+        """Move a job's keys between indexes after a status/timestamp change."""
+        created = (_ts(job.created_at), job.id)
+        updated = (_ts(job.updated_at), job.id)
+        previous = self._indexed.get(job.id)
+        self._indexed[job.id] = (job.status, created, updated)
+        if previous is None:
+            for status in (None, job.status):
+                self._index(status, "created_at").add(created)
+                self._index(status, "updated_at").add(updated)
+            return
+        old_status, _, old_updated = previous
+        if old_status != job.status:
+            self._index(old_status, "created_at").remove(created)
+            self._index(job.status, "created_at").add(created)
+            self._index(old_status, "updated_at").remove(old_updated)
+            self._index(job.status, "updated_at").add(updated)
+        elif old_updated != updated:
+            self._index(job.status, "updated_at").remove(old_updated)
+            self._index(job.status, "updated_at").add(updated)
+        if old_updated != updated:
+            self._index(None, "updated_at").remove(old_updated)
+            self._index(None, "updated_at").add(updated)
+
+    def _unindex(self, job_id: str):
+        status, created, updated = self._indexed.pop(job_id)
+        for index_status in (None, status):
+            self._index(index_status, "created_at").remove(created)
+            self._index(index_status, "updated_at").remove(updated)
+
+    async def add(self, job: JobState):
+        self.jobs[job.id] = job
+        self._reindex(job)
+        self.version += 1
+
+    async def get(self, job_id: str) -> Optional[JobState]:
+        return self.jobs.get(job_id)
+
+    async def save(self, job: JobState):
+        # Instances are stored by reference; only the indexes need refreshing.
+        self._reindex(job)
+        self.version += 1
+
+    async def add_batch(self, batch: BatchState):
+        self.batches[batch.id] = batch
+
+    async def get_batch(self, batch_id: str) -> Optional[BatchState]:
+        return self.batches.get(batch_id)
+
+    async def batch_counts(self, batch_id: str) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        batch = self.batches.get(batch_id)
+        for job_id in batch.job_ids if batch else ():
+            job = self.jobs.get(job_id)
+            if job:  # Evicted members are counted by the caller.
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    async def query(self, query: JobQuery) -> JobPage:
+        query = query.normalized()
+        keys = self._index(query.status, query.sort).scan(query.after, query.limit + 1, query.descending)
+        return _page(keys, query.limit, [self.jobs[job_id] for _, job_id in keys])
+
+    async def enforce_retention(self, policy: RetentionPolicy) -> List[str]:
+        if not policy.enabled or not self.jobs:
+            return []
+        total_bytes = sum(job_size(job) for job in self.jobs.values()) if policy.max_bytes else 0
+        finished = heapq.merge(*(self._index(status, "updated_at").keys for status in TERMINAL_STATUSES))
+        candidates = ((updated_at, job_id, job_size(self.jobs[job_id])) for updated_at, job_id in finished)
+        evicted = _select_evictions(candidates, len(self.jobs), total_bytes, policy)
+        for job_id in evicted:
+            self._unindex(job_id)
+            del self.jobs[job_id]
+        if evicted:
+            self.version += 1
+        return evicted
+
+    async def claim_idempotency_key(
+        self, key: str, fingerprint: str, job_id: str, ttl: float
+    ) -> Optional[Tuple[str, str]]:
+        now = time.monotonic()
+        while self._idempotency:
+            oldest = next(iter(self._idempotency.values()))
+            if now - oldest[2] <= ttl:
+                break
+            self._idempotency.popitem(last=False)
+        existing = self._idempotency.get(key)
+        if existing:
+            return existing[0], existing[1]
+        self._idempotency[key] = (job_id, fingerprint, now)
+        return None
+
+    async def forget_idempotency_key(self, key: str):
+        self._idempotency.pop(key, None)
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Durable store backed by SQLite in WAL mode.
+    - Indexed columns (id, status, created_at, updated_at) plus the full job as JSON.
+    - save() only marks the job dirty; a background flusher writes all dirty
+      jobs in one transaction every flush_interval seconds, so status
+      transitions do not cost an fsync each.
+    - add() waits for the next flush (group commit) so a job id returned to a
+      client is already durable.
+    - Live jobs are kept in an identity map so in-place mutations are shared;
+      finished jobs leave it once flushed and are re-read from disk on demand,
+      so memory tracks in-flight work rather than history.
+    - shared=True (several processes on one file): only jobs pinned by this
+      process (the ones its workers hold leases for) stay in the identity map;
+      everything else is read from disk so other processes' writes are seen,
+      and version follows their commits via PRAGMA data_version.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.05, shared: bool = False):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.shared = shared
+        self._version = 0
+        self._pinned: Set[str] = set()
+        self._live: Dict[str, JobState] = {}
+        self._dirty: Dict[str, JobState] = {}
+        self._waiters: List[asyncio.Future] = []
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL,"
+            " created_at TEXT NOT NULL, updated_at TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "batch_id" not in columns:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN batch_id TEXT")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS batches ("
+            " id TEXT PRIMARY KEY, created_at TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch_id, status)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at, id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status_updated ON jobs (status, updated_at, id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created_at, id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated_at, id)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS idempotency_keys ("
+            " key TEXT PRIMARY KEY, job_id TEXT NOT NULL, fingerprint TEXT NOT NULL, claimed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idempotency_claimed ON idempotency_keys (claimed_at)")
+        self._db.commit()
+
+    @property
+    def version(self) -> int:
+        if not self.shared:
+            return self._version
+        with self._db_lock:
+            (data_version,) = self._db.execute("PRAGMA data_version").fetchone()
+        return self._version + data_version
+
+    def pin(self, job_id: str):
+        self._pinned.add(job_id)
+
+    def unpin(self, job_id: str):
+        self._pinned.discard(job_id)
+        if job_id not in self._dirty:
+            self._live.pop(job_id, None)
+
+    async def start(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._flusher:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as exc:
+                print(f"[Store] Flush failed: {exc}")
+
+    async def flush(self):
+        """Write every dirty job in a single transaction and release add() waiters."""
+        async with self._flush_lock:
+            dirty, self._dirty = self._dirty, {}
+            waiters, self._waiters = self._waiters, []
+            rows = [
+                (job.id, job.status, _ts(job.created_at), _ts(job.updated_at),
+                 job.batch_id, json.dumps(job_to_dict(job)))
+                for job in dirty.values()
+            ]
+            try:
+                if rows:
+                    await asyncio.to_thread(self._write, rows)
+            except Exception as exc:
+                # Keep the jobs dirty so the next flush retries them.
+                for job_id, job in dirty.items():
+                    self._dirty.setdefault(job_id, job)
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(exc)
+                raise
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+            for job_id, job in dirty.items():
+                if job_id in self._dirty or job_id in self._pinned:
+                    continue
+                if self.shared or job.status in TERMINAL_STATUSES:
+                    self._live.pop(job_id, None)
+
+    def _write(self, rows):
+        with self._db_lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO jobs (id, status, created_at, updated_at, batch_id, data)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+
+    def _query(self, sql: str, params=()) -> List[tuple]:
+        with self._db_lock:
+            return self._db.execute(sql, params).fetchall()
+
+    async def add(self, job: JobState):
+        await self.add_many([job])
+
+    async def add_many(self, jobs: List[JobState]):
+        for job in jobs:
+            self._live[job.id] = job
+            self._dirty[job.id] = job
+        self._version += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        if self._flusher is None:
+            await self.flush()
+        else:
+            self._wake.set()
+        await waiter
+
+    async def get(self, job_id: str) -> Optional[JobState]:
+        job = self._live.get(job_id)
+        if job:
+            return job
+        rows = await asyncio.to_thread(self._query, "SELECT data FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = job_from_dict(json.loads(rows[0][0]))
+        if self.shared and job_id not in self._pinned:
+            return job  # Another process may own it: always re-read.
+        # Another coroutine may have loaded it while we were in the thread.
+        return self._live.setdefault(job_id, job)
+
+    async def save(self, job: JobState):
+        self._live[job.id] = job
+        self._dirty[job.id] = job
+        self._version += 1
+
+    async def add_batch(self, batch: BatchState):
+        data = {"id": batch.id, "job_ids": batch.job_ids, "created_at": batch.created_at.isoformat()}
+        await asyncio.to_thread(self._write_batch, batch.id, _ts(batch.created_at), json.dumps(data))
+
+    def _write_batch(self, batch_id: str, created_at: str, data: str):
+        with self._db_lock:
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO batches (id, created_at, data) VALUES (?, ?, ?)",
+                    (batch_id, created_at, data),
+                )
+
+    async def get_batch(self, batch_id: str) -> Optional[BatchState]:
+        rows = await asyncio.to_thread(self._query, "SELECT data FROM batches WHERE id = ?", (batch_id,))
+        if not rows:
+            return None
+        data = json.loads(rows[0][0])
+        return BatchState(
+            id=data["id"], job_ids=data["job_ids"], created_at=datetime.fromisoformat(data["created_at"])
+        )
+
+    async def batch_counts(self, batch_id: str) -> Dict[str, int]:
+        await self.flush()
+        rows = await asyncio.to_thread(
+            self._query, "SELECT status, COUNT(*) FROM jobs WHERE batch_id = ? GROUP BY status", (batch_id,)
+        )
+        return dict(rows)
+
+    async def query(self, query: JobQuery) -> JobPage:
+        """Keyset pagination over the (status, sort column, id) indexes."""
+        query = query.normalized()
+        await self.flush()
+        column = query.sort if query.sort in SORT_FIELDS else "created_at"
+        direction, compare = ("DESC", "<") if query.descending else ("ASC", ">")
+        where, params = [], []
+        if query.status:
+            where.append("status = ?")
+            params.append(query.status)
+        if query.after:
+            where.append(f"({column}, id) {compare} (?, ?)")
+            params.extend(query.after)
+        sql = f"SELECT {column}, id, data FROM jobs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {column} {direction}, id {direction} LIMIT ?"
+        params.append(query.limit + 1)
+        rows = await asyncio.to_thread(self._query, sql, params)
+        keys = [(key, job_id) for key, job_id, _ in rows]
+        jobs = [self._live.get(job_id) or job_from_dict(json.loads(data)) for _, job_id, data in rows]
+        return _page(keys, query.limit, jobs)
+
+    async def enforce_retention(self, policy: RetentionPolicy) -> List[str]:
+        """Sizes come from the stored JSON, a close proxy for the resident size."""
+        if not policy.enabled:
+            return []
+        await self.flush()
+        ((count, total_bytes),) = await asyncio.to_thread(
+            self._query, "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM jobs"
+        )
+        placeholders = ",".join("?" for _ in TERMINAL_STATUSES)
+        candidates = await asyncio.to_thread(
+            self._query,
+            f"SELECT updated_at, id, LENGTH(data) FROM jobs WHERE status IN ({placeholders})"
+            " ORDER BY updated_at, id",
+            TERMINAL_STATUSES,
+        )
+        evicted = _select_evictions(candidates, count, total_bytes, policy)
+        if evicted:
+            await asyncio.to_thread(self._delete, evicted)
+            for job_id in evicted:
+                self._live.pop(job_id, None)
+            self._version += 1
+        return evicted
+
+    def _delete(self, job_ids: List[str]):
+        with self._db_lock:
+            with self._db:
+                for start in range(0, len(job_ids), 500):
+                    chunk = job_ids[start:start + 500]
+                    self._db.execute(
+                        f"DELETE FROM jobs WHERE id IN ({','.join('?' for _ in chunk)})", chunk
+                    )
+
+    def _claim(self, key: str, fingerprint: str, job_id: str, ttl: float) -> Optional[Tuple[str, str]]:
+        now = time.time()
+        with self._db_lock:
+            with self._db:
+                self._db.execute("DELETE FROM idempotency_keys WHERE claimed_at < ?", (now - ttl,))
+                self._db.execute(
+                    "INSERT OR IGNORE INTO idempotency_keys (key, job_id, fingerprint, claimed_at) VALUES (?, ?, ?, ?)",
+                    (key, job_id, fingerprint, now),
+                )
+                row = self._db.execute(
+                    "SELECT job_id, fingerprint FROM idempotency_keys WHERE key = ?", (key,)
+                ).fetchone()
+        return None if row[0] == job_id else (row[0], row[1])
+
+    async def claim_idempotency_key(
+        self, key: str, fingerprint: str, job_id: str, ttl: float
+    ) -> Optional[Tuple[str, str]]:
+        """One transaction, so API processes sharing the file cannot both claim a key."""
+        return await asyncio.to_thread(self._claim, key, fingerprint, job_id, ttl)
+
+    async def forget_idempotency_key(self, key: str):
+        def forget():
+            with self._db_lock:
+                with self._db:
+                    self._db.execute("DELETE FROM idempotency_keys WHERE key = ?", (key,))
+
+        await asyncio.to_thread(forget)
+
+    async def recover(self) -> List[str]:
+        placeholders = ",".join("?" for _ in RECOVERABLE_STATUSES)
+        rows = await asyncio.to_thread(
+            self._query,
+            f"SELECT data FROM jobs WHERE status IN ({placeholders}) ORDER BY created_at",
+            RECOVERABLE_STATUSES,
+        )
+        recovered = []
+        for (data,) in rows:
+            job = job_from_dict(json.loads(data))
+            job.status = JobStatus.SUBMITTED
+            job.total_functions = job.processed_functions = 0
+            job.functions = []
+            job.partial_functions = {}
+            job.error = None
+            job.source_tokens = job.reduced_tokens = 0
+            job.updated_at = datetime.utcnow()  # Results were reset: new ETag, visible to since=.
+            await self.save(job)
+            recovered.append(job.id)
+        await self.flush()
+        return recovered
+
+
+def retention_policy() -> RetentionPolicy:
+    """Policy from JOB_RETENTION_MAX_JOBS / _MAX_AGE (seconds) / _MAX_BYTES."""
+    return RetentionPolicy(
+        max_jobs=int(os.getenv("JOB_RETENTION_MAX_JOBS", "0")),
+        max_age=float(os.getenv("JOB_RETENTION_MAX_AGE", "0")),
+        max_bytes=int(os.getenv("JOB_RETENTION_MAX_BYTES", "0")),
+    )
+
+
+def create_store(shared: bool = False) -> JobStore:
+    """
+    Build the store selected by JOB_STORE (memory | sqlite).
+    shared: other processes use the same store (durable queue backends).
+    """
+    backend = os.getenv("JOB_STORE", "memory")
+    if backend == "sqlite":
+        return SQLiteJobStore(
+            os.getenv("JOB_STORE_PATH", "jobs.db"),
+            flush_interval=float(os.getenv("JOB_STORE_FLUSH_INTERVAL", "0.05")),
+            shared=shared,
+        )
+    if shared:
+        raise RuntimeError("A shared queue (QUEUE_BACKEND=sqlite|redis) needs JOB_STORE=sqlite")
+    return InMemoryJobStore()
@@ -0,0 +1,320 @@
+import asyncio
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from .render import ArtifactCache, run_mmdc
+
+
+class MermaidSyntaxError(ValueError):
+    """Raised by parse_flowchart; message mirrors mermaid's "Parse error on line N"."""
+
+    def __init__(self, line: int, message: str):
+        super().__init__(f"Parse error on line {line}: {message}")
+        self.line = line
+        self.message = message
+
+
+@dataclass
+class FlowNode:
+    """Flowchart vertex; shape is the opening delimiter, e.g. "[", "([", "{"."""
+    id: str
+    label: str
+    shape: str = "["
+
+
+@dataclass
+class FlowEdge:
+    """id: optional edge id (`A e1@--> B`), the target of `e1@{ ... }` statements."""
+    source: str
+    target: str
+    label: Optional[str] = None
+    arrow: str = "-->"
+    id: Optional[str] = None
+
+
+@dataclass
+class FlowSubgraph:
+    id: str
+    title: str
+    nodes: List[str] = field(default_factory=list)
+
+
+@dataclass
+class FlowchartGraph:
+    """Parsed `flowchart`/`graph` diagram; nodes keep first-seen order."""
+    direction: str = "TD"
+    nodes: Dict[str, FlowNode] = field(default_factory=dict)
+    edges: List[FlowEdge] = field(default_factory=list)
+    subgraphs: List[FlowSubgraph] = field(default_factory=list)
+
+
+# (open, close) pairs, longest opener first so "((" wins over "(".
+SHAPES: List[Tuple[str, str]] = [
+    ("(((", ")))"), ("([", "])"), ("[[", "]]"), ("[(", ")]"), ("((", "))"),
+    ("{{", "}}"), ("[/", "/]"), ("[/", "\\]"), ("[\\", "\\]"), ("[\\", "/]"),
+    ("[", "]"), ("(", ")"), ("{", "}"), (">", "]"),
+]
+_LABEL_FORBIDDEN = set('"[](){}')
+_RESERVED_IDS = {"end", "subgraph", "graph", "flowchart"}
+_DIRECTIONS = {"TD", "TB", "BT", "RL", "LR"}
+_PASSTHROUGH = ("classDef ", "class ", "style ", "linkStyle ", "click ", "accTitle", "accDescr")
+
+_HEADER_RE = re.compile(r"^(flowchart|graph)(?:\s+(TD|TB|BT|RL|LR))?\s*$")
+_ID_RE = re.compile(r"\w+")
+_CLASS_RE = re.compile(r":::\w+")
+_TEXT_EDGE_RE = re.compile(
+    r"<?(--|==|-\.)\s+(?P<text>[^\s-][^|]*?)\s+(?P<end>-{2,}>|-{3,}|={2,}>|={3,}|\.-+>|\.-+)"
+)
+_EDGE_RE = re.compile(
+    r"<?(?:-{2,}>|-{3,}|={2,}>|={3,}|-\.+->|-\.+-|~{3,}|--[ox](?=\s|$)|==[ox](?=\s|$))"
+)
+_PIPE_LABEL_RE = re.compile(r"\|([^|]*)\|")
+_EDGE_ID_RE = re.compile(r"(\w+)@(?=[-=.~<])")
+_EDGE_DATA_RE = re.compile(r"^\w+@\{.*\}$")
+
+
+def _split_statements(line: str) -> List[str]:
+    """Split a line on ";" outside quotes and brackets."""
+    parts, depth, quoted, start = [], 0, False, 0
+    for i, ch in enumerate(line):
+        if ch == '"':
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif ch in "[({":
+            depth += 1
+        elif ch in "])}":
+            depth = max(depth - 1, 0)
+        elif ch == ";" and depth == 0:
+            parts.append(line[start:i])
+            start = i + 1
+    parts.append(line[start:])
+    return parts
+
+
+class _StatementParser:
+    """Cursor over one statement: node groups joined by edges."""
+
+    def __init__(self, graph: FlowchartGraph, text: str, line_no: int, members: Optional[List[str]]):
+        self.graph = graph
+        self.text = text
+        self.pos = 0
+        self.line_no = line_no
+        self.members = members
+
+    def error(self, message: str) -> MermaidSyntaxError:
+        return MermaidSyntaxError(self.line_no, message)
+
+    def skip_space(self):
+        while self.pos < len(self.text) and self.text[self.pos] in " \t":
+            self.pos += 1
+
+    def parse(self):
+        sources = self.node_group()
+        while True:
+            self.skip_space()
+            if self.pos >= len(self.text):
+                return
+            edge_id, arrow, label = self.edge()
+            targets = self.node_group()
+            for src in sources:
+                for dst in targets:
+                    self.graph.edges.append(FlowEdge(src, dst, label, arrow, edge_id))
+            sources = targets
+
+    def node_group(self) -> List[str]:
+        ids = [self.node()]
+        while True:
+            self.skip_space()
+            if self.text.startswith("&", self.pos):
+                self.pos += 1
+                ids.append(self.node())
+            else:
+                return ids
+
+    def node(self) -> str:
+        self.skip_space()
+        match = _ID_RE.match(self.text, self.pos)
+        if not match:
+            found = self.text[self.pos:self.pos + 1] or "end of line"
+            raise self.error(f"Expecting node id, got '{found}'")
+        node_id = match.group()
+        if node_id in _RESERVED_IDS:
+            raise self.error(f"Reserved word '{node_id}' cannot be used as a node id")
+        self.pos = match.end()
+        label, shape = self.shape(node_id)
+        existing = self.graph.nodes.get(node_id)
+        if existing is None:
+            self.graph.nodes[node_id] = FlowNode(node_id, label if label is not None else node_id, shape or "[")
+        elif label is not None:
+            existing.label, existing.shape = label, shape
+        if self.members is not None and node_id not in self.members:
+            self.members.append(node_id)
+        class_match = _CLASS_RE.match(self.text, self.pos)
+        if class_match:
+            self.pos = class_match.end()
+        return node_id
+
+    def shape(self, node_id: str) -> Tuple[Optional[str], Optional[str]]:
+        for opener, closer in SHAPES:
+            if not self.text.startswith(opener, self.pos):
+                continue
+            start = self.pos + len(opener)
+            if self.text.startswith('"', start):
+                end_quote = self.text.find('"', start + 1)
+                if end_quote < 0:
+                    raise self.error(f"Unterminated string in label of node '{node_id}'")
+                if not self.text.startswith(closer, end_quote + 1):
+                    continue
+                self.pos = end_quote + 1 + len(closer)
+                return self.text[start + 1:end_quote], opener
+            end = self.text.find(closer, start)
+            if end < 0:
+                continue
+            label = self.text[start:end]
+            bad = next((ch for ch in label if ch in _LABEL_FORBIDDEN), None)
+            if bad:
+                raise self.error(
+                    f"Unexpected '{bad}' in label of node '{node_id}'; quote the label or remove it"
+                )
+            self.pos = end + len(closer)
+            return label, opener
+        if self.pos < len(self.text) and self.text[self.pos] in "[({>":
+            raise self.error(f"Unbalanced brackets in node '{node_id}'")
+        return None, None
+
+    def edge(self) -> Tuple[Optional[str], str, Optional[str]]:
+        edge_id = None
+        id_match = _EDGE_ID_RE.match(self.text, self.pos)
+        if id_match:
+            edge_id = id_match.group(1)
+            if any(edge.id == edge_id for edge in self.graph.edges):
+                raise self.error(f"Duplicate edge id '{edge_id}'")
+            self.pos = id_match.end()
+        match = _TEXT_EDGE_RE.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+            arrow = match.group("end")
+            return edge_id, ("-" + arrow if match.group(1) == "-." else arrow), match.group("text")
+        match = _EDGE_RE.match(self.text, self.pos)
+        if not match:
+            raise self.error(f"Expecting link, got '{self.text[self.pos:self.pos + 10]}'")
+        self.pos = match.end()
+        self.skip_space()
+        label = None
+        pipe = _PIPE_LABEL_RE.match(self.text, self.pos)
+        if pipe:
+            label = pipe.group(1)
+            if label.count('"') % 2:
+                raise self.error("Unterminated string in link label")
+            self.pos = pipe.end()
+        elif self.text.startswith("|", self.pos):
+            raise self.error("Unterminated '|' link label")
+        return edge_id, match.group(), label
+
+
+def parse_flowchart(text: str, partial: bool = False) -> FlowchartGraph:
+    """
+    Parse the `flowchart`/`graph` subset of Mermaid that we generate.
+    Raises MermaidSyntaxError on the first problem mmdc would also reject:
+    quotes/brackets inside unquoted labels, reserved ids like `end`,
+    unbalanced brackets, malformed links and unclosed subgraphs.
+    partial=True checks a prefix of a diagram still being streamed: open
+    subgraphs and a missing body are not errors yet.
+    """
+    graph = FlowchartGraph()
+    stack: List[FlowSubgraph] = []
+    seen_header = False
+    for line_no, raw in enumerate(text.splitlines(), start=1):
+        line = raw.strip()
+        if not line or line.startswith("%%"):
+            continue
+        for statement in _split_statements(line):
+            statement = statement.strip()
+            if not statement:
+                continue
+            if not seen_header:
+                header = _HEADER_RE.match(statement)
+                if not header:
+                    raise MermaidSyntaxError(line_no, "Diagram must start with 'flowchart' or 'graph'")
+                graph.direction = header.group(2) or "TD"
+                seen_header = True
+                continue
+            keyword = statement.split(None, 1)[0]
+            if keyword == "subgraph":
+                title = statement[len("subgraph"):].strip()
+                match = re.match(r"^(\w+)\s*\[(.*)\]$", title)
+                if match:
+                    sub_id, title = match.group(1), match.group(2).strip('"')
+                else:
+                    title = title.strip('"')
+                    sub_id = title or f"subgraph{len(graph.subgraphs)}"
+                stack.append(FlowSubgraph(sub_id, title))
+                graph.subgraphs.append(stack[-1])
+            elif statement == "end":
+                if not stack:
+                    raise MermaidSyntaxError(line_no, "'end' without matching 'subgraph'")
+                stack.pop()
+            elif keyword == "direction":
+                if statement.split()[-1] not in _DIRECTIONS:
+                    raise MermaidSyntaxError(line_no, f"Unknown direction in '{statement}'")
+            elif statement.startswith(_PASSTHROUGH):
+                continue
+            elif _EDGE_DATA_RE.match(statement):
+                edge_id = statement.split("@", 1)[0]
+                if not any(edge.id == edge_id for edge in graph.edges):
+                    raise MermaidSyntaxError(line_no, f"Unknown edge id '{edge_id}'")
+            else:
+                members = stack[-1].nodes if stack else None
+                _StatementParser(graph, statement, line_no, members).parse()
+    if partial:
+        return graph
+    if not seen_header:
+        raise MermaidSyntaxError(1, "Empty diagram")
+    if stack:
+        raise MermaidSyntaxError(len(text.splitlines()), f"Subgraph '{stack[-1].id}' is missing 'end'")
+    return graph
+
+
+class MermaidValidator:
+    """
+    Long-lived validation service shared by all workers.
+    - mode "local": in-process parse_flowchart (milliseconds, no subprocess).
+    - mode "mmdc": render with the mermaid CLI under a timeout (catches
+      anything the local grammar doesn't model, at the cost of Chromium).
+    - mode "both": local first, mmdc only for diagrams that pass locally.
+    Returns (valid, error) so parse errors/stderr reach FunctionResult.error.
+    mmdc renders go to `artifacts` so the SVG endpoint can serve them as-is.
+    """
+
+    def __init__(
+        self,
+        mode: str = "local",
+        timeout: float = 30.0,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        artifacts: Optional[ArtifactCache] = None,
+    ):
+        self.mode = mode
+        self.timeout = timeout
+        self.semaphore = semaphore or asyncio.Semaphore(2)
+        self.artifacts = artifacts
+
+    async def validate(self, mermaid_text: str) -> Tuple[bool, Optional[str]]:
+        if self.mode in ("local", "both"):
+            try:
+                parse_flowchart(mermaid_text)
+            except MermaidSyntaxError as exc:
+                return False, str(exc)
+            if self.mode == "local":
+                return True, None
+        return await self._validate_mmdc(mermaid_text)
+
+    async def _validate_mmdc(self, mermaid_text: str) -> Tuple[bool, Optional[str]]:
+        """Render via mmdc; the SVG is kept in the artifact cache instead of discarded."""
+        svg, error = await run_mmdc(mermaid_text, "svg", self.timeout, self.semaphore)
+        if svg is None:
+            return False, error
+        if self.artifacts is not None:
+            await self.artifacts.put(mermaid_text, "svg", svg)
+        return True, None
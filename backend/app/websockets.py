@@ -1,90 +1,149 @@
 import asyncio
-from typing import Dict, Set
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
 
-from fastapi import WebSocket, WebSocketDisconnect
+from fastapi import Request, WebSocket
 
-from .models import JobState, to_detail
+from .models import JobState
+from .serialize import dumps, summary_dict
 
+LIST_CHANNEL = "*"  # Summary updates for every job (jobs list page).
+SUBSCRIBER_QUEUE_SIZE = 256
+SSE_HEARTBEAT_SECONDS = 15.0
 
-class JobWebSocketManager:
+Event = Dict[str, Any]
+
+
+class ChannelGone(Exception):
+    """
+    Raised by a snapshot() callback when the channel's job no longer exists
+    (e.g. evicted mid-stream): the event is sent last and the stream ends.
+    """
+
+    def __init__(self, event: Event):
+        super().__init__(event.get("type"))
+        self.event = event
+
+
+class JobUpdateManager:
     """
-    Manages WebSocket connections for real-time job status updates.
-    Groups connections by job_id; broadcasts updates to all clients watching a job.
-    TODO: Currently unused; enable in main.py and services.py to activate push updates.
+    Fan-out of job updates to push subscribers (WebSocket and SSE alike).
+    Each subscriber owns a bounded queue drained by its own connection
+    coroutine, so publishing never blocks the pipeline and per-client
+    ordering is preserved. A subscriber that falls too far behind has its
+    queue replaced by a single "resync" event and is sent a fresh snapshot.
+    Channels: a job id (state diffs for one job) or LIST_CHANNEL (summaries).
     """
+
     def __init__(self):
-        self.connections: Dict[str, Set[WebSocket]] = {}
-        self.lock = asyncio.Lock()
-        self.loop: asyncio.AbstractEventLoop | None = None
+        self.subscribers: Dict[str, Set["asyncio.Queue[Event]"]] = {}
 
-    def set_loop(self, loop: asyncio.AbstractEventLoop):
-        """
-        Store event loop for thread-safe coroutine scheduling.
-        Must be called from lifespan startup before broadcast_job is used.
-        """
-        self.loop = loop
+    def subscribe(self, channel: str) -> "asyncio.Queue[Event]":
+        queue: "asyncio.Queue[Event]" = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.setdefault(channel, set()).add(queue)
+        return queue
 
-    async def connect(self, job_id: str, websocket: WebSocket):
-        """
-        Accept and register a WebSocket for job updates.
-        Called from WebSocket endpoint after validation.
-        """
-        await websocket.accept()
-        async with self.lock:
-            self.connections.setdefault(job_id, set()).add(websocket)
+    def unsubscribe(self, channel: str, queue: "asyncio.Queue[Event]"):
+        """Remove a subscriber; cleanup channel key if empty."""
+        queues = self.subscribers.get(channel)
+        if queues and queue in queues:
+            queues.remove(queue)
+            if not queues:
+                self.subscribers.pop(channel, None)
 
-    async def disconnect(self, job_id: str, websocket: WebSocket):
+    def has_subscribers(self, job_id: str) -> bool:
+        return bool(self.subscribers.get(job_id) or self.subscribers.get(LIST_CHANNEL))
+
+    def _publish(self, channel: str, event: Event):
+        for queue in list(self.subscribers.get(channel, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+
+    def publish_changes(self, job: JobState, changes: Dict[str, Any], list_summary: bool = True):
         """
-        Remove WebSocket from connections; cleanup job_id key if empty.
+        Push a state diff (camelCase fields that changed) for one job, plus the
+        job's summary to list subscribers. Must be called from the event loop.
+        list_summary=False for detail-only changes (e.g. streaming partials).
         """
-        async with self.lock:
-            conns = self.connections.get(job_id)
-            if conns and websocket in conns:
-                conns.remove(websocket)
-                if not conns:
-                    self.connections.pop(job_id, None)
-
-    async def _broadcast(self, job_id: str, payload: dict):
+        if self.subscribers.get(job.id):
+            self._publish(job.id, {"type": "job_update", "id": job.id, "changes": changes})
+        if list_summary and self.subscribers.get(LIST_CHANNEL):
+            self._publish(LIST_CHANNEL, {"type": "job_summary", "job": summary_dict(job)})
+
+    def publish_resync(self):
+        """Ask list subscribers to refetch (e.g. after a bulk insert)."""
+        self._publish(LIST_CHANNEL, {"type": "resync"})
+
+    async def serve_websocket(
+        self, websocket: WebSocket, channel: str, snapshot: Optional[Callable[[], Awaitable[Event]]] = None
+    ):
         """
-        Send JSON payload to all WebSockets watching this job_id.
-        Automatically disconnects failed sockets.
+        Stream a channel over an accepted WebSocket until the client goes away.
+        snapshot() (if given) is sent first and again whenever a resync is needed;
+        if it raises ChannelGone, its event is sent and the socket closed with 4004.
         """
-        conns = list(self.connections.get(job_id, set()))
-        for ws in conns:
+        queue = self.subscribe(channel)
+
+        async def send_events():
             try:
-                await ws.send_json(payload)
-            except WebSocketDisconnect:
-                await self.disconnect(job_id, ws)
-            except Exception:
-                await self.disconnect(job_id, ws)
+                if snapshot:
+                    await websocket.send_text(dumps(await snapshot()).decode())
+                while True:
+                    event = await queue.get()
+                    if event["type"] == "resync" and snapshot:
+                        event = await snapshot()
+                    await websocket.send_text(dumps(event).decode())
+            except ChannelGone as gone:
+                await websocket.send_text(dumps(gone.event).decode())
+                await websocket.close(code=4004)  # 4004 = Not Found
 
-    def broadcast_job(self, job: JobState):
-        """
-        Thread-safe broadcast from sync context (e.g., worker thread).
-        Serializes job to JSON and pushes to all connected clients.
-        NOTE: No-op if loop is unset; caller must ensure set_loop was invoked.
-        """
-        payload = {
-            "type": "job_update",
-            "job": to_detail(job).model_dump(by_alias=True),
-        }
-        if self.loop:
-            asyncio.run_coroutine_threadsafe(
-                self._broadcast(job.id, payload), self.loop
-            )
-        # NOTE: No-op if loop is unset; caller must ensure set_loop was invoked.
-
-    async def send_job(self, job: JobState):
+        async def receive_until_closed():
+            # We only expect server-to-client pushes; reads just detect disconnects.
+            while True:
+                await websocket.receive_text()
+
+        tasks = [asyncio.create_task(send_events()), asyncio.create_task(receive_until_closed())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.unsubscribe(channel, queue)
+
+    async def sse_events(
+        self, request: Request, channel: str, snapshot: Optional[Callable[[], Awaitable[Event]]] = None
+    ) -> AsyncIterator[str]:
         """
-        Async broadcast from within async context (e.g., WebSocket endpoint).
-        Sends initial job state to newly connected client.
+        Server-Sent Events body for a channel (fallback when WebSockets are blocked).
+        Emits a heartbeat comment every SSE_HEARTBEAT_SECONDS to keep proxies open.
+        A ChannelGone from snapshot() ends the stream after its event.
         """
-        payload = {
-            "type": "job_update",
-            "job": to_detail(job).model_dump(by_alias=True),
-        }
-        await self._broadcast(job.id, payload)
+        queue = self.subscribe(channel)
+        try:
+            if snapshot:
+                yield _sse(await snapshot())
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event["type"] == "resync" and snapshot:
+                    event = await snapshot()
+                yield _sse(event)
+        except ChannelGone as gone:
+            yield _sse(gone.event)
+        finally:
+            self.unsubscribe(channel, queue)
+
 
+def _sse(event: Event) -> str:
+    # Unnamed events so EventSource.onmessage sees every type; "type" is in the payload.
+    return f"data: {dumps(event).decode()}\n\n"
 
-manager = JobWebSocketManager()
 
+manager = JobUpdateManager()
@@ -0,0 +1,109 @@
+"""
+C corpora for benchmarks: .c files from a directory or tarball, or a seeded
+synthetic corpus whose functions range from straight-line helpers to nested
+loops with switches (so auto mode exercises both generators).
+"""
+import os
+import random
+import tarfile
+from typing import List
+
+_TYPES = ["int", "long", "unsigned", "size_t", "double"]
+_CALLS = ["log_value", "update_stats", "flush_buffer", "check_limits", "emit"]
+
+
+def load_corpus(path: str) -> List[str]:
+    """Source texts of every BATCH_EXTENSIONS file under a directory or inside a tarball."""
+    from app.config import settings  # Deferred: settings are read from env at import.
+
+    sources = []
+    if os.path.isfile(path) and tarfile.is_tarfile(path):
+        with tarfile.open(path) as archive:
+            for member in archive.getmembers():
+                if member.isfile() and member.name.endswith(settings.batch_extensions):
+                    sources.append(archive.extractfile(member).read().decode(errors="replace"))
+        return sources
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            if name.endswith(settings.batch_extensions):
+                with open(os.path.join(root, name), errors="replace") as handle:
+                    sources.append(handle.read())
+    return sources
+
+
+class _Writer:
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.lines: List[str] = []
+
+    def emit(self, depth: int, text: str):
+        self.lines.append("    " * depth + text)
+
+    def simple(self, depth: int):
+        choice = self.rng.randrange(4)
+        if choice == 0:
+            self.emit(depth, f"total += values[i] * {self.rng.randint(2, 9)};")
+        elif choice == 1:
+            self.emit(depth, f"{self.rng.choice(_CALLS)}(total, i);")
+        elif choice == 2:
+            self.emit(depth, "count++;")
+        else:
+            self.emit(depth, f"total = (total << 1) ^ {self.rng.randint(1, 255)};")
+
+    def block(self, depth: int, budget: int):
+        """Statements with about `budget` decision points."""
+        for _ in range(self.rng.randint(1, 3)):
+            self.simple(depth)
+        while budget > 0:
+            kind = self.rng.choice(["if", "for", "while", "switch"])
+            inner = self.rng.randint(0, budget - 1)
+            budget -= inner + 1
+            if kind == "if":
+                self.emit(depth, f"if (values[i] > {self.rng.randint(0, 100)}) {{")
+                self.block(depth + 1, inner)
+                if self.rng.random() < 0.5:
+                    self.emit(depth, "} else {")
+                    self.simple(depth + 1)
+                self.emit(depth, "}")
+            elif kind == "for":
+                self.emit(depth, "for (i = 0; i < n; i++) {")
+                self.block(depth + 1, inner)
+                self.emit(depth, "}")
+            elif kind == "while":
+                self.emit(depth, "while (count < n && total != 0) {")
+                self.block(depth + 1, inner)
+                self.emit(depth, "count++;")
+                self.emit(depth, "}")
+            else:
+                self.emit(depth, "switch (values[i] & 3) {")
+                for case in range(self.rng.randint(2, 4)):
+                    self.emit(depth, f"case {case}:")
+                    self.simple(depth + 1)
+                    self.emit(depth + 1, "break;")
+                self.emit(depth, "default:")
+                self.block(depth + 1, inner)
+                self.emit(depth, "}")
+
+
+def synthetic_corpus(files: int, seed: int = 0, max_functions: int = 6, max_complexity: int = 12) -> List[str]:
+    """`files` C sources of 1..max_functions functions; every function name is unique."""
+    rng = random.Random(seed)
+    sources = []
+    serial = 0
+    for _ in range(files):
+        parts = ["#include <stddef.h>", ""]
+        for _ in range(rng.randint(1, max_functions)):
+            serial += 1
+            writer = _Writer(rng)
+            writer.block(1, rng.randint(0, max_complexity))
+            ret = rng.choice(_TYPES)
+            parts.append(f"{ret} func_{serial}(const int *values, size_t n)")
+            parts.append("{")
+            parts.append("    size_t i = 0, count = 0;")
+            parts.append(f"    {ret} total = {serial};")
+            parts.extend(writer.lines)
+            parts.append("    return total;")
+            parts.append("}")
+            parts.append("")
+        sources.append("\n".join(parts))
+    return sources
@@ -0,0 +1,166 @@
+"""
+Local stand-in for the Azure OpenAI chat completions endpoint.
+
+Speaks enough of the API for LLMClient (streamed SSE chunks plus a final usage
+chunk). Diagrams come from the deterministic local generator, so validation
+and caching behave as with real output. Latency, errors, 429s and invalid
+diagrams are drawn from the configured distributions.
+
+    python -m bench.fake_llm --port 8900 --latency-median 2 --rate-429 0.05
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.flowgen import FlowgenError, generate_flowchart
+from app.ratelimit import estimate_tokens
+
+_CODE_RE = re.compile(r"C code:\s*\n([\s\S]*?)(?:\n\s*Return ONLY|\Z)")
+# Micro-batched prompts (LLMClient.generate_batch): one fenced snippet per section.
+_SNIPPET_RE = re.compile(r"^### Snippet (\d+)\n```c\n([\s\S]*?)\n```", re.MULTILINE)
+
+
+@dataclass
+class FakeLLMConfig:
+    latency_median: float = 1.0  # Seconds to first token (lognormal median).
+    latency_sigma: float = 0.5
+    tokens_per_second: float = 200.0  # Streaming speed after the first token.
+    error_rate: float = 0.0  # Fraction of calls answered with a 500.
+    rate_429: float = 0.0  # Fraction of calls answered with a 429.
+    retry_after: float = 1.0  # Retry-After sent with 429s.
+    invalid_rate: float = 0.0  # Fraction of diagrams with a reserved `end` node id.
+    seed: int = 0
+
+
+def create_app(config: FakeLLMConfig) -> FastAPI:
+    app = FastAPI(title="Fake Azure OpenAI")
+    rng = random.Random(config.seed)
+    stats: Dict[str, int] = {"calls": 0, "ok": 0, "errors": 0, "throttled": 0, "invalid": 0}
+
+    def diagram(code: str) -> str:
+        try:
+            mermaid = generate_flowchart(code).strip()
+        except FlowgenError:
+            mermaid = "flowchart TD\n    A([start]) --> B[process]\n    B --> C([end])"
+        if rng.random() < config.invalid_rate:
+            stats["invalid"] += 1
+            mermaid = mermaid.replace("End(", "end(").replace("--> End", "--> end")
+        return f"```mermaid\n{mermaid}\n```"
+
+    def reply(prompt: str) -> str:
+        snippets = _SNIPPET_RE.findall(prompt)
+        if snippets:
+            return "\n\n".join(f"### Snippet {number}\n{diagram(code)}" for number, code in snippets)
+        match = _CODE_RE.search(prompt)
+        return diagram(match.group(1) if match else prompt)
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def completions(deployment: str, request: Request):
+        body = await request.json()
+        stats["calls"] += 1
+        await asyncio.sleep(rng.lognormvariate(math.log(max(config.latency_median, 1e-3)), config.latency_sigma))
+        roll = rng.random()
+        if roll < config.rate_429:
+            stats["throttled"] += 1
+            return JSONResponse(
+                {"error": {"code": "429", "message": "Rate limit exceeded"}},
+                status_code=429,
+                headers={"retry-after": str(config.retry_after)},
+            )
+        if roll < config.rate_429 + config.error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"error": {"code": "500", "message": "Injected failure"}}, status_code=500)
+
+        prompt = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+        content = reply(prompt)
+        usage = {
+            "prompt_tokens": estimate_tokens(prompt),
+            "completion_tokens": estimate_tokens(content),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        stats["ok"] += 1
+        base = {"id": f"fake-{stats['calls']}", "created": int(time.time()), "model": deployment}
+
+        if not body.get("stream"):
+            return {
+                **base, "object": "chat.completion", "usage": usage,
+                "choices": [{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }],
+            }
+
+        async def events():
+            chunk_chars = 16  # About four tokens per chunk.
+            delay = (chunk_chars / 4) / config.tokens_per_second if config.tokens_per_second > 0 else 0
+            for start in range(0, len(content), chunk_chars):
+                delta = {"content": content[start:start + chunk_chars]}
+                if start == 0:
+                    delta["role"] = "assistant"
+                chunk = {
+                    **base, "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(delay)
+            done = {
+                **base, "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            yield f"data: {json.dumps(done)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Fake LLM options (shared with bench.run)."""
+    defaults = FakeLLMConfig()
+    parser.add_argument("--latency-median", type=float, default=defaults.latency_median)
+    parser.add_argument("--latency-sigma", type=float, default=defaults.latency_sigma)
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--rate-429", type=float, default=defaults.rate_429)
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after)
+    parser.add_argument("--invalid-rate", type=float, default=defaults.invalid_rate)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeLLMConfig:
+    return FakeLLMConfig(
+        latency_median=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        rate_429=args.rate_429,
+        retry_after=args.retry_after,
+        invalid_rate=args.invalid_rate,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,280 @@
+"""
+Pipeline benchmark: POST /api/jobs -> worker pool -> LLM -> validation,
+against the fake LLM server (bench.fake_llm) and the stub mmdc (bench/bin).
+
+Jobs arrive at a fixed rate (or Poisson with --poisson) for --duration
+seconds; the run then waits for every job to finish and reports throughput,
+submit latency, queue wait, end-to-end and per-stage percentiles.
+
+    python -m bench.run --rate 5 --duration 60 --latency-median 2 --rate-429 0.05
+    python -m bench.run --corpus ./src --mode llm --validator both --json out.json
+
+Any app setting (WORKER_CONCURRENCY, LLM_CONCURRENCY, ...) can be passed
+through the environment as usual; bench-only settings are flags.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from bench import fake_llm
+from bench.corpus import load_corpus, synthetic_corpus
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..100); 0.0 for no samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(samples),
+        "p50": percentile(samples, 50),
+        "p90": percentile(samples, 90),
+        "p99": percentile(samples, 99),
+        "max": max(samples) if samples else 0.0,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_llm(args: argparse.Namespace, port: int) -> subprocess.Popen:
+    """Fake LLM in its own process so its latency does not share our event loop."""
+    command = [
+        sys.executable, "-m", "bench.fake_llm", "--port", str(port),
+        "--latency-median", str(args.latency_median), "--latency-sigma", str(args.latency_sigma),
+        "--tokens-per-second", str(args.tokens_per_second), "--error-rate", str(args.error_rate),
+        "--rate-429", str(args.rate_429), "--retry-after", str(args.retry_after),
+        "--invalid-rate", str(args.invalid_rate), "--seed", str(args.seed),
+    ]
+    process = subprocess.Popen(command, cwd=os.path.dirname(BENCH_DIR))
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError("fake LLM server exited during startup")
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("fake LLM server did not start")
+
+
+def configure_environment(args: argparse.Namespace, port: int):
+    """Point the app at the fake LLM / stub mmdc; must run before app modules are imported."""
+    os.environ.update({
+        "AZURE_API_ENDPOINT": f"http://127.0.0.1:{port}",
+        "AZURE_API_KEY": "bench",
+        "AZURE_DEPLOYMENT": "bench",
+        "LLM_STREAM_USAGE": "1",
+        "CLIENT_JOBS_PER_MINUTE": "0",  # The harness is one client by design.
+        "MERMAID_VALIDATOR": args.validator,
+        "STUB_MMDC_DELAY": str(args.mmdc_delay),
+        "PATH": os.path.join(BENCH_DIR, "bin") + os.pathsep + os.environ.get("PATH", ""),
+    })
+    if args.no_cache:
+        os.environ["FLOWCHART_CACHE_SIZE"] = "0"
+        os.environ.pop("FLOWCHART_CACHE_DB", None)
+    os.environ.setdefault("JOB_STORE", "memory")
+
+
+async def drive(args: argparse.Namespace, sources: List[str]) -> Dict:
+    import httpx
+    import main
+    from app import metrics
+    from app.models import JobStatus
+    from app.store import TERMINAL_STATUSES
+
+    # Raw stage samples for exact percentiles (the histogram only keeps buckets).
+    stages: Dict[str, List[float]] = defaultdict(list)
+    observe = metrics.stage_seconds.observe
+
+    def record(value: float, **labels: str):
+        stages[labels.get("stage", "")].append(value)
+        observe(value, **labels)
+
+    metrics.stage_seconds.observe = record
+
+    rng = random.Random(args.seed)
+    submit_latency: List[float] = []
+    job_ids: List[str] = []
+    rejected = 0
+
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+
+            async def submit(code: str):
+                nonlocal rejected
+                started = time.perf_counter()
+                response = await client.post("/api/jobs", json={"code": code, "mode": args.mode})
+                submit_latency.append(time.perf_counter() - started)
+                if response.status_code == 200:
+                    job_ids.append(response.json()["id"])
+                else:
+                    rejected += 1
+
+            started = time.perf_counter()
+            submissions = []
+            index = 0
+            next_at = started
+            while next_at - started < args.duration:
+                await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+                submissions.append(asyncio.create_task(submit(sources[index % len(sources)])))
+                index += 1
+                gap = rng.expovariate(args.rate) if args.poisson else 1 / args.rate
+                next_at += gap
+            await asyncio.gather(*submissions)
+            arrivals_done = time.perf_counter()
+
+            from app.services import job_store
+
+            pending = set(job_ids)
+            drain_deadline = time.perf_counter() + args.drain_timeout
+            while pending and time.perf_counter() < drain_deadline:
+                for job_id in list(pending):
+                    job = await job_store.get(job_id)
+                    if job is None or job.status in TERMINAL_STATUSES:  # None: evicted by retention.
+                        pending.discard(job_id)
+                await asyncio.sleep(0.1)
+            finished = time.perf_counter()
+
+            jobs = [job for job_id in job_ids if (job := await job_store.get(job_id))]
+
+    end_to_end = [
+        (job.updated_at - job.created_at).total_seconds() for job in jobs if job.status in TERMINAL_STATUSES
+    ]
+    functions = sum(job.processed_functions for job in jobs if job.status == JobStatus.COMPLETED)
+    generators: Dict[str, int] = defaultdict(int)
+    for job in jobs:
+        for func in job.functions:
+            generators[func.generator or "llm"] += 1
+    elapsed = finished - started
+    return {
+        "config": {
+            "rate": args.rate, "duration": args.duration, "poisson": args.poisson, "mode": args.mode,
+            "validator": args.validator, "corpus_files": len(sources),
+            "workers": os.getenv("WORKER_CONCURRENCY", "4"), "llm_concurrency": os.getenv("LLM_CONCURRENCY", "4"),
+        },
+        "submitted": len(job_ids) + rejected,
+        "rejected": rejected,
+        "completed": sum(1 for job in jobs if job.status == JobStatus.COMPLETED),
+        "failed": sum(1 for job in jobs if job.status == JobStatus.FAILED),
+        "cancelled": sum(1 for job in jobs if job.status == JobStatus.CANCELLED),
+        "evicted": len(job_ids) - len(jobs),
+        "unfinished": len(pending),
+        "elapsed_seconds": elapsed,
+        "drain_seconds": finished - arrivals_done,
+        "throughput_jobs_per_second": len(end_to_end) / elapsed if elapsed else 0.0,
+        "throughput_functions_per_second": functions / elapsed if elapsed else 0.0,
+        "functions_by_generator": dict(generators),
+        "validated_functions": sum(1 for job in jobs for func in job.functions if func.validated),
+        "submit_latency": summarize(submit_latency),
+        "end_to_end": summarize(end_to_end),
+        "stages": {stage: summarize(samples) for stage, samples in sorted(stages.items())},
+        "llm_calls": {key[0]: value for key, value in metrics.llm_calls.values.items()},
+        "repairs": {key[0]: value for key, value in metrics.repairs.values.items()},
+        "llm_batched": {key[0]: value for key, value in metrics.llm_batched.values.items()},
+        "preprocess_tokens": {key[0]: value for key, value in metrics.preprocess_tokens.values.items()},
+    }
+
+
+def print_report(report: Dict, llm_stats: Optional[Dict]):
+    def row(name: str, stats: Dict[str, float]):
+        print(
+            f"  {name:<16} n={stats['count']:<6} p50={stats['p50'] * 1000:9.1f}ms "
+            f"p90={stats['p90'] * 1000:9.1f}ms p99={stats['p99'] * 1000:9.1f}ms max={stats['max'] * 1000:9.1f}ms"
+        )
+
+    config = report["config"]
+    print(
+        f"\nrate={config['rate']}/s duration={config['duration']}s mode={config['mode']} "
+        f"validator={config['validator']} workers={config['workers']} llm_concurrency={config['llm_concurrency']}"
+    )
+    print(
+        f"jobs: submitted={report['submitted']} completed={report['completed']} failed={report['failed']} "
+        f"cancelled={report['cancelled']} evicted={report['evicted']} unfinished={report['unfinished']} "
+        f"rejected={report['rejected']}"
+    )
+    print(
+        f"throughput: {report['throughput_jobs_per_second']:.2f} jobs/s, "
+        f"{report['throughput_functions_per_second']:.2f} functions/s over {report['elapsed_seconds']:.1f}s "
+        f"(drain {report['drain_seconds']:.1f}s)"
+    )
+    print(f"functions: {report['functions_by_generator']} validated={report['validated_functions']}")
+    print(f"llm calls: {report['llm_calls']} repairs: {report['repairs']}")
+    if report["preprocess_tokens"]:
+        print(f"prompt code tokens: {report['preprocess_tokens']}")
+    if report["llm_batched"]:
+        print(f"micro-batching: {report['llm_batched']}")
+    if llm_stats:
+        print(f"fake llm: {llm_stats}")
+    print("latency:")
+    row("submit", report["submit_latency"])
+    row("end_to_end", report["end_to_end"])
+    for stage, stats in report["stages"].items():
+        if stage != "end_to_end":
+            row(stage, stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=2.0, help="Job arrivals per second.")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of arrivals.")
+    parser.add_argument("--poisson", action="store_true", help="Exponential inter-arrival times.")
+    parser.add_argument("--drain-timeout", type=float, default=300.0, help="Max seconds to wait for stragglers.")
+    parser.add_argument("--corpus", help="Directory or tarball of .c files (default: synthetic).")
+    parser.add_argument("--synthetic-files", type=int, default=200)
+    parser.add_argument("--mode", choices=["auto", "llm", "local"], default="llm")
+    parser.add_argument("--validator", choices=["local", "mmdc", "both"], default="local")
+    parser.add_argument("--mmdc-delay", type=float, default=0.2, help="Stub mmdc seconds per render.")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the flowchart cache.")
+    parser.add_argument("--json", help="Also write the report to this file.")
+    fake_llm.add_arguments(parser)
+    args = parser.parse_args()
+
+    port = _free_port()
+    configure_environment(args, port)
+    sources = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.synthetic_files, seed=args.seed)
+    if not sources:
+        parser.error("corpus has no C files")
+    server = start_fake_llm(args, port)
+    try:
+        report = asyncio.run(drive(args, sources))
+        llm_stats = None
+        try:
+            import httpx
+
+            llm_stats = httpx.get(f"http://127.0.0.1:{port}/stats", timeout=5).json()
+        except Exception:
+            pass
+    finally:
+        server.terminate()
+        server.wait()
+    report["fake_llm"] = llm_stats
+    print_report(report, llm_stats)
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(report, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
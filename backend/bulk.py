@@ -0,0 +1,309 @@
+"""
+Offline bulk generation: runs the job pipeline (splitting, local generator or
+LLM, preprocessing, validation, repair, flowchart cache) over files on disk,
+without the HTTP server, and writes one Mermaid file (plus SVG when mmdc is
+available) per function and a JSON manifest.
+
+    python bulk.py ../src --out flowcharts
+    python bulk.py src/a.c src/b.c --out flowcharts --mode local --no-svg
+
+Files whose content hash, mode and prompt version match the manifest of a
+previous run (and whose outputs still exist) are skipped. Settings such as
+LLM_TOKENS_PER_MINUTE or FLOWCHART_CACHE_DB come from the environment / .env
+as for the API.
+"""
+import os
+from dotenv import load_dotenv
+path = os.path.join(os.path.dirname(__file__), ".env")
+load_dotenv(dotenv_path=path)
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import multiprocessing
+import re
+import shutil
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 1
+POLL_INTERVAL = 0.2
+
+# (relative path, absolute path, sha256, size)
+SourceFile = Tuple[str, str, str, int]
+
+
+def collect_files(paths: List[str]) -> List[Tuple[str, str]]:
+    """
+    (relative path, absolute path) of every BATCH_EXTENSIONS file named or
+    under a directory. Relative paths (output locations and manifest keys)
+    are taken from the common parent of all arguments, so a/util.c and
+    b/util.c stay apart. Exits if two files would still share one.
+    """
+    # Read directly: app.config must not be imported before configure_environment().
+    extensions = tuple(os.getenv("BATCH_EXTENSIONS", ".c").split(","))
+    found: List[str] = []
+    for given in paths:
+        if os.path.isfile(given):
+            found.append(os.path.abspath(given))
+            continue
+        if not os.path.isdir(given):
+            raise SystemExit(f"No such file or directory: {given}")
+        for root, dirs, files in os.walk(given):
+            dirs.sort()
+            found.extend(
+                os.path.abspath(os.path.join(root, name)) for name in sorted(files) if name.endswith(extensions)
+            )
+    # A directory argument is its own root, a file's root is its directory.
+    roots = [os.path.abspath(given if os.path.isdir(given) else os.path.dirname(given) or ".") for given in paths]
+    base = os.path.commonpath(roots)
+    files: Dict[str, str] = {}
+    for absolute in found:
+        relative = os.path.relpath(absolute, base)
+        if files.get(relative, absolute) != absolute:
+            raise SystemExit(f"Two inputs map to the same output {relative}: {files[relative]} and {absolute}")
+        files[relative] = absolute
+    return sorted(files.items())
+
+
+def file_digest(absolute: str) -> Tuple[str, int]:
+    with open(absolute, "rb") as handle:
+        data = handle.read()
+    return hashlib.sha256(data).hexdigest(), len(data)
+
+
+def load_manifest(out_dir: str) -> Dict:
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as handle:
+            manifest = json.load(handle)
+    except (FileNotFoundError, ValueError):
+        return {"files": {}}
+    return manifest if manifest.get("version") == MANIFEST_VERSION else {"files": {}}
+
+
+def write_manifest(out_dir: str, manifest: Dict):
+    target = os.path.join(out_dir, MANIFEST)
+    with open(target + ".tmp", "w") as handle:
+        json.dump(manifest, handle, indent=2, sort_keys=True)
+    os.replace(target + ".tmp", target)
+
+
+def is_current(entry: Optional[Dict], digest: str, mode: str, prompt_version: str, svg: bool, out_dir: str) -> bool:
+    """Whether a manifest entry still describes this file's outputs, so the file can be skipped."""
+    if not entry or entry.get("status") != "completed":
+        return False
+    if (entry.get("sha256"), entry.get("mode"), entry.get("promptVersion")) != (digest, mode, prompt_version):
+        return False
+    for func in entry.get("functions", []):
+        outputs = [func.get("mermaid")] + ([func.get("svg")] if svg and func.get("validated") else [])
+        if not all(output and os.path.exists(os.path.join(out_dir, output)) for output in outputs):
+            return False
+    return True
+
+
+def shard(files: List[SourceFile], count: int) -> List[List[SourceFile]]:
+    """Split files into count shards of similar total size (largest first, onto the lightest shard)."""
+    shards: List[List[SourceFile]] = [[] for _ in range(count)]
+    loads = [0] * count
+    for item in sorted(files, key=lambda item: item[3], reverse=True):
+        index = loads.index(min(loads))
+        shards[index].append(item)
+        loads[index] += item[3]
+    return [part for part in shards if part]
+
+
+def configure_environment(args: argparse.Namespace, processes: int):
+    """
+    In-process memory store and queue; the LLM token budget and concurrency
+    limits are divided between processes so together they stay within quota.
+    Retention is off: finished jobs must stay until run_shard has polled them.
+    Must run before app modules are imported (children inherit the environment).
+    """
+    os.environ.update({
+        "JOB_STORE": "memory",
+        "QUEUE_BACKEND": "memory",
+        "CLIENT_JOBS_PER_MINUTE": "0",
+        "JOB_BLOB_DIR": "",
+        "JOB_RETENTION_MAX_JOBS": "0",
+        "JOB_RETENTION_MAX_AGE": "0",
+        "JOB_RETENTION_MAX_BYTES": "0",
+    })
+    cpus = os.cpu_count() or 1
+    tokens = int(os.getenv("LLM_TOKENS_PER_MINUTE", "60000"))
+    llm_concurrency = int(os.getenv("LLM_CONCURRENCY", "4"))
+    os.environ["LLM_TOKENS_PER_MINUTE"] = str(max(tokens // processes, 1))
+    os.environ["LLM_CONCURRENCY"] = str(max(math.ceil(llm_concurrency / processes), 1))
+    os.environ.setdefault("MMDC_CONCURRENCY", str(max(cpus // processes, 1)))
+    # Enough jobs in flight per process to keep every LLM slot busy.
+    workers = args.workers or max(4, 2 * int(os.environ["LLM_CONCURRENCY"]))
+    os.environ["WORKER_CONCURRENCY"] = str(workers)
+
+
+def _output_name(name: str, used: Dict[str, int]) -> str:
+    """File-safe function name, suffixed for duplicates (e.g. #ifdef variants)."""
+    base = re.sub(r"[^\w.-]", "_", name) or "flowchart"
+    used[base] = used.get(base, 0) + 1
+    return base if used[base] == 1 else f"{base}-{used[base]}"
+
+
+async def _write_outputs(job, out_dir: str, svg: bool) -> List[Dict]:
+    from fastapi import HTTPException
+    from app.services import render_function
+
+    relative_dir = job.path
+    # Start clean so diagrams of functions removed since the last run do not linger.
+    shutil.rmtree(os.path.join(out_dir, relative_dir), ignore_errors=True)
+    os.makedirs(os.path.join(out_dir, relative_dir), exist_ok=True)
+    used: Dict[str, int] = {}
+    functions = []
+    for func in job.functions:
+        stem = os.path.join(relative_dir, _output_name(func.name, used))
+        entry = {
+            "name": func.name, "validated": func.validated, "generator": func.generator,
+            "error": func.error, "mermaid": stem + ".mmd", "svg": None,
+        }
+        with open(os.path.join(out_dir, entry["mermaid"]), "w") as handle:
+            handle.write(func.mermaid)
+        if svg and func.validated:
+            try:
+                artifact = await render_function(job.id, func.name, "svg")
+                shutil.copyfile(artifact.variants[""], os.path.join(out_dir, stem + ".svg"))
+                entry["svg"] = stem + ".svg"
+            except HTTPException as exc:
+                entry["error"] = f"SVG render failed: {exc.detail}"
+        functions.append(entry)
+    return functions
+
+
+async def run_shard(files: List[SourceFile], out_dir: str, mode: str, svg: bool, label: str) -> Dict[str, Dict]:
+    """
+    Pipeline run over one shard: the files become one batch on the in-process
+    queue, served by the usual worker pool. Outputs are written as jobs finish.
+    Returns manifest entries keyed by relative path.
+    """
+    from app import services
+    from app.models import JobStatus
+
+    terminal = (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+    await services.init_store()
+    services.start_worker()
+    sources = []
+    for relative, absolute, _, _ in files:
+        with open(absolute, errors="replace") as handle:
+            sources.append((relative, handle.read()))
+    _, jobs = await services.enqueue_batch(sources, mode)
+    digests = {relative: digest for relative, _, digest, _ in files}
+    pending = {job.id: job.path for job in jobs}
+    entries: Dict[str, Dict] = {}
+    try:
+        while pending:
+            await asyncio.sleep(POLL_INTERVAL)
+            for job_id in list(pending):
+                job = await services.get_job(job_id)
+                if job.status not in terminal:
+                    continue
+                del pending[job_id]
+                status = job.status
+                entries[job.path] = {
+                    "sha256": digests[job.path], "mode": mode, "status": status,
+                    "error": job.error, "functions": await _write_outputs(job, out_dir, svg),
+                }
+                done = len(entries)
+                print(f"[Bulk{label}] {done}/{len(jobs)} {job.path}: {status}"
+                      f" ({len(job.functions)} functions)")
+    finally:
+        await services.stop_worker()
+        await services.close_store()
+    return entries
+
+
+def _shard_main(files: List[SourceFile], out_dir: str, mode: str, svg: bool, label: str) -> Dict[str, Dict]:
+    """Entry point of a child process."""
+    return asyncio.run(run_shard(files, out_dir, mode, svg, label))
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate flowcharts for C files without the API server.")
+    parser.add_argument("paths", nargs="+", help="C files and/or directories (searched for BATCH_EXTENSIONS files)")
+    parser.add_argument("--out", default="flowcharts", help="output directory (default: flowcharts)")
+    parser.add_argument("--mode", choices=["auto", "llm", "local"], default="auto")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="worker processes (default: one per CPU in local mode, else 1)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="concurrent jobs per process (default: 2 x LLM_CONCURRENCY share, at least 4)")
+    parser.add_argument("--no-svg", action="store_true", help="write Mermaid only (default: SVG too if mmdc is on PATH)")
+    parser.add_argument("--force", action="store_true", help="regenerate files even if unchanged")
+    parser.add_argument("--prune", action="store_true", help="delete outputs of files that no longer exist")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    started = time.perf_counter()
+    out_dir = os.path.abspath(args.out)
+    os.makedirs(out_dir, exist_ok=True)
+    svg = not args.no_svg and shutil.which("mmdc") is not None
+    from app.llm import PROMPT_VERSION
+
+    manifest = load_manifest(out_dir)
+    previous: Dict[str, Dict] = manifest.get("files", {})
+    files: Dict[str, Dict] = {}
+    todo: List[SourceFile] = []
+    for relative, absolute in collect_files(args.paths):
+        digest, size = file_digest(absolute)
+        entry = previous.get(relative)
+        if not args.force and is_current(entry, digest, args.mode, PROMPT_VERSION, svg, out_dir):
+            files[relative] = entry
+        else:
+            todo.append((relative, absolute, digest, size))
+    skipped = len(files)
+
+    for relative in sorted(set(previous) - {item[0] for item in todo} - set(files)):
+        if args.prune:
+            shutil.rmtree(os.path.join(out_dir, relative), ignore_errors=True)
+        else:
+            files[relative] = previous[relative]
+
+    print(f"[Bulk] {len(todo)} files to generate, {skipped} unchanged")
+    if todo:
+        processes = args.processes or ((os.cpu_count() or 1) if args.mode == "local" else 1)
+        processes = max(1, min(processes, len(todo)))
+        configure_environment(args, processes)
+        shards = shard(todo, processes)
+        if len(shards) == 1:
+            results = [_shard_main(shards[0], out_dir, args.mode, svg, "")]
+        else:
+            # spawn: each child imports the app fresh, with the environment set above.
+            context = multiprocessing.get_context("spawn")
+            with context.Pool(len(shards)) as pool:
+                results = pool.starmap(
+                    _shard_main,
+                    [(part, out_dir, args.mode, svg, f" {index}") for index, part in enumerate(shards)],
+                )
+        for entries in results:
+            for entry in entries.values():
+                entry["promptVersion"] = PROMPT_VERSION
+            files.update(entries)
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "generatedAt": datetime.now(timezone.utc).isoformat(),
+        "files": dict(sorted(files.items())),
+    }
+    write_manifest(out_dir, manifest)
+    failed = sorted(relative for relative, entry in files.items() if entry.get("status") != "completed")
+    elapsed = time.perf_counter() - started
+    print(f"[Bulk] Done in {elapsed:.1f}s: {len(todo)} generated, {skipped} unchanged, {len(failed)} failed")
+    for relative in failed:
+        print(f"[Bulk]   failed: {relative}: {files[relative].get('error')}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,31 +4,73 @@ path = os.path.join(os.path.dirname(__file__), ".env")
 print("Path", path)
 load_dotenv(dotenv_path=path)
 
+import asyncio
+import hashlib
+import tarfile
+import tempfile
 from contextlib import asynccontextmanager
-from typing import List
+from datetime import datetime, timezone
+from typing import List, Literal, Optional
 
-from fastapi import FastAPI, HTTPException  # WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response, WebSocket
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
+from app import metrics
+from app.compression import CompressionMiddleware, pick_encoding
+from app.config import settings
 from app.models import (
+    BatchSummaryResponse,
+    CreateBatchRequest,
     CreateJobRequest,
+    CreateRevisionRequest,
+    FunctionPartResponse,
+    GenerationMode,
     JobDetailResponse,
     JobSummaryResponse,
-    to_detail,
+    to_batch_summary,
     to_summary,
 )
-from app.services import enqueue_job, get_job, list_jobs, start_worker
-# from app.websockets import manager
+from app.render import Artifact
+from app.serialize import detail_dict, parse_fields
+from app.services import (
+    cancel_job,
+    check_client_rate,
+    close_store,
+    enqueue_batch,
+    enqueue_job,
+    extract_tar_sources,
+    function_part,
+    get_batch,
+    get_job,
+    init_store,
+    job_body,
+    jobs_version,
+    list_jobs,
+    readiness,
+    render_function,
+    render_function_part,
+    revise_job,
+    start_worker,
+    stop_worker,
+    summaries_body,
+)
+from app.store import JobQuery, decode_cursor
+from app.websockets import LIST_CHANNEL, ChannelGone, manager
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Kick off the background worker on startup. No persistence, so jobs are volatile.
-    # TODO: wire manager loop + WebSocket broadcast when push updates are enabled.
-    # manager.set_loop(asyncio.get_running_loop())
-    start_worker()
+    # Open the job store (requeues unfinished jobs), then start the worker pool
+    # unless this is an API-only process (RUN_WORKERS=0, see worker.py).
+    await init_store()
+    if settings.run_workers:
+        start_worker()
     yield
+    # Drain queued jobs (bounded), cancel consumers, then flush the store.
+    await stop_worker()
+    await close_store()
 
 
 app = FastAPI(
@@ -43,7 +85,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Idempotent-Replayed", "Link", "Retry-After", "X-Next-Cursor"],
 )
+# brotli/gzip for JSON bodies; SSE streams and precompressed bodies pass through.
+app.add_middleware(CompressionMiddleware, minimum_size=settings.compress_min_bytes)
 
 
 @app.get("/health")
@@ -55,72 +100,313 @@ async def health():
 @app.get("/live")
 async def live():
     """
-    Lightweight readiness-style endpoint.
-    NOTE: does not verify worker backlog; add metrics if needed.
+    Lightweight liveness endpoint (process is up and serving).
+    Backlog and worker health are checked by /ready.
     """
     return {"status": "live"}
 
 
+@app.get("/ready")
+async def ready(response: Response):
+    """
+    Readiness probe: 503 when workers have died or the backlog is past
+    READY_MAX_QUEUE_DEPTH / READY_MAX_QUEUE_WAIT, so traffic goes elsewhere.
+    """
+    is_ready, reasons = readiness()
+    if not is_ready:
+        response.status_code = 503
+    return {"status": "ready" if is_ready else "not_ready", "reasons": reasons}
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text exposition of queue, pipeline, LLM and cache metrics."""
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.post("/api/jobs", response_model=JobSummaryResponse)
-async def create_job(payload: CreateJobRequest):
+async def create_job(
+    payload: CreateJobRequest,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+):
     """
     Create a new job to generate flowchart from C code.
     Returns job summary immediately; processing happens async in background.
-    TODO: Add rate limiting per client IP to prevent abuse.
+    Rate limited per client IP (429 + Retry-After, see CLIENT_JOBS_PER_MINUTE).
+    Idempotency-Key: retries carrying the same key and body return the
+    original job (with Idempotent-Replayed: true) instead of a duplicate;
+    the same key with a different body is rejected with 422.
     TODO: Add authentication/authorization if exposing publicly.
     """
+    check_client_rate(request.client.host if request.client else "unknown")
+    if not payload.code or not payload.code.strip():
+        raise HTTPException(status_code=400, detail="Code is required")
+    job, replayed = await enqueue_job(payload.code, payload.mode, idempotency_key)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return to_summary(job)
+
+
+@app.post("/api/jobs/{job_id}/revisions", response_model=JobSummaryResponse)
+async def create_revision(
+    job_id: str,
+    payload: CreateRevisionRequest,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+):
+    """
+    Resubmit edited code as the next revision of a job (a new job with
+    parentId/revision set). Functions unchanged since that job keep their
+    results (reused: true); only changed and new functions are generated,
+    so an edit costs in proportion to what changed. Same rate limit and
+    Idempotency-Key handling as POST /api/jobs. 404 if the job is unknown.
+    """
+    check_client_rate(request.client.host if request.client else "unknown")
     if not payload.code or not payload.code.strip():
         raise HTTPException(status_code=400, detail="Code is required")
-    job = await enqueue_job(payload.code)
+    job, replayed = await revise_job(job_id, payload.code, payload.mode, idempotency_key)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
     return to_summary(job)
 
 
+@app.post("/api/batches", response_model=BatchSummaryResponse)
+async def create_batch(payload: CreateBatchRequest):
+    """
+    Submit many files at once (e.g. a whole repository); one job per file.
+    Jobs are created in a single bulk store write and scheduled on the batch
+    lane, so interactive submissions are not starved. Empty files are skipped.
+    """
+    files = [(item.path, item.code) for item in payload.files if item.code.strip()]
+    if not files:
+        raise HTTPException(status_code=400, detail="No non-empty files in batch")
+    if len(files) > settings.max_batch_files:
+        raise HTTPException(status_code=413, detail=f"More than {settings.max_batch_files} files")
+    if sum(len(code) for _, code in files) > settings.max_batch_bytes:
+        raise HTTPException(status_code=413, detail="Batch too large")
+    batch, jobs = await enqueue_batch(files, payload.mode)
+    return to_batch_summary(batch, {"submitted": len(jobs)}, jobs)
+
+
+@app.post("/api/batches/upload", response_model=BatchSummaryResponse)
+async def upload_batch(request: Request, mode: GenerationMode = "auto"):
+    """
+    Submit a tar archive (optionally gzip/bz2/xz compressed) as the raw request
+    body, e.g. `tar cz src | curl --data-binary @- -H 'Content-Type: application/x-tar'`.
+    The body is streamed to a spooled temp file; only BATCH_EXTENSIONS files become jobs.
+    mode (query) applies to every job in the batch.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > settings.max_batch_bytes:
+                raise HTTPException(status_code=413, detail="Batch too large")
+            spool.write(chunk)
+        spool.seek(0)
+        try:
+            files = await asyncio.to_thread(extract_tar_sources, spool)
+        except tarfile.TarError as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid tar archive: {exc}")
+    if not files:
+        raise HTTPException(status_code=400, detail="No C source files in archive")
+    batch, jobs = await enqueue_batch(files, mode)
+    return to_batch_summary(batch, {"submitted": len(jobs)}, jobs)
+
+
+@app.get("/api/batches/{batch_id}", response_model=BatchSummaryResponse)
+async def get_batch_endpoint(batch_id: str):
+    """Aggregate progress of a batch (job counts per status)."""
+    batch, counts = await get_batch(batch_id)
+    return to_batch_summary(batch, counts)
+
+
+@app.get("/api/jobs/events")
+async def list_job_events(request: Request):
+    """
+    Server-Sent Events stream of job summaries (fallback for /ws/jobs).
+    Emits {"type": "job_summary", "job": {...}} whenever any job changes;
+    {"type": "resync"} means the client fell behind and should refetch the list.
+    """
+    return StreamingResponse(
+        manager.sse_events(request, LIST_CHANNEL),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/api/jobs", response_model=List[JobSummaryResponse])
-async def list_jobs_endpoint():
+async def list_jobs_endpoint(
+    request: Request,
+    status: Optional[str] = None,
+    sort: Literal["created_at", "updated_at"] = "created_at",
+    order: Literal["asc", "desc"] = "desc",
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+):
     """
-    List all jobs with summary information (status, progress).
-    NOTE: Returns full list; add pagination if job count grows large.
+    List jobs with summary information (status, progress), one page at a time.
+    - status: only jobs in this status.
+    - sort/order: by created_at (default, newest first) or updated_at.
+    - cursor: X-Next-Cursor from the previous page (also in the Link header).
+    - since: delta mode; jobs updated after this time, oldest change first.
+    Returns 304 when If-None-Match matches the current ETag.
+    The body is joined from per-job cached summaries (orjson), not Pydantic models.
     """
-    jobs = await list_jobs()
-    return [to_summary(job) for job in jobs]
+    etag = 'W/"%d-%s"' % (
+        jobs_version(), hashlib.sha1(request.url.query.encode()).hexdigest()[:12]
+    )
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if since and since.tzinfo:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    page = await list_jobs(
+        JobQuery(
+            status=status, sort=sort, descending=order == "desc",
+            limit=limit, after=after, since=since,
+        )
+    )
+    headers = {"ETag": etag}
+    if page.next_cursor:
+        headers["X-Next-Cursor"] = page.next_cursor
+        next_url = request.url.include_query_params(cursor=page.next_cursor)
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    return Response(content=summaries_body(page.jobs), media_type="application/json", headers=headers)
 
 
 @app.get("/api/jobs/{job_id}", response_model=JobDetailResponse)
-async def get_job_endpoint(job_id: str):
+async def get_job_endpoint(job_id: str, request: Request, fields: Optional[str] = None):
     """
     Get detailed job information including code, status, and generated flowcharts.
-    Raises 404 if job_id not found (in-memory store only).
-    """
-    job = await get_job(job_id)
-    return to_detail(job)
-
-
-# TODO: Enable WebSockets once broadcast wiring is completed.
-# @app.websocket("/ws/jobs/{job_id}")
-# async def job_updates(websocket: WebSocket, job_id: str):
-#     await websocket.accept()
-#     
-#     try:
-#         job = await get_job(job_id)
-#     except HTTPException:
-#         await websocket.close(code=4004)  # 4004 = Not Found
-#         return
-#
-#     # Add to connections (websocket already accepted)
-#     async with manager.lock:
-#         manager.connections.setdefault(job_id, set()).add(websocket)
-#     
-#     await manager.send_job(job)
-#
-#     try:
-#         while True:
-#             # We only expect server-to-client pushes; keep alive otherwise.
-#             await websocket.receive_text()
-#     except WebSocketDisconnect:
-#         await manager.disconnect(job_id, websocket)
-#     except Exception:
-#         await manager.disconnect(job_id, websocket)
+    - fields: comma-separated camelCase fields to return, e.g.
+      fields=status,processedFunctions,functions to skip re-sending `code` on polls.
+    The serialized (and compressed) body is cached until the job changes; its
+    strong ETag follows updated_at, so If-None-Match revalidation returns 304.
+    Raises 404 if job_id not found in the job store, 400 for unknown fields.
+    """
+    try:
+        selected = parse_fields(fields)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {exc}")
+    etag, body = await job_body(job_id, selected, request.headers.get("if-none-match"))
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if body is None:
+        return Response(status_code=304, headers=headers)
+    encoding = ""
+    if len(body.data) >= settings.compress_min_bytes:
+        encoding = pick_encoding(request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body.encode(encoding), media_type="application/json", headers=headers)
+
+
+@app.delete("/api/jobs/{job_id}", response_model=JobSummaryResponse)
+async def cancel_job_endpoint(job_id: str, response: Response):
+    """
+    Cancel a queued or running job; in-flight LLM calls and mmdc renders are
+    aborted. The job stays readable with status "cancelled" and any functions
+    finished before the cancel. Returns 202 while a worker in another process
+    is still stopping it, 409 if the job already completed or failed.
+    """
+    job, done = await cancel_job(job_id)
+    if not done:
+        response.status_code = 202
+    return to_summary(job)
+
+
+@app.get("/api/jobs/{job_id}/functions/{name}.{fmt}")
+async def function_diagram(job_id: str, name: str, fmt: Literal["svg", "png"], request: Request):
+    """
+    Server-rendered diagram for one function (mmdc, cached by content hash);
+    the summary for functions that have one.
+    SVG is served precompressed (br/gzip) per Accept-Encoding.
+    ETag is the content hash, so If-None-Match revalidation returns 304.
+    """
+    return artifact_response(await render_function(job_id, name, fmt), request)
+
+
+# Registered before the JSON route, whose {part_id} would also match "fold3.svg".
+@app.get("/api/jobs/{job_id}/functions/{name}/parts/{part_id}.{fmt}")
+async def function_part_diagram(
+    job_id: str, name: str, part_id: str, fmt: Literal["svg", "png"], request: Request
+):
+    """Server-rendered part of a summarized diagram; caching as for function_diagram."""
+    return artifact_response(await render_function_part(job_id, name, part_id, fmt), request)
+
+
+@app.get("/api/jobs/{job_id}/functions/{name}/parts/{part_id}", response_model=FunctionPartResponse)
+async def function_part_detail(job_id: str, name: str, part_id: str):
+    """
+    Mermaid for one folded step of a function's summary diagram, fetched when
+    the user expands it. Parts can contain folded steps of their own.
+    """
+    part = await function_part(job_id, name, part_id)
+    return FunctionPartResponse(id=part.id, title=part.title, mermaid=part.mermaid)
+
+
+def artifact_response(artifact: Artifact, request: Request) -> Response:
+    """Cached rendered diagram with ETag/304 and the precompressed variant the client accepts."""
+    headers = {
+        "ETag": artifact.etag,
+        "Cache-Control": f"public, max-age={settings.render_max_age}",
+        "Vary": "Accept-Encoding",
+    }
+    if request.headers.get("if-none-match") == artifact.etag:
+        return Response(status_code=304, headers=headers)
+    encoding, path = artifact.pick(request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(path, media_type=artifact.media_type, headers=headers)
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """
+    Server-Sent Events stream for one job (fallback for /ws/jobs/{id}).
+    Starts with a full job_snapshot, then job_update diffs as the job changes.
+    """
+    await get_job(job_id)  # 404 before opening the stream.
+    return StreamingResponse(
+        manager.sse_events(request, job_id, snapshot=lambda: _job_snapshot(job_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _job_snapshot(job_id: str) -> dict:
+    try:
+        job = await get_job(job_id)
+    except HTTPException as exc:
+        # Evicted while subscribed: tell the client instead of dropping the stream.
+        raise ChannelGone({"type": "job_gone", "id": job_id, "detail": exc.detail})
+    return {"type": "job_snapshot", "job": detail_dict(job)}
+
+
+@app.websocket("/ws/jobs")
+async def jobs_updates(websocket: WebSocket):
+    """Push job_summary events for every job (jobs list page)."""
+    await websocket.accept()
+    await manager.serve_websocket(websocket, LIST_CHANNEL)
+
 
+@app.websocket("/ws/jobs/{job_id}")
+async def job_updates(websocket: WebSocket, job_id: str):
+    """Push a job_snapshot, then job_update diffs for a single job."""
+    await websocket.accept()
+    try:
+        await get_job(job_id)
+    except HTTPException:
+        await websocket.close(code=4004)  # 4004 = Not Found
+        return
+    await manager.serve_websocket(websocket, job_id, snapshot=lambda: _job_snapshot(job_id))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,37 @@
+import os
+
+from bulk import collect_files
+
+
+def _write(path, text="int f(void) { return 0; }\n"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as handle:
+        handle.write(text)
+
+
+def test_same_file_name_in_two_file_arguments(tmp_path):
+    first, second = str(tmp_path / "a" / "util.c"), str(tmp_path / "b" / "util.c")
+    _write(first)
+    _write(second)
+    assert collect_files([first, second]) == [("a/util.c", first), ("b/util.c", second)]
+
+
+def test_same_relative_path_in_two_directory_arguments(tmp_path):
+    for side in ("a", "b"):
+        _write(str(tmp_path / side / "src" / "util.c"))
+    found = collect_files([str(tmp_path / "a"), str(tmp_path / "b")])
+    assert [relative for relative, _ in found] == ["a/src/util.c", "b/src/util.c"]
+
+
+def test_single_argument_keys_are_unchanged(tmp_path):
+    _write(str(tmp_path / "src" / "util.c"))
+    _write(str(tmp_path / "src" / "lib" / "list.c"))
+    assert [relative for relative, _ in collect_files([str(tmp_path / "src")])] == ["lib/list.c", "util.c"]
+    single = str(tmp_path / "src" / "util.c")
+    assert collect_files([single]) == [("util.c", single)]
+
+
+def test_overlapping_arguments_list_each_file_once(tmp_path):
+    _write(str(tmp_path / "src" / "lib" / "list.c"))
+    found = collect_files([str(tmp_path / "src"), str(tmp_path / "src" / "lib" / "list.c")])
+    assert [relative for relative, _ in found] == ["lib/list.c"]
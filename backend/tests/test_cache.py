@@ -0,0 +1,104 @@
+import asyncio
+
+from app.cache import CachedFlowchart, FlowchartCache, cache_key
+from app.serialize import BodyCache
+
+
+def _store(cache, job_id, size, variant="detail"):
+    return cache.store(job_id, variant, f'"{job_id}"', b"x" * size)
+
+
+def test_body_cache_evicts_least_recent_jobs_past_max_bytes():
+    cache = BodyCache(max_jobs=100, max_bytes=1000)
+    for job_id in ("a", "b", "c"):
+        _store(cache, job_id, 300)
+    assert cache.bytes == 900
+    _store(cache, "a", 300, variant="summary")  # "a" is now most recent.
+    assert list(cache._bodies) == ["c", "a"]
+    assert cache.bytes == 900
+
+
+def test_body_cache_counts_compressed_variants():
+    cache = BodyCache(max_jobs=100, max_bytes=1000)
+    first = _store(cache, "a", 400)
+    _store(cache, "b", 400)
+    first.encode("gzip")
+    assert cache.bytes == 800 + len(first.encoded["gzip"])
+    big = _store(cache, "c", 400)
+    assert "a" not in cache._bodies
+    assert cache.bytes == 800
+    big.encode("gzip")
+    assert list(cache._bodies) == ["b", "c"]
+    assert cache.bytes == 800 + len(big.encoded["gzip"])
+    cache.invalidate("b")
+    assert cache.bytes == 400 + len(big.encoded["gzip"])
+
+
+def test_body_cache_growth_of_evicted_body_is_ignored():
+    cache = BodyCache(max_jobs=1)
+    old = _store(cache, "a", 100)
+    _store(cache, "b", 100)
+    old.encode("gzip")
+    assert cache.bytes == 100
+
+
+def test_body_cache_serves_but_skips_oversized_bodies():
+    cache = BodyCache(max_jobs=100, max_bytes=500)
+    _store(cache, "a", 200)
+    body = _store(cache, "huge", 600)
+    assert body.data == b"x" * 600
+    assert list(cache._bodies) == ["a"] and cache.bytes == 200
+
+
+def test_body_cache_replacing_a_variant_releases_its_bytes():
+    cache = BodyCache(max_jobs=100, max_bytes=1000)
+    _store(cache, "a", 300)
+    _store(cache, "a", 100)
+    assert cache.bytes == 100
+
+
+def test_flowchart_cache_lru_and_ttl():
+    async def scenario():
+        cache = FlowchartCache(max_entries=2, ttl_seconds=60)
+        for key in ("a", "b"):
+            await cache.put(key, CachedFlowchart("flowchart TD", True))
+        await cache.get("a")
+        await cache.put("c", CachedFlowchart("flowchart TD", True))
+        assert [key for key in cache._entries] == ["a", "c"]
+        stored_at, value = cache._entries["a"]
+        cache._entries["a"] = (stored_at - 61, value)
+        assert await cache.get("a") is None
+        await cache.put("d", CachedFlowchart("flowchart TD", False))
+        assert await cache.get("d") is None  # Invalid results are regenerated, not cached.
+
+    asyncio.run(scenario())
+
+
+def test_flowchart_cache_disk_tier_survives_restart(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "cache.db")
+        key = cache_key("int f(void) { return 0; }")
+        await FlowchartCache(db_path=path).put(key, CachedFlowchart("flowchart TD", True))
+        cache = FlowchartCache(db_path=path)
+        assert (await cache.get(key)).mermaid == "flowchart TD"
+        assert key in cache._entries  # Promoted into memory.
+
+    asyncio.run(scenario())
+
+
+def test_flowchart_cache_coalesces_concurrent_computes():
+    async def scenario():
+        cache = FlowchartCache()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return CachedFlowchart("flowchart TD", True)
+
+        results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(3)))
+        assert calls == 1
+        assert [from_cache for _, from_cache in results] == [False, True, True]
+
+    asyncio.run(scenario())
@@ -0,0 +1,61 @@
+import asyncio
+from dataclasses import replace
+from datetime import datetime, timedelta
+
+from app import services
+from app.blobs import BlobStore
+from app.models import FunctionResult, JobState, JobStatus
+from app.store import InMemoryJobStore
+from app.websockets import manager
+
+MERMAID = "flowchart TD\n    A[start] --> B[end]"
+
+
+def _finished_job(job_id):
+    return JobState(
+        id=job_id,
+        code="int main(void) { return 0; }",
+        status=JobStatus.COMPLETED,
+        total_functions=1,
+        processed_functions=1,
+        functions=[FunctionResult(name="main", mermaid=MERMAID, validated=True)],
+        updated_at=datetime.utcnow() + timedelta(minutes=1),
+    )
+
+
+def _run_feed(monkeypatch, tmp_path, keep_blob):
+    blobs = BlobStore(str(tmp_path))
+    store = InMemoryJobStore()
+    job = _finished_job("job-1")
+    if keep_blob:
+        blobs.write(job)
+    BlobStore.strip(job)
+    published = []
+    monkeypatch.setattr(services, "blob_store", blobs)
+    monkeypatch.setattr(services, "job_store", store)
+    monkeypatch.setattr(services, "settings", replace(services.settings, change_feed_interval=0.01))
+    monkeypatch.setattr(manager, "subscribers", {job.id: {object()}})
+    monkeypatch.setattr(manager, "publish_changes", lambda job, changes: published.append(changes))
+
+    async def run():
+        await store.add(job)
+        task = asyncio.create_task(services._change_feed_loop())
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    return published
+
+
+def test_feed_pushes_hydrated_diagrams_for_offloaded_jobs(monkeypatch, tmp_path):
+    published = _run_feed(monkeypatch, tmp_path, keep_blob=True)
+    assert len(published) == 1
+    assert published[0]["functions"][0]["mermaid"] == MERMAID
+
+
+def test_feed_omits_functions_when_blob_is_missing(monkeypatch, tmp_path):
+    published = _run_feed(monkeypatch, tmp_path, keep_blob=False)
+    assert len(published) == 1
+    assert "functions" not in published[0]
+    assert published[0]["status"] == JobStatus.COMPLETED
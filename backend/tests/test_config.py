@@ -0,0 +1,18 @@
+from app.config import Settings
+
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv("RUN_WORKERS", "0")
+    monkeypatch.setenv("WORKER_CONCURRENCY", "8")
+    monkeypatch.setenv("JOB_TIMEOUT", "12.5")
+    monkeypatch.setenv("BATCH_EXTENSIONS", ".c,.h")
+    monkeypatch.setenv("MERMAID_VALIDATOR", "both")
+    monkeypatch.setenv("RENDER_CACHE_DIR", "")  # Empty: keep the default.
+    settings = Settings.from_env()
+    assert settings.run_workers is False
+    assert settings.worker_concurrency == 8
+    assert settings.job_timeout == 12.5
+    assert settings.batch_extensions == (".c", ".h")
+    assert settings.mermaid_validator == "both"
+    assert settings.render_cache_dir == Settings().render_cache_dir
+    assert settings.llm_preprocess is True
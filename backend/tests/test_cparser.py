@@ -0,0 +1,110 @@
+from app.cparser import split_functions, tokenize
+
+
+def _spans(code):
+    return [(func.name, func.start_line, func.end_line) for func in split_functions(code)]
+
+
+def test_kr_definitions_keep_parameter_declarations():
+    code = """\
+int add(a, b)
+    int a;
+    register int b;
+{
+    return a + b;
+}
+
+char *copy(dst, src) char *dst, *src; { return dst; }
+int after(void) { return 0; }
+"""
+    functions = split_functions(code)
+    assert [func.name for func in functions] == ["add", "copy", "after"]
+    assert functions[0].source.startswith("int add(a, b)\n    int a;")
+    assert functions[1].source.startswith("char *copy(dst, src)")
+    assert _spans(code)[0] == ("add", 1, 6)
+
+
+def test_multiline_signatures_and_attributes():
+    code = """\
+static const char *
+describe(int kind,
+         const char *fallback)
+{
+    return fallback;
+}
+
+void (*handler(int sig))(int)
+{
+    return 0;
+}
+
+__attribute__((noreturn)) void
+die(const char *message) __attribute__((cold))
+{
+    for (;;) {}
+}
+"""
+    assert _spans(code) == [("describe", 1, 6), ("handler", 8, 11), ("die", 13, 17)]
+    assert split_functions(code)[0].source.startswith("static const char *\ndescribe(")
+
+
+def test_braces_in_strings_chars_and_comments():
+    code = """\
+int braces(void)
+{
+    const char *text = "}{ \\" }";
+    char open = '{', close = '}';
+    /* } */ // {
+    return text[0] == close;
+}
+int next(void) { return 1; }
+"""
+    assert _spans(code) == [("braces", 1, 7), ("next", 8, 8)]
+
+
+def test_declarations_and_initializers_are_not_functions():
+    code = """\
+struct point { int x, y; };
+static const int table[] = { 1, 2, 3 };
+int prototype(int x);
+struct point origin(void) { struct point p = { 0, 0 }; return p; }
+enum color { RED, GREEN } paint(void) { return RED; }
+"""
+    assert [func.name for func in split_functions(code)] == ["origin", "paint"]
+
+
+def test_macros_are_skipped():
+    code = """\
+#define BEGIN {
+#define SQUARE(x) \\
+    ((x) * (x))
+#include <stdio.h>
+int area(int side)
+{
+  #ifdef DEBUG
+    printf("%d\\n", side);
+  #endif
+    return SQUARE(side);
+}
+"""
+    assert _spans(code) == [("area", 5, 11)]
+    assert all(token.text != "#" for token in tokenize(code))
+
+
+def test_conditional_blocks_with_complete_functions():
+    code = """\
+#if defined(FAST)
+int pick(int x) { return x; }
+#else
+int pick(int x) { return -x; }
+#endif
+int main(void) { return pick(1); }
+"""
+    assert _spans(code) == [("pick", 2, 2), ("pick", 4, 4), ("main", 6, 6)]
+
+
+def test_unbalanced_source_degrades_gracefully():
+    assert split_functions("int broken(void) { if (x) {") == []
+    # An unterminated literal lexes as punctuation instead of swallowing the body.
+    assert _spans('int s(void) { return "unterminated; }') == [("s", 1, 1)]
+    assert split_functions("") == []
@@ -0,0 +1,136 @@
+import pytest
+
+from app.flowgen import FlowgenError, generate_flowchart
+from app.validator import parse_flowchart
+
+
+def _graph(code):
+    return parse_flowchart(generate_flowchart(code))
+
+
+def _edges(graph):
+    """(source label, target label, edge label) triples."""
+    return {(graph.nodes[e.source].label, graph.nodes[e.target].label, e.label) for e in graph.edges}
+
+
+def _reachable(graph, start="N1"):
+    seen, stack = {start}, [start]
+    while stack:
+        node = stack.pop()
+        for edge in graph.edges:
+            if edge.source == node and edge.target not in seen:
+                seen.add(edge.target)
+                stack.append(edge.target)
+    return seen
+
+
+def _assert_well_formed(graph):
+    assert _reachable(graph) == set(graph.nodes)
+    for node in graph.nodes.values():
+        if node.shape == "{":
+            labels = {e.label for e in graph.edges if e.source == node.id}
+            assert None not in labels, f"unlabelled branch out of {node.label!r}"
+
+
+def test_if_else_chain():
+    graph = _graph("""
+int sign(int x) {
+    if (x > 0) {
+        x = 1;
+    } else if (x < 0) {
+        x = -1;
+    } else {
+        x = 0;
+    }
+    return x;
+}""")
+    _assert_well_formed(graph)
+    edges = _edges(graph)
+    assert ("x #gt; 0?", "x = 1", "yes") in edges
+    assert ("x #gt; 0?", "x #lt; 0?", "no") in edges
+    assert ("x #lt; 0?", "x = 0", "no") in edges
+    assert {("x = 1", "return x", None), ("x = -1", "return x", None), ("x = 0", "return x", None)} <= edges
+
+
+def test_loops_break_and_continue():
+    graph = _graph("""
+int count(const int *a, int n) {
+    int total = 0;
+    for (int i = 0; i < n; i++) {
+        if (a[i] < 0) continue;
+        if (a[i] == 99) break;
+        total++;
+    }
+    while (total > 10) total -= 10;
+    do { total++; } while (total < 3);
+    return total;
+}""")
+    _assert_well_formed(graph)
+    edges = _edges(graph)
+    assert ("a[i] #lt; 0?", "i++", "yes") in edges  # continue runs the step
+    assert ("i++", "i #lt; n?", None) in edges
+    assert ("a[i] == 99?", "total #gt; 10?", "yes") in edges  # break leaves the loop
+    assert ("i #lt; n?", "total #gt; 10?", "no") in edges
+    assert ("total -= 10", "total #gt; 10?", None) in edges
+    assert ("total #lt; 3?", "do", "yes") in edges
+
+
+def test_switch_fallthrough_and_default():
+    graph = _graph("""
+int grade(int score) {
+    int bonus = 0;
+    switch (score / 10) {
+    case 10:
+    case 9:
+        bonus += 2;
+    case 8:
+        bonus++;
+        break;
+    default:
+        bonus = -1;
+    }
+    return bonus;
+}""")
+    _assert_well_formed(graph)
+    edges = _edges(graph)
+    assert {("switch score / 10", "bonus += 2", "10"), ("switch score / 10", "bonus += 2", "9")} <= edges
+    assert ("bonus += 2", "bonus++", None) in edges  # fallthrough into case 8
+    assert ("switch score / 10", "bonus++", "8") in edges
+    assert ("bonus++", "return bonus", None) in edges
+    assert ("switch score / 10", "bonus = -1", "default") in edges
+
+
+def test_early_return_and_goto():
+    graph = _graph("""
+int parse(const char *s) {
+    if (!s) return -1;
+    if (*s == '"') goto fail;
+    while (*s) {
+        if (*s == '}') return 1;
+        s++;
+    }
+    return 0;
+fail:
+    log("bad [input] (\\"quoted\\")");
+    return -2;
+}""")
+    _assert_well_formed(graph)
+    edges = _edges(graph)
+    returns = [node for node in graph.nodes.values() if node.label.startswith("return")]
+    assert len(returns) == 4
+    assert all(("return" in src and dst == "end") for src, dst, _ in edges if src.startswith("return"))
+    assert {src for src, dst, _ in edges if dst == "end"} == {node.label for node in returns}
+    assert any(dst == "fail:" and label == "yes" for _, dst, label in edges)
+
+
+def test_large_generated_diagram_stays_valid():
+    body = "\n".join(f"    if (x == {i}) {{ y += {i}; }} else if (y > {i}) return y;" for i in range(200))
+    graph = _graph(f"int big(int x, int y) {{\n{body}\n    return x;\n}}")
+    _assert_well_formed(graph)
+    assert len(graph.nodes) > 400
+
+
+@pytest.mark.parametrize("code", ["", "int f(void) { while (x) }", "int f(void) { if x) y; }"])
+def test_unparseable_body_raises(code):
+    with pytest.raises(FlowgenError):
+        generate_flowchart(code)
@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from app.llm import CircuitBreaker, LLMClient, LLMUnavailableError
+from app.ratelimit import TokenBudgetScheduler
+
+
+def _half_open(breaker: CircuitBreaker) -> CircuitBreaker:
+    breaker.failures = breaker.failure_threshold
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout
+    assert breaker.state == "half-open"
+    return breaker
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(LLMUnavailableError):
+        breaker.before_call()
+
+
+def test_half_open_trial_success_closes():
+    breaker = _half_open(CircuitBreaker(failure_threshold=1, reset_timeout=60))
+    assert breaker.before_call() is True
+    with pytest.raises(LLMUnavailableError):
+        breaker.before_call()  # Only one trial at a time.
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.before_call() is False
+
+
+def test_half_open_trial_failure_reopens():
+    breaker = _half_open(CircuitBreaker(failure_threshold=1, reset_timeout=60))
+    assert breaker.before_call() is True
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(LLMUnavailableError):
+        breaker.before_call()
+
+
+class _HangingClient:
+    """Stands in for AzureChatOpenAI: streams nothing until cancelled."""
+
+    async def astream(self, messages, **options):
+        await asyncio.Event().wait()
+        yield AIMessageChunk(content="")
+
+
+class _AnsweringClient:
+    async def astream(self, messages, **options):
+        yield AIMessageChunk(content="flowchart TD\n  A[start]")
+
+
+def test_cancelled_trial_is_released():
+    async def scenario():
+        llm = LLMClient()
+        _half_open(llm.breaker)
+        call = asyncio.create_task(llm._invoke(_HangingClient(), [("user", "x")]))
+        await asyncio.sleep(0.05)
+        assert llm.breaker._trial_in_flight
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        assert llm.breaker.state == "half-open"
+        assert not llm.breaker._trial_in_flight
+        # The next call is the trial and closes the circuit.
+        message = await llm._invoke(_AnsweringClient(), [("user", "x")])
+        assert "flowchart" in message.content
+        assert llm.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_deadline_exceeded_takes_no_trial():
+    async def scenario():
+        llm = LLMClient()
+        _half_open(llm.breaker)
+        deadline = asyncio.get_running_loop().time() - 1
+        with pytest.raises(Exception, match="deadline"):
+            await llm._invoke(_AnsweringClient(), [("user", "x")], deadline=deadline)
+        assert not llm.breaker._trial_in_flight
+
+    asyncio.run(scenario())
+
+
+def test_cancel_before_sending_refunds_tokens():
+    async def scenario():
+        scheduler = TokenBudgetScheduler(tokens_per_minute=60_000)
+        llm = LLMClient(scheduler=scheduler, semaphore=asyncio.Semaphore(1))
+        held = asyncio.create_task(llm._invoke(_HangingClient(), [("user", "x")]))
+        waiting = asyncio.create_task(llm._invoke(_HangingClient(), [("user", "y")]))
+        await asyncio.sleep(0.05)  # Both admitted; the second is queued on the semaphore.
+        tokens = scheduler.tokens
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert scheduler.tokens - tokens >= llm.completion_tokens
+        tokens = scheduler.tokens
+        held.cancel()
+        await asyncio.gather(held, return_exceptions=True)
+        assert scheduler.tokens == tokens  # The call that went out stays charged.
+
+    asyncio.run(scenario())
@@ -0,0 +1,87 @@
+import asyncio
+from dataclasses import replace
+
+from app import services
+from app.preprocess import preprocess_c, preprocess_unit
+
+SOURCE = """\
+#include <stdio.h>
+
+#if 0
+int legacy(int x) { return x * LEGACY_SCALE; }
+#endif
+
+/* Two versions of one function: only the #else one is compiled. */
+#if 0
+int pick(int x) { return OLD_PICK(x); }
+#else
+int pick(int x) {
+    if (x > 0)  /* positive */
+        return x;
+    return -x;
+}
+#endif
+
+int main(void) { return pick(-3); }
+"""
+
+
+def test_unit_pass_keeps_line_numbers():
+    reduced = preprocess_unit(SOURCE)
+    assert reduced.count("\n") == SOURCE.count("\n")
+    assert "LEGACY_SCALE" not in reduced and "OLD_PICK" not in reduced
+    assert reduced.split("\n")[11] == SOURCE.split("\n")[11].split("/*")[0] + " "
+
+
+def test_preprocess_c_drops_dead_code():
+    prepared = preprocess_c(SOURCE)
+    assert "OLD_PICK" not in prepared.code and "#" not in prepared.code
+    assert prepared.reduced_tokens < prepared.original_tokens
+
+
+def test_dead_conditional_code_never_reaches_llm(monkeypatch):
+    prompts = []
+
+    async def generate_from_code(code, **kwargs):
+        prompts.append(code)
+        return "flowchart TD\n  A([start]) --> B([end])"
+
+    monkeypatch.setattr(services.llm_client, "generate_from_code", generate_from_code)
+
+    async def scenario():
+        await services.init_store()
+        try:
+            job, _ = await services.enqueue_job(SOURCE, mode="llm")
+            await services.process_job(job.id)
+            return await services.get_job(job.id)
+        finally:
+            await services.close_store()
+
+    job = asyncio.run(scenario())
+    assert sorted(func.name for func in job.functions) == ["main", "pick"]
+    assert len(prompts) == 2
+    assert not any("OLD_PICK" in prompt or "LEGACY_SCALE" in prompt or "#" in prompt for prompt in prompts)
+    assert job.source_tokens > job.reduced_tokens
+
+
+def test_preprocess_off_sends_code_as_submitted(monkeypatch):
+    prompts = []
+
+    async def generate_from_code(code, **kwargs):
+        prompts.append(code)
+        return "flowchart TD\n  A([start]) --> B([end])"
+
+    monkeypatch.setattr(services, "settings", replace(services.settings, llm_preprocess=False))
+    monkeypatch.setattr(services.llm_client, "generate_from_code", generate_from_code)
+    source = "int keep(int x) {\n    /* why this returns x */\n    return x;\n}\n"
+
+    async def scenario():
+        await services.init_store()
+        try:
+            job, _ = await services.enqueue_job(source, mode="llm")
+            await services.process_job(job.id)
+        finally:
+            await services.close_store()
+
+    asyncio.run(scenario())
+    assert prompts == [source.rstrip("\n")]
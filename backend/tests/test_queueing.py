@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from app.queueing import RedisJobQueue, SQLiteJobQueue
+
+VISIBILITY = 0.2
+POLL = 0.01
+
+
+def _sqlite_queue(tmp_path):
+    return SQLiteJobQueue(str(tmp_path / "queue.db"), visibility_timeout=VISIBILITY, poll_interval=POLL)
+
+
+def _redis_queue(tmp_path):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # EVAL support.
+    return RedisJobQueue("", visibility_timeout=VISIBILITY, poll_interval=POLL, client=fakeredis.FakeAsyncRedis())
+
+
+@pytest.fixture(params=[_sqlite_queue, _redis_queue], ids=["sqlite", "redis"])
+def make_queue(request, tmp_path):
+    return lambda: request.param(tmp_path)
+
+
+def run(make_queue, scenario):
+    async def main():
+        queue = make_queue()
+        try:
+            await scenario(queue)
+        finally:
+            await queue.close()
+
+    asyncio.run(main())
+
+
+async def nothing_visible(queue):
+    # One lease attempt; cancelling lease() mid-call could leave a Redis connection mid-reply.
+    return await queue._lease("probe", prefer_batch=False) is None
+
+
+def test_lapsed_lease_is_redelivered(make_queue):
+    async def scenario(queue):
+        await queue.put("job-1")
+        first = await queue.lease()
+        assert (first.job_id, first.attempts) == ("job-1", 1)
+        assert await nothing_visible(queue)
+        await asyncio.sleep(VISIBILITY)
+        second = await queue.lease()
+        assert (second.job_id, second.attempts) == ("job-1", 2)
+        assert second.token != first.token
+        # The crashed holder no longer owns the job.
+        assert not await queue.extend(first)
+        assert not first.cancelled
+        await queue.ack(first)
+        assert await queue.cancel("job-1") == "leased"
+
+    run(make_queue, scenario)
+
+
+def test_extend_keeps_job_invisible(make_queue):
+    async def scenario(queue):
+        await queue.put("job-1")
+        lease = await queue.lease()
+        for _ in range(4):
+            await asyncio.sleep(VISIBILITY / 4)
+            assert await queue.extend(lease)
+        assert await nothing_visible(queue)
+
+    run(make_queue, scenario)
+
+
+def test_ack_removes_job(make_queue):
+    async def scenario(queue):
+        await queue.put_many(["job-1", "job-2"])
+        lease = await queue.lease()
+        await queue.ack(lease)
+        await asyncio.sleep(VISIBILITY)
+        other = await queue.lease()
+        assert other.job_id != lease.job_id
+        await queue.ack(other)
+        assert await nothing_visible(queue)
+        assert await queue.cancel(lease.job_id) == ""
+
+    run(make_queue, scenario)
+
+
+def test_release_makes_job_visible_at_once(make_queue):
+    async def scenario(queue):
+        await queue.put("job-1")
+        lease = await queue.lease()
+        await queue.release(lease)
+        again = await asyncio.wait_for(queue.lease(), timeout=VISIBILITY / 2)
+        assert (again.job_id, again.attempts) == ("job-1", 2)
+
+    run(make_queue, scenario)
+
+
+def test_cancel_waiting_job(make_queue):
+    async def scenario(queue):
+        await queue.put("job-1")
+        await queue.put("job-2", batch_id="batch-1")
+        assert await queue.cancel("job-1") == "queued"
+        assert await queue.cancel("job-2") == "queued"
+        assert await queue.cancel("job-3") == ""
+        assert await nothing_visible(queue)
+
+    run(make_queue, scenario)
+
+
+def test_cancel_leased_job_reaches_holder_and_redelivery(make_queue):
+    async def scenario(queue):
+        await queue.put("job-1")
+        lease = await queue.lease()
+        assert await queue.cancel("job-1") == "leased"
+        assert not await queue.extend(lease)
+        assert lease.cancelled
+        # A holder that crashed instead: the redelivered lease carries the flag.
+        await asyncio.sleep(VISIBILITY)
+        redelivered = await queue.lease()
+        assert redelivered.job_id == "job-1"
+        assert redelivered.cancelled
+        await queue.ack(redelivered)
+        assert await queue.cancel("job-1") == ""
+
+    run(make_queue, scenario)
+
+
+def test_put_is_idempotent_and_lanes_are_interleaved(make_queue):
+    async def scenario(queue):
+        await queue.put_many(["a1", "a2", "a3"], batch_id="a")
+        await queue.put_many(["b1", "b2"], batch_id="b")
+        await queue.put_many(["a1", "b1"], batch_id="a")
+        order = []
+        for _ in range(5):
+            lease = await queue.lease()
+            order.append(lease.job_id)
+            await queue.ack(lease)
+        assert order == ["a1", "b1", "a2", "b2", "a3"]
+        assert await nothing_visible(queue)
+
+    run(make_queue, scenario)
@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import pytest
+
+from app.ratelimit import ClientRateLimiter, TokenBudgetScheduler
+
+
+def test_bucket_refills_at_rate_up_to_capacity():
+    scheduler = TokenBudgetScheduler(tokens_per_minute=6000, burst=500)
+    scheduler.tokens = 0
+    scheduler.updated -= 2  # Two seconds at 100 tokens/s.
+    scheduler._refill(time.monotonic())
+    assert scheduler.tokens == pytest.approx(200, abs=1)
+    scheduler.updated -= 60
+    scheduler._refill(time.monotonic())
+    assert scheduler.tokens == 500
+
+
+def test_acquire_spends_immediately_when_budget_allows():
+    async def scenario():
+        scheduler = TokenBudgetScheduler(tokens_per_minute=60_000, burst=1000)
+        await asyncio.wait_for(scheduler.acquire(400), timeout=0.1)
+        assert scheduler.tokens == pytest.approx(600, abs=20)
+        fresh = TokenBudgetScheduler(tokens_per_minute=60_000, burst=1000)
+        await asyncio.wait_for(fresh.acquire(5000), timeout=0.1)  # Clamped to the burst.
+        assert fresh.estimated_tokens == 1000
+
+    asyncio.run(scenario())
+
+
+def test_waiters_admitted_by_virtual_deadline():
+    async def scenario():
+        scheduler = TokenBudgetScheduler(tokens_per_minute=60_000, burst=1000)
+        scheduler.tokens = 0
+        scheduler.updated = time.monotonic()
+        order = []
+
+        async def call(name, tokens, batch=False):
+            await scheduler.acquire(tokens, batch=batch)
+            order.append(name)
+
+        calls = [
+            asyncio.create_task(call("batch", 50, batch=True)),
+            asyncio.create_task(call("large", 150)),
+            asyncio.create_task(call("small", 50)),
+        ]
+        await asyncio.wait_for(asyncio.gather(*calls), timeout=2)
+        # Deadlines: small 0.05s, large 0.15s, batch 0.05s * 4 = 0.2s.
+        assert order == ["small", "large", "batch"]
+
+    asyncio.run(scenario())
+
+
+def test_record_usage_refunds_and_charges_the_difference():
+    scheduler = TokenBudgetScheduler(tokens_per_minute=60_000, burst=1000)
+    scheduler.tokens = 100
+    scheduler.record_usage(estimated=300, actual=120)
+    assert scheduler.tokens == 280
+    scheduler.record_usage(estimated=100, actual=250)
+    assert scheduler.tokens == 130
+    scheduler.record_usage(estimated=5000, actual=0)  # Refund never exceeds what acquire() took.
+    assert scheduler.tokens == 1130
+    assert scheduler.used_tokens == 370
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def scenario():
+        scheduler = TokenBudgetScheduler(tokens_per_minute=6000, burst=1000)
+        scheduler.tokens = 0
+        scheduler.updated = time.monotonic()
+        waiter = asyncio.create_task(scheduler.acquire(50))
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.wait_for(scheduler.acquire(10), timeout=0.5)
+        assert scheduler.tokens < 10  # Nothing was handed to the cancelled waiter.
+
+    asyncio.run(scenario())
+
+
+def test_throttle_halves_rate_and_success_recovers_it():
+    scheduler = TokenBudgetScheduler(tokens_per_minute=6000, min_rate_fraction=0.2)
+    scheduler.throttled(retry_after=5)
+    assert scheduler.rate == 50
+    assert scheduler.tokens <= 0
+    assert scheduler.paused_until > time.monotonic() + 4
+    scheduler.throttled()
+    scheduler.throttled()
+    assert scheduler.rate == 20  # Floor: min_rate_fraction of the configured rate.
+    for _ in range(40):
+        scheduler.succeeded()
+    assert scheduler.rate == 100
+
+
+def test_client_limiter_bucket_per_key():
+    limiter = ClientRateLimiter(requests_per_minute=60, burst=2)
+    assert limiter.check("a") is None
+    assert limiter.check("a") is None
+    wait = limiter.check("a")
+    assert wait == pytest.approx(1, abs=0.05)
+    assert limiter.check("b") is None
+    limiter._buckets["a"] = (0.0, time.monotonic() - 1)  # One second later: one token back.
+    assert limiter.check("a") is None
+
+
+def test_client_limiter_prunes_full_buckets():
+    limiter = ClientRateLimiter(requests_per_minute=60, burst=1, max_clients=2)
+    for key in ("a", "b"):
+        limiter.check(key)
+        limiter._buckets[key] = (1.0, time.monotonic())  # Refilled: idle.
+    limiter.check("c")
+    assert list(limiter._buckets) == ["c"]
@@ -0,0 +1,41 @@
+import re
+
+import pytest
+
+from app.flowgen import generate_flowchart
+from app.simplify import simplify_mermaid
+from app.validator import parse_flowchart
+
+FOLD = re.compile(r"^\s*(fold\d+_*)\[\[", re.MULTILINE)
+
+
+def _function(body: str) -> str:
+    return generate_flowchart("int f(int b, int x) {\n  int a, y = 0;\n" + body + "\n  return y;\n}")
+
+
+def _check_bounded(mermaid: str, max_nodes: int):
+    simplified = simplify_mermaid(mermaid, max_nodes)
+    assert simplified is not None
+    assert len(parse_flowchart(simplified.summary).nodes) <= max_nodes
+    for part in simplified.parts.values():
+        assert len(parse_flowchart(part.mermaid).nodes) <= max_nodes, part.title
+    # Every folded step, at any level, can be opened.
+    shown = [simplified.summary] + [part.mermaid for part in simplified.parts.values()]
+    assert {fold for text in shown for fold in FOLD.findall(text)} == set(simplified.parts)
+    return simplified
+
+
+@pytest.mark.parametrize("count", [300, 1000])
+@pytest.mark.parametrize("max_nodes", [80, 20])
+def test_if_chain_summary_and_parts_are_bounded(count, max_nodes):
+    _check_bounded(_function("\n".join("  a = b; if (a) g();" for _ in range(count))), max_nodes)
+
+
+def test_early_returns_and_wide_switch_are_bounded():
+    _check_bounded(_function("\n".join(f"  if (x == {i}) return {i}; y += {i};" for i in range(400))), 80)
+    cases = "\n".join(f"    case {i}: if (x > {i}) {{ y += {i}; while (y > {i}) y--; }} break;" for i in range(200))
+    _check_bounded(_function(f"  switch (x) {{\n{cases}\n  }}"), 80)
+
+
+def test_small_diagrams_are_left_alone():
+    assert simplify_mermaid(_function("  if (x) y = 1;"), 80) is None
@@ -0,0 +1,94 @@
+import asyncio
+
+from app.models import FunctionResult, JobState, JobStatus
+from app.store import InMemoryJobStore, SQLiteJobStore
+
+
+def _job(job_id, status=JobStatus.QUEUED):
+    return JobState(id=job_id, code="int main(void) { return 0; }", status=status)
+
+
+def test_recover_resets_stranded_jobs(tmp_path):
+    path = str(tmp_path / "jobs.db")
+
+    async def crash():
+        store = SQLiteJobStore(path)
+        stranded = _job("stranded", JobStatus.GENERATING_FLOWCHART)
+        stranded.total_functions = stranded.processed_functions = 2
+        stranded.functions = [FunctionResult(name="main", mermaid="flowchart TD", validated=True)]
+        stranded.partial_functions = {"helper": "flowchart TD\n    A"}
+        stranded.error = "worker lost"
+        stranded.source_tokens, stranded.reduced_tokens = 120, 80
+        await store.add_many([stranded, _job("done", JobStatus.COMPLETED)])
+        await store.close()
+
+    async def restart():
+        store = SQLiteJobStore(path)
+        assert await store.recover() == ["stranded"]
+        reopened = SQLiteJobStore(path)  # What the next process will read.
+        for current in (store, reopened):
+            job = await current.get("stranded")
+            assert job.status == JobStatus.SUBMITTED
+            assert (job.total_functions, job.processed_functions) == (0, 0)
+            assert job.functions == [] and job.partial_functions == {}
+            assert job.error is None
+            assert (job.source_tokens, job.reduced_tokens) == (0, 0)
+            assert job.code == "int main(void) { return 0; }"
+        assert (await reopened.get("done")).status == JobStatus.COMPLETED
+        await store.close()
+        await reopened.close()
+
+    asyncio.run(crash())
+    asyncio.run(restart())
+
+
+def test_in_memory_store_returns_same_instance():
+    async def scenario():
+        store = InMemoryJobStore()
+        await store.add(_job("a", JobStatus.COMPLETED))
+        assert await store.get("a") is await store.get("a")
+
+    asyncio.run(scenario())
+
+
+def test_identity_map_keeps_unfinished_jobs_only(tmp_path):
+    async def scenario():
+        store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+        await store.add(_job("a"))
+        job = await store.get("a")
+        assert job is await store.get("a")
+        job.status = JobStatus.PROCESSING
+        await store.save(job)
+        await store.flush()
+        assert job is await store.get("a")  # Still live: the pipeline's mutations stay shared.
+        job.status = JobStatus.COMPLETED
+        await store.save(job)
+        await store.flush()
+        copy = await store.get("a")
+        assert copy is not job and copy.status == JobStatus.COMPLETED
+        await store.close()
+
+    asyncio.run(scenario())
+
+
+def test_shared_store_rereads_unless_pinned(tmp_path):
+    path = str(tmp_path / "jobs.db")
+
+    async def scenario():
+        api = SQLiteJobStore(path, shared=True)
+        worker = SQLiteJobStore(path, shared=True)
+        await api.add(_job("a"))
+        assert await worker.get("a") is not await worker.get("a")
+        worker.pin("a")
+        job = await worker.get("a")
+        assert job is await worker.get("a")
+        job.status = JobStatus.PROCESSING
+        await worker.save(job)
+        await worker.flush()
+        assert (await api.get("a")).status == JobStatus.PROCESSING  # Other processes see the flush.
+        worker.unpin("a")
+        assert await worker.get("a") is not job
+        await api.close()
+        await worker.close()
+
+    asyncio.run(scenario())
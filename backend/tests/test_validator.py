@@ -0,0 +1,113 @@
+import re
+
+import pytest
+
+from app.validator import MermaidSyntaxError, parse_flowchart
+
+
+def _chart(*lines):
+    return "\n".join(("flowchart TD",) + lines)
+
+
+@pytest.mark.parametrize("node", [
+    "A[rect]", "A(rounded)", "A([stadium])", "A[[subroutine]]", "A[(database)]", "A((circle))",
+    "A(((double)))", "A{rhombus}", "A{{hexagon}}", "A[/parallelogram/]", "A[\\alt\\]",
+    "A[/trapezoid\\]", "A[\\alt trapezoid/]", "A>flag]", 'A["quoted (with) [brackets]"]', "A:::highlight",
+])
+def test_node_shapes_accepted(node):
+    graph = parse_flowchart(_chart(f"{node} --> B"))
+    assert list(graph.nodes) == ["A", "B"]
+
+
+@pytest.mark.parametrize("line, message", [
+    ("A[bad (paren)] --> B", "Unexpected '('"),
+    ('A[say "hi"] --> B', "Unexpected '\"'"),
+    ("A[unclosed --> B", "Unbalanced brackets"),
+    ('A["unterminated] --> B', "Unterminated string"),
+    ("end --> B", "Reserved word 'end'"),
+])
+def test_bad_nodes_rejected(line, message):
+    with pytest.raises(MermaidSyntaxError, match=re.escape(message)):
+        parse_flowchart(_chart(line))
+
+
+@pytest.mark.parametrize("line, arrow, label", [
+    ("A --> B", "-->", None),
+    ("A --- B", "---", None),
+    ("A ==> B", "==>", None),
+    ("A -.-> B", "-.->", None),
+    ("A ~~~ B", "~~~", None),
+    ("A --o B", "--o", None),
+    ("A <--> B", "<-->", None),
+    ("A -->|yes| B", "-->", "yes"),
+    ("A -- yes --> B", "-->", "yes"),
+    ("A -. maybe .-> B", "-.->", "maybe"),
+    ("A ==>|strong| B", "==>", "strong"),
+])
+def test_edge_forms_accepted(line, arrow, label):
+    (edge,) = parse_flowchart(_chart(line)).edges
+    assert (edge.source, edge.target, edge.arrow, edge.label) == ("A", "B", arrow, label)
+
+
+def test_edge_ids_accepted():
+    graph = parse_flowchart(_chart(
+        "A e1@--> B",
+        "B e2@-->|no| C",
+        "C e3@-- back --> A",
+        "e1@{ animate: true }",
+    ))
+    assert [(edge.id, edge.label) for edge in graph.edges] == [("e1", None), ("e2", "no"), ("e3", "back")]
+
+
+@pytest.mark.parametrize("lines, message", [
+    (("A e1@--> B", "B e1@--> C"), "Duplicate edge id 'e1'"),
+    (("A --> B", "e9@{ animate: true }"), "Unknown edge id 'e9'"),
+    (("A -->|open B",), "Unterminated '|'"),
+    (("A -> B",), "Expecting link"),
+    (("A --> ",), "Expecting node id"),
+])
+def test_bad_edges_rejected(lines, message):
+    with pytest.raises(MermaidSyntaxError, match=re.escape(message)):
+        parse_flowchart(_chart(*lines))
+
+
+def test_chains_groups_and_statements():
+    graph = parse_flowchart(_chart("A & B --> C --> D; D --> A"))
+    assert [(edge.source, edge.target) for edge in graph.edges] == [
+        ("A", "C"), ("B", "C"), ("C", "D"), ("D", "A"),
+    ]
+
+
+def test_subgraphs_accepted():
+    graph = parse_flowchart(_chart(
+        "subgraph outer [Outer loop]",
+        "    direction LR",
+        "    A --> B",
+        "    subgraph inner",
+        "        C",
+        "    end",
+        "end",
+        "B --> C",
+        "classDef hot fill:#f00",
+        "class A hot",
+    ))
+    assert [(sub.id, sub.title, sub.nodes) for sub in graph.subgraphs] == [
+        ("outer", "Outer loop", ["A", "B"]), ("inner", "inner", ["C"]),
+    ]
+
+
+@pytest.mark.parametrize("text, message", [
+    (_chart("subgraph one", "A --> B"), "Subgraph 'one' is missing 'end'"),
+    (_chart("A --> B", "end"), "'end' without matching 'subgraph'"),
+    (_chart("subgraph one", "direction UP", "end"), "Unknown direction"),
+    ("sequenceDiagram\nA->>B: hi", "must start with 'flowchart' or 'graph'"),
+    ("", "Empty diagram"),
+])
+def test_bad_structure_rejected(text, message):
+    with pytest.raises(MermaidSyntaxError, match=re.escape(message)):
+        parse_flowchart(text)
+
+
+def test_partial_prefix_allows_open_subgraph():
+    graph = parse_flowchart(_chart("subgraph one", "A --> B"), partial=True)
+    assert graph.subgraphs[0].nodes == ["A", "B"]
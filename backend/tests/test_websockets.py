@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import pytest
+
+from app.websockets import ChannelGone, JobUpdateManager
+
+GONE = {"type": "job_gone", "id": "job-1", "detail": "Job not found"}
+
+
+class _Request:
+    async def is_disconnected(self):
+        return False
+
+
+class _WebSocket:
+    def __init__(self):
+        self.sent = []
+        self.close_code = None
+        self._closed = asyncio.Event()
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def receive_text(self):
+        await self._closed.wait()
+        raise RuntimeError("disconnected")
+
+    async def close(self, code=1000):
+        self.close_code = code
+        self._closed.set()
+
+
+def _snapshots(*events):
+    """snapshot() callback returning each event in turn; ChannelGone once they run out."""
+    pending = list(events)
+
+    async def snapshot():
+        if pending:
+            return pending.pop(0)
+        raise ChannelGone(GONE)
+
+    return snapshot
+
+
+def test_sse_stream_ends_with_gone_event():
+    async def scenario():
+        manager = JobUpdateManager()
+        stream = manager.sse_events(_Request(), "job-1", snapshot=_snapshots({"type": "job_snapshot"}))
+        first = await stream.__anext__()
+        manager._publish("job-1", {"type": "resync"})
+        rest = [chunk async for chunk in stream]
+        assert json.loads(first[len("data: "):])["type"] == "job_snapshot"
+        assert [json.loads(chunk[len("data: "):]) for chunk in rest] == [GONE]
+        assert "job-1" not in manager.subscribers
+
+    asyncio.run(scenario())
+
+
+def test_websocket_sends_gone_event_and_closes():
+    async def scenario():
+        manager = JobUpdateManager()
+        websocket = _WebSocket()
+        await asyncio.wait_for(manager.serve_websocket(websocket, "job-1", snapshot=_snapshots()), timeout=1)
+        assert websocket.sent == [GONE]
+        assert websocket.close_code == 4004
+        assert "job-1" not in manager.subscribers
+
+    asyncio.run(scenario())
+
+
+def test_job_snapshot_reports_missing_job():
+    import main
+
+    async def scenario():
+        with pytest.raises(ChannelGone) as raised:
+            await main._job_snapshot("no-such-job")
+        assert raised.value.event["type"] == "job_gone"
+        assert raised.value.event["id"] == "no-such-job"
+
+    asyncio.run(scenario())
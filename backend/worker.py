@@ -0,0 +1,34 @@
+import os
+from dotenv import load_dotenv
+path = os.path.join(os.path.dirname(__file__), ".env")
+load_dotenv(dotenv_path=path)
+
+import asyncio
+import signal
+
+from app.config import settings
+from app.services import close_store, init_store, start_worker, stop_worker
+
+
+async def run():
+    """
+    Standalone worker process: consumes the shared queue (QUEUE_BACKEND=sqlite
+    or redis) with WORKER_CONCURRENCY consumers until SIGINT/SIGTERM, then
+    drains in-flight jobs like the API's lifespan shutdown.
+    Run any number of these next to API processes started with RUN_WORKERS=0.
+    """
+    if settings.queue_backend == "memory":
+        raise SystemExit("worker.py needs a shared queue: set QUEUE_BACKEND=sqlite or redis (and JOB_STORE=sqlite)")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await init_store()
+    start_worker()
+    await stop.wait()
+    await stop_worker()
+    await close_store()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
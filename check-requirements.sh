@@ -14,17 +14,22 @@ NC='\033[0m'
 ALL_OK=true
 
 # Check Python
-echo -n "Python 3.8+: "
+echo -n "Python 3.11+: "
 if command -v python3 &> /dev/null; then
     VERSION=$(python3 --version | cut -d' ' -f2)
-    echo -e "${GREEN}✓ Found $VERSION${NC}"
+    if python3 -c 'import sys; sys.exit(sys.version_info < (3, 11))'; then
+        echo -e "${GREEN}✓ Found $VERSION${NC}"
+    else
+        echo -e "${RED}✗ Found $VERSION (too old)${NC}"
+        ALL_OK=false
+    fi
 else
     echo -e "${RED}✗ Not found${NC}"
     ALL_OK=false
 fi
 
 # Check Node.js
-echo -n "Node.js 18+: "
+echo -n "Node.js 18+:  "
 if command -v node &> /dev/null; then
     VERSION=$(node --version)
     echo -e "${GREEN}✓ Found $VERSION${NC}"
@@ -34,7 +39,7 @@ else
 fi
 
 # Check npm
-echo -n "npm:         "
+echo -n "npm:          "
 if command -v npm &> /dev/null; then
     VERSION=$(npm --version)
     echo -e "${GREEN}✓ Found v$VERSION${NC}"
@@ -44,12 +49,12 @@ else
 fi
 
 # Check mmdc (optional)
-echo -n "mmdc:        "
+echo -n "mmdc:         "
 if command -v mmdc &> /dev/null; then
     echo -e "${GREEN}✓ Found (Mermaid validation will work)${NC}"
 else
     echo -e "${YELLOW}⚠ Not found (Mermaid validation will be skipped)${NC}"
-    echo "           Install with: npm install -g @mermaid-js/mermaid-cli"
+    echo "            Install with: npm install -g @mermaid-js/mermaid-cli"
 fi
 
 echo ""
@@ -62,7 +67,7 @@ else
     echo -e "${RED}✗ Some required dependencies are missing.${NC}"
     echo ""
     echo "Please install:"
-    echo "  - Python 3.8+: https://www.python.org/downloads/"
+    echo "  - Python 3.11+: https://www.python.org/downloads/"
     echo "  - Node.js 18+: https://nodejs.org/"
     exit 1
 fi
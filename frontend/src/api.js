@@ -1,5 +1,5 @@
 /**
- * API client for backend REST and (future) WebSocket endpoints.
+ * API client for backend REST and push (WebSocket / SSE) endpoints.
  * Uses axios for HTTP calls; configurable base URL via env.
  * TODO: Add request interceptor for auth tokens if auth is added.
  * TODO: Add retry logic for transient network failures.
@@ -9,33 +9,170 @@ import axios from 'axios';
 export const API_BASE =
   import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000';
 
-// TODO: Add WebSocket helper when backend WS is enabled.
-// Example: export function openJobWebSocket(jobId) { return new WebSocket(`ws://.../ws/jobs/${jobId}`); }
+const WS_BASE = API_BASE.replace(/^http/, 'ws');
+
+/**
+ * Fresh Idempotency-Key for one logical submission.
+ * crypto.randomUUID needs a secure context, so fall back outside one.
+ */
+export function newIdempotencyKey() {
+  return crypto.randomUUID?.() ?? `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
 
 /**
  * Create a new job by submitting C code.
+ * mode: 'auto' (local generator for simple functions), 'llm' or 'local'.
+ * The Idempotency-Key makes a resend safe (the server returns the original
+ * job), so network errors and 5xx responses are retried once.
  * Returns job summary with ID; job processes async in background.
  */
-export async function createJob(code) {
-  const res = await axios.post(`${API_BASE}/api/jobs`, { code });
-  return res.data;
+export async function createJob(code, mode = 'auto', idempotencyKey = newIdempotencyKey()) {
+  const send = () =>
+    axios.post(`${API_BASE}/api/jobs`, { code, mode }, { headers: { 'Idempotency-Key': idempotencyKey } });
+  try {
+    return (await send()).data;
+  } catch (err) {
+    if (err.response && err.response.status < 500) throw err;
+    return (await send()).data;
+  }
 }
 
 /**
- * Fetch list of all jobs (summary view).
- * NOTE: Returns full list; no pagination yet.
+ * Submit edited code as the next revision of a job; resolves to the new
+ * job's summary. Unchanged functions reuse the previous revision's results.
+ * mode defaults to the previous revision's. Retried like createJob.
  */
-export async function fetchJobs() {
-  const res = await axios.get(`${API_BASE}/api/jobs`);
+export async function reviseJob(id, code, mode, idempotencyKey = newIdempotencyKey()) {
+  const send = () =>
+    axios.post(
+      `${API_BASE}/api/jobs/${id}/revisions`,
+      { code, ...(mode ? { mode } : {}) },
+      { headers: { 'Idempotency-Key': idempotencyKey } },
+    );
+  try {
+    return (await send()).data;
+  } catch (err) {
+    if (err.response && err.response.status < 500) throw err;
+    return (await send()).data;
+  }
+}
+
+/**
+ * Cancel a queued or running job; resolves to its summary.
+ * Throws on 409 if the job already finished.
+ */
+export async function cancelJob(id) {
+  const res = await axios.delete(`${API_BASE}/api/jobs/${id}`);
   return res.data;
 }
 
+/**
+ * Fetch one page of jobs (summary view), newest first by default.
+ * params: { status, sort, order, limit, cursor, since }.
+ * Returns { jobs, nextCursor }; nextCursor is null on the last page.
+ */
+export async function fetchJobs(params = {}) {
+  const res = await axios.get(`${API_BASE}/api/jobs`, { params });
+  return { jobs: res.data, nextCursor: res.headers['x-next-cursor'] || null };
+}
+
 /**
  * Fetch detailed job information including code and flowcharts.
+ * fields: optional list of fields to return (e.g. omit 'code' when refreshing).
  * Throws if job ID not found (404).
  */
-export async function fetchJob(id) {
-  const res = await axios.get(`${API_BASE}/api/jobs/${id}`);
+export async function fetchJob(id, fields) {
+  const params = fields ? { fields: fields.join(',') } : {};
+  const res = await axios.get(`${API_BASE}/api/jobs/${id}`, { params });
+  return res.data;
+}
+
+/**
+ * URL of the server-rendered diagram for one function (svg or png).
+ * Served with ETag/Cache-Control, so repeat views come from the HTTP cache.
+ */
+export function functionDiagramUrl(jobId, name, format = 'svg') {
+  return `${API_BASE}/api/jobs/${jobId}/functions/${encodeURIComponent(name)}.${format}`;
+}
+
+/**
+ * Fetch the detail diagram behind a folded step of a function's summary:
+ * { id, title, mermaid }. The part may contain folded steps of its own.
+ */
+export async function fetchFunctionPart(jobId, name, partId) {
+  const res = await axios.get(
+    `${API_BASE}/api/jobs/${jobId}/functions/${encodeURIComponent(name)}/parts/${partId}`,
+  );
   return res.data;
 }
 
+/**
+ * URL of the server-rendered diagram for one part of a function's summary.
+ */
+export function functionPartUrl(jobId, name, partId, format = 'svg') {
+  return `${API_BASE}/api/jobs/${jobId}/functions/${encodeURIComponent(name)}/parts/${partId}.${format}`;
+}
+
+
+/**
+ * Subscribe to a push channel: WebSocket first, Server-Sent Events if the
+ * socket cannot be opened (e.g. a proxy strips Upgrade). Both deliver the
+ * same JSON events; job_gone is the last one. Returns an unsubscribe function.
+ */
+function subscribe(wsPath, ssePath, onEvent) {
+  let closed = false;
+  let source = null;
+  const socket = new WebSocket(`${WS_BASE}${wsPath}`);
+  let opened = false;
+
+  socket.onopen = () => {
+    opened = true;
+  };
+  socket.onmessage = (evt) => onEvent(JSON.parse(evt.data));
+  socket.onclose = () => {
+    if (closed || opened) return;
+    source = new EventSource(`${API_BASE}${ssePath}`);
+    source.onmessage = (evt) => {
+      const event = JSON.parse(evt.data);
+      if (event.type === 'job_gone') source.close(); // Don't reconnect to a 404.
+      onEvent(event);
+    };
+  };
+
+  return () => {
+    closed = true;
+    socket.close();
+    source?.close();
+  };
+}
+
+/**
+ * Live updates for one job: a job_snapshot, then job_update diffs, or
+ * job_gone if the job is removed (e.g. evicted by retention).
+ */
+export function subscribeJob(id, onEvent) {
+  return subscribe(`/ws/jobs/${id}`, `/api/jobs/${id}/events`, onEvent);
+}
+
+/**
+ * Live summaries for all jobs: job_summary events, or resync to refetch.
+ */
+export function subscribeJobs(onEvent) {
+  return subscribe('/ws/jobs', '/api/jobs/events', onEvent);
+}
+
+/**
+ * Apply a job_update diff to a job detail object.
+ * functionsAppended/functionsOffset splice new results in by position.
+ */
+export function applyJobChanges(job, changes) {
+  const { functionsAppended, functionsOffset, ...fields } = changes;
+  const next = { ...job, ...fields };
+  if (functionsAppended) {
+    next.functions = [
+      ...(job.functions || []).slice(0, functionsOffset),
+      ...functionsAppended,
+    ];
+  }
+  return next;
+}
@@ -3,7 +3,13 @@ import mermaid from 'mermaid';
 
 mermaid.initialize({ startOnLoad: false });
 
-export default function MermaidViewer({ chart }) {
+/**
+ * Renders a Mermaid chart. With `src` (server-rendered SVG URL) the SVG is
+ * fetched and inserted as-is; the in-browser renderer is only used for
+ * streaming partials or when the server cannot render (e.g. no mmdc).
+ * onFoldClick(id) is called when a folded step (class "folded") is clicked.
+ */
+export default function MermaidViewer({ chart, src, onFoldClick }) {
   const renderTarget = useRef(null);
   const chartId = useMemo(
     () => `mermaid-${Math.random().toString(36).slice(2, 9)}`,
@@ -16,7 +22,23 @@ export default function MermaidViewer({ chart }) {
 
   useEffect(() => {
     let cancelled = false;
+    async function renderServer() {
+      const res = await fetch(src);
+      if (!res.ok) throw new Error(`HTTP ${res.status}`);
+      return res.text();
+    }
     async function render() {
+      if (src) {
+        try {
+          const svg = await renderServer();
+          if (!cancelled && renderTarget.current) {
+            renderTarget.current.innerHTML = svg;
+          }
+          return;
+        } catch {
+          // Fall through to client-side rendering.
+        }
+      }
       try {
         const { svg } = await mermaid.render(chartId, safeChart);
         if (!cancelled && renderTarget.current) {
@@ -32,8 +54,14 @@ export default function MermaidViewer({ chart }) {
     return () => {
       cancelled = true;
     };
-  }, [safeChart, chartId]);
+  }, [safeChart, chartId, src]);
 
-  return <div className="mermaid-output" ref={renderTarget} />;
-}
+  // Node elements are "flowchart-<id>-<n>" in both mmdc and browser output.
+  const handleClick = (event) => {
+    const node = event.target.closest?.('g.node.folded');
+    const match = node?.id.match(/flowchart-(.+)-\d+$/);
+    if (match && onFoldClick) onFoldClick(match[1]);
+  };
 
+  return <div className="mermaid-output" ref={renderTarget} onClick={handleClick} />;
+}
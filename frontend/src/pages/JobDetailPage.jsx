@@ -1,27 +1,44 @@
-import { useEffect, useState } from 'react';
-import { useParams } from 'react-router-dom';
-import { fetchJob } from '../api.js';
+import { useEffect, useMemo, useState } from 'react';
+import { Link, useNavigate, useParams } from 'react-router-dom';
+import {
+  applyJobChanges, cancelJob, fetchFunctionPart, fetchJob, functionDiagramUrl, functionPartUrl, newIdempotencyKey,
+  reviseJob, subscribeJob,
+} from '../api.js';
 import MermaidViewer from '../components/MermaidViewer.jsx';
 
+// Everything but the source code, which never changes after submission.
+const REFRESH_FIELDS = [
+  'status', 'totalFunctions', 'processedFunctions', 'updatedAt', 'error', 'functions', 'partialFunctions',
+  'sourceTokens', 'reducedTokens',
+];
+
 /**
  * Job detail page showing status, original code, and generated flowcharts.
- * Uses HTTP polling (2s interval) for live updates while job is active.
- * TODO: Replace polling with WebSocket subscription for real-time pushes.
+ * Subscribes to push updates (WebSocket, SSE fallback) for live progress.
  * TODO: Add download button to export Mermaid/SVG diagrams.
  */
 export default function JobDetailPage() {
   const { jobId } = useParams();
   const [job, setJob] = useState(null);
   const [error, setError] = useState(null);
+  // Edited code while "Edit & resubmit" is open, else null.
+  const [draft, setDraft] = useState(null);
+  const revisionKey = useMemo(() => newIdempotencyKey(), [draft]);
+  const navigate = useNavigate();
 
   /**
    * Fetch latest job state from backend.
-   * Called on mount and by polling interval.
+   * Called on mount and by the Refresh button; a refresh keeps the code
+   * already loaded and fetches only REFRESH_FIELDS.
    */
   const load = async () => {
     try {
-      const data = await fetchJob(jobId);
-      setJob(data);
+      if (job?.id === jobId) {
+        const changes = await fetchJob(jobId, REFRESH_FIELDS);
+        setJob((prev) => ({ ...prev, ...changes }));
+      } else {
+        setJob(await fetchJob(jobId));
+      }
       setError(null);
     } catch (err) {
       setError(err.response?.data?.detail || err.message);
@@ -32,17 +49,43 @@ export default function JobDetailPage() {
     load();
   }, [jobId]);
 
-  // Auto-polling: refresh every 2 seconds while job is active.
-  // TODO: Replace with WebSocket push once backend WS is enabled.
+  /**
+   * Cancel the job; the new status arrives via push updates as well.
+   */
+  const cancel = async () => {
+    try {
+      const summary = await cancelJob(jobId);
+      setJob((prev) => (prev ? { ...prev, status: summary.status } : prev));
+    } catch (err) {
+      setError(err.response?.data?.detail || err.message);
+    }
+  };
+
+  /**
+   * Submit the edited code as a new revision and open it.
+   */
+  const resubmit = async () => {
+    try {
+      const revision = await reviseJob(jobId, draft, undefined, revisionKey);
+      setDraft(null);
+      navigate(`/jobs/${revision.id}`);
+    } catch (err) {
+      setError(err.response?.data?.detail || err.message);
+    }
+  };
+
+  // Push updates: the server sends a full snapshot, then only changed fields.
   useEffect(() => {
-    const activeStatuses = ['submitted', 'queued', 'processing', 'in_progress', 'generating_flowchart', 'validating'];
-    const isActive = activeStatuses.includes(job?.status);
-    
-    if (!isActive) return;
-    
-    const interval = setInterval(load, 2000);
-    return () => clearInterval(interval);
-  }, [job?.status, jobId]);
+    return subscribeJob(jobId, (event) => {
+      if (event.type === 'job_snapshot') {
+        setJob(event.job);
+      } else if (event.type === 'job_update') {
+        setJob((prev) => (prev ? applyJobChanges(prev, event.changes) : prev));
+      } else if (event.type === 'job_gone') {
+        setError(event.detail || 'Job no longer exists');
+      }
+    });
+  }, [jobId]);
 
   /**
    * Map job status to user-friendly display text with emoji.
@@ -59,6 +102,7 @@ export default function JobDetailPage() {
       'completed': { emoji: '✅', text: 'Completed', message: 'Job completed successfully' },
       'success': { emoji: '✅', text: 'Success', message: 'Job completed successfully' },
       'failed': { emoji: '❌', text: 'Failed', message: 'Job processing failed' },
+      'cancelled': { emoji: '🚫', text: 'Cancelled', message: 'Job was cancelled' },
     };
     return statusMap[status] || { emoji: '❓', text: status, message: 'Unknown status' };
   };
@@ -77,10 +121,19 @@ export default function JobDetailPage() {
               {job.totalFunctions > 0 && (
                 <> • {job.processedFunctions} / {job.totalFunctions}</>
               )}
+              {job.parentId && (
+                <> • Revision {job.revision} of <Link to={`/jobs/${job.parentId}`}>{job.parentId}</Link></>
+              )}
+              {job.sourceTokens > 0 && (
+                <> • Prompt code ~{job.reducedTokens} of {job.sourceTokens} tokens</>
+              )}
             </p>
           )}
         </div>
-        <button onClick={load}>Refresh</button>
+        <div>
+          {isActive && <button onClick={cancel}>Cancel</button>}
+          <button onClick={load}>Refresh</button>
+        </div>
       </div>
       {error && <div className="error">{error}</div>}
       {!job && !error && <p>Loading…</p>}
@@ -88,10 +141,16 @@ export default function JobDetailPage() {
       {isActive && (
         <p className="status-message">
           {getStatusDisplay(job?.status).emoji} {getStatusDisplay(job?.status).message}
-          <span className="polling-indicator"> • Auto-refreshing</span>
+          <span className="polling-indicator"> • Live</span>
         </p>
       )}
       
+      {job?.status === 'cancelled' && (
+        <div className="error">
+          {getStatusDisplay(job.status).emoji} {getStatusDisplay(job.status).message}
+        </div>
+      )}
+
       {job?.status === 'failed' && (
         <div className="error">
           ❌ Job failed: {job.error}
@@ -111,12 +170,42 @@ export default function JobDetailPage() {
       {job?.code && (
         <div className="code-section">
           <h2>Original C Code</h2>
-          <div className="code-block">
-            <pre><code>{job.code}</code></pre>
-          </div>
+          {draft === null ? (
+            <>
+              <div className="code-block">
+                <pre><code>{job.code}</code></pre>
+              </div>
+              <button onClick={() => setDraft(job.code)}>Edit &amp; resubmit</button>
+            </>
+          ) : (
+            <>
+              <textarea value={draft} onChange={(e) => setDraft(e.target.value)} rows={14} />
+              <p>Only functions you change are regenerated.</p>
+              <button onClick={resubmit} disabled={!draft.trim()}>Submit revision</button>
+              <button onClick={() => setDraft(null)}>Discard</button>
+            </>
+          )}
         </div>
       )}
 
+      {Object.entries(job?.partialFunctions || {}).map(([name, mermaid]) => (
+        <div key={`partial-${name}`} className="function-card">
+          <div className="function-header">
+            <h2>{name}</h2>
+            <span className="badge warn">Streaming…</span>
+          </div>
+          <div className="function-body">
+            <div className="code-block">
+              <div className="code-header">Mermaid syntax (partial)</div>
+              <textarea readOnly value={mermaid} />
+            </div>
+            <div className="diagram">
+              <MermaidViewer chart={mermaid} />
+            </div>
+          </div>
+        </div>
+      ))}
+
       {job?.functions?.map((fn) => (
         <div key={fn.name} className="function-card">
           <div className="function-header">
@@ -124,15 +213,14 @@ export default function JobDetailPage() {
             <span className={fn.validated ? 'badge success' : 'badge warn'}>
               {fn.validated ? 'Validated' : 'Unvalidated'}
             </span>
+            {fn.reused && <span className="badge">Unchanged</span>}
           </div>
           <div className="function-body">
             <div className="code-block">
               <div className="code-header">Mermaid syntax</div>
               <textarea readOnly value={fn.mermaid} />
             </div>
-            <div className="diagram">
-              <MermaidViewer chart={fn.mermaid} />
-            </div>
+            <FunctionDiagram jobId={jobId} fn={fn} />
           </div>
         </div>
       ))}
@@ -140,3 +228,62 @@ export default function JobDetailPage() {
   );
 }
 
+
+/**
+ * Diagram of one function. Large functions show their summary; clicking a
+ * folded step fetches its detail diagram, with a trail back to the summary.
+ */
+function FunctionDiagram({ jobId, fn }) {
+  // Opened parts, outermost first.
+  const [trail, setTrail] = useState([]);
+  const [error, setError] = useState(null);
+
+  useEffect(() => {
+    setTrail([]);
+  }, [fn.summary]);
+
+  const openPart = async (partId) => {
+    try {
+      const part = await fetchFunctionPart(jobId, fn.name, partId);
+      setTrail((prev) => [...prev, part]);
+      setError(null);
+    } catch (err) {
+      setError(err.response?.data?.detail || err.message);
+    }
+  };
+
+  if (!fn.summary) {
+    return (
+      <div className="diagram">
+        <MermaidViewer
+          chart={fn.mermaid}
+          src={fn.validated ? functionDiagramUrl(jobId, fn.name) : undefined}
+        />
+      </div>
+    );
+  }
+
+  const part = trail[trail.length - 1];
+  return (
+    <div className="diagram">
+      <p>
+        <button onClick={() => setTrail([])} disabled={!part}>Summary</button>
+        {trail.map((step, index) => (
+          <span key={step.id}>
+            {' › '}
+            <button onClick={() => setTrail(trail.slice(0, index + 1))} disabled={index === trail.length - 1}>
+              {step.title}
+            </button>
+          </span>
+        ))}
+      </p>
+      <p>Large function: click a folded step to expand it.</p>
+      {error && <div className="error">{error}</div>}
+      <MermaidViewer
+        chart={part ? part.mermaid : fn.summary}
+        src={part ? functionPartUrl(jobId, fn.name, part.id) : functionDiagramUrl(jobId, fn.name)}
+        onFoldClick={openPart}
+      />
+    </div>
+  );
+}
@@ -1,27 +1,28 @@
 import { useEffect, useState } from 'react';
 import { Link } from 'react-router-dom';
-import { fetchJobs } from '../api.js';
+import { fetchJobs, subscribeJobs } from '../api.js';
 
 /**
  * Job list page showing all jobs with basic status/progress.
- * Auto-refreshes every 4 seconds to show updated statuses.
- * TODO: Add filtering by status (active/completed/failed).
- * TODO: Add pagination if job count grows large.
- * TODO: Replace polling with WebSocket subscription for live list updates.
+ * Loads the newest page once, then applies pushed job_summary events.
+ * Older pages are fetched on demand via the server cursor.
  */
 export default function JobsPage() {
   const [jobs, setJobs] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [status, setStatus] = useState('');
   const [error, setError] = useState(null);
   const [loading, setLoading] = useState(true);
 
   /**
-   * Fetch all jobs from backend.
-   * Called on mount and by polling interval (4s).
+   * Fetch the newest page of jobs for the current status filter.
+   * Called on mount, on Refresh, and when the server asks for a resync.
    */
   const load = async () => {
     try {
-      const data = await fetchJobs();
-      setJobs(data);
+      const page = await fetchJobs(status ? { status } : {});
+      setJobs(page.jobs);
+      setNextCursor(page.nextCursor);
       setError(null);
     } catch (err) {
       setError(err.message);
@@ -30,18 +31,55 @@ export default function JobsPage() {
     }
   };
 
+  /**
+   * Append the next (older) page using the cursor from the last response.
+   */
+  const loadMore = async () => {
+    try {
+      const page = await fetchJobs({ ...(status ? { status } : {}), cursor: nextCursor });
+      setJobs((prev) => [...prev, ...page.jobs]);
+      setNextCursor(page.nextCursor);
+    } catch (err) {
+      setError(err.message);
+    }
+  };
+
   useEffect(() => {
     load();
-    // TODO: Use WebSocket or server-sent events for push updates; polling keeps it simple for now.
-    const interval = setInterval(load, 4000);
-    return () => clearInterval(interval);
-  }, []);
+    return subscribeJobs((event) => {
+      if (event.type === 'resync') {
+        load();
+      } else if (event.type === 'job_summary') {
+        setJobs((prev) => {
+          const index = prev.findIndex((job) => job.id === event.job.id);
+          const matches = !status || event.job.status === status;
+          if (index === -1) return matches ? [event.job, ...prev] : prev;
+          const next = prev.slice();
+          if (matches) next[index] = event.job;
+          else next.splice(index, 1);
+          return next;
+        });
+      }
+    });
+  }, [status]);
 
   return (
     <section className="card">
       <div className="card-header">
         <h1>Jobs</h1>
-        <button onClick={load}>Refresh</button>
+        <div>
+          <select value={status} onChange={(e) => setStatus(e.target.value)}>
+            <option value="">All statuses</option>
+            <option value="submitted">Submitted</option>
+            <option value="processing">Processing</option>
+            <option value="generating_flowchart">Generating</option>
+            <option value="validating">Validating</option>
+            <option value="completed">Completed</option>
+            <option value="failed">Failed</option>
+            <option value="cancelled">Cancelled</option>
+          </select>
+          <button onClick={load}>Refresh</button>
+        </div>
       </div>
       {loading && <p>Loading…</p>}
       {error && <div className="error">{error}</div>}
@@ -64,6 +102,11 @@ export default function JobsPage() {
         ))}
         {!loading && jobs.length === 0 && <p>No jobs yet.</p>}
       </ul>
+      {nextCursor && (
+        <button className="ghost-btn" onClick={loadMore}>
+          Load more
+        </button>
+      )}
     </section>
   );
 }
@@ -1,6 +1,6 @@
-import { useState } from 'react';
+import { useMemo, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { createJob } from '../api.js';
+import { createJob, newIdempotencyKey } from '../api.js';
 
 /**
  * Job submission page for pasting or uploading C code.
@@ -10,9 +10,12 @@ import { createJob } from '../api.js';
  */
 export default function SubmitPage() {
   const [code, setCode] = useState('');
+  const [mode, setMode] = useState('auto');
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
   const navigate = useNavigate();
+  // One key per code/mode, so a double submit or retry maps to the same job.
+  const idempotencyKey = useMemo(() => newIdempotencyKey(), [code, mode]);
 
   /**
    * Read uploaded .c file into textarea.
@@ -39,7 +42,7 @@ export default function SubmitPage() {
     }
     setLoading(true);
     try {
-      const job = await createJob(code);
+      const job = await createJob(code, mode, idempotencyKey);
       navigate(`/jobs/${job.id}`);
     } catch (err) {
       setError(err.response?.data?.detail || err.message);
@@ -66,6 +69,14 @@ export default function SubmitPage() {
           Or upload file
           <input type="file" accept=".c" onChange={handleFile} />
         </label>
+        <label className="label">
+          Generator
+          <select value={mode} onChange={(e) => setMode(e.target.value)}>
+            <option value="auto">Auto (local for simple functions)</option>
+            <option value="llm">LLM</option>
+            <option value="local">Local only (instant)</option>
+          </select>
+        </label>
         {error && <div className="error">{error}</div>}
         <button type="submit" disabled={loading}>
           {loading ? 'Submitting…' : 'Analyze code'}
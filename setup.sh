@@ -17,7 +17,11 @@ NC='\033[0m' # No Color
 # Check if Python 3 is installed
 echo -e "${BLUE}Checking Python installation...${NC}"
 if ! command -v python3 &> /dev/null; then
-    echo -e "${YELLOW}Python 3 is not installed. Please install Python 3.8 or higher.${NC}"
+    echo -e "${YELLOW}Python 3 is not installed. Please install Python 3.11 or higher.${NC}"
+    exit 1
+fi
+if ! python3 -c 'import sys; sys.exit(sys.version_info < (3, 11))'; then
+    echo -e "${YELLOW}$(python3 --version) is too old. Please install Python 3.11 or higher.${NC}"
     exit 1
 fi
 echo -e "${GREEN}✓ Python 3 found: $(python3 --version)${NC}"